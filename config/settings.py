@@ -64,6 +64,7 @@ INSTALLED_APPS = [
     "taggit",
     "rosetta",
     "django_celery_beat",
+    "mptt",
     # my apps
     "users",
     "store",
@@ -192,6 +193,9 @@ LOGIN_REDIRECT_URL = reverse_lazy("store:home_page")
 # Redis and Celery
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://redis:6379/0")
 CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", "redis://redis:6379/0")
+REDIS_URL = os.getenv(
+    "REDIS_URL", os.getenv("CELERY_RESULT_BACKEND", "redis://redis:6379/1")
+)
 
 CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
@@ -200,8 +204,44 @@ CELERY_TIMEZONE = TIME_ZONE
 
 # Celery Beat Schedule
 CELERY_BEAT_SCHEDULE = {
-    "delete-old-user-history-every-day": {
-        "task": "users.tasks.delete_old_user_history",
+    "apply-retention-policies-every-hour": {
+        "task": "store.tasks.apply_retention_policies",
+        "schedule": 3600.0,
+    },
+    "flush-user-history": {
+        "task": "users.tasks.flush_user_history",
+        "schedule": 30.0,
+    },
+    "drain-search-log-buffer": {
+        "task": "store.tasks.drain_search_log_buffer",
+        "schedule": 10.0,
+    },
+    "refresh-search-rankings": {
+        "task": "store.tasks.refresh_search_rankings",
+        "schedule": 300.0,
+    },
+    "release-expired-stock-reservations": {
+        "task": "store.tasks.release_expired_stock_reservations",
+        "schedule": 60.0,
+    },
+    "reconcile-product-ratings-every-day": {
+        "task": "store.tasks.reconcile_product_ratings",
+        "schedule": 86400.0,
+    },
+    "update-queued-related-products": {
+        "task": "store.tasks.update_queued_related_products",
+        "schedule": 300.0,
+    },
+    "rebuild-related-products-every-day": {
+        "task": "store.tasks.rebuild_related_products",
+        "schedule": 86400.0,
+    },
+    "update-changed-product-recommendations": {
+        "task": "store.tasks.update_changed_product_recommendations",
+        "schedule": 900.0,
+    },
+    "rebuild-product-recommendations-every-day": {
+        "task": "store.tasks.rebuild_product_recommendations",
         "schedule": 86400.0,
     },
 }
@@ -210,10 +250,19 @@ CELERY_BEAT_SCHEDULE = {
 CACHES = {
     "default": {
         "BACKEND": "django.core.cache.backends.redis.RedisCache",
-        "LOCATION": os.getenv("CELERY_RESULT_BACKEND", "redis://redis:6379/1"),
+        "LOCATION": REDIS_URL,
     }
 }
 
+# Stock reservations
+# Seconds a cart keeps its reserved stock after the line was last touched.
+STOCK_RESERVATION_TTL = int(os.getenv("STOCK_RESERVATION_TTL", 20 * 60))
+
+# Conditional GET
+# Seconds a shared proxy may serve an anonymous catalog page before
+# revalidating it.
+CATALOG_PROXY_MAX_AGE = int(os.getenv("CATALOG_PROXY_MAX_AGE", 60))
+
 
 CKEDITOR_UPLOAD_PATH = "uploads/"
 CKEDITOR_FILENAME_GENERATOR = "store.utils.get_filename"
@@ -250,3 +299,37 @@ JALALI_DATE_DEFAULTS = {
         },
     },
 }
+
+# Retention
+# Rows of append-heavy tables older than ``days`` are purged by the hourly
+# retention task, ``chunk_size`` primary keys per statement, for at most
+# ``time_budget`` seconds per table and run. The timestamp ``field`` must be
+# indexed. ``files`` are deleted with their rows, or alone with ``keep_rows``.
+# ``append_only`` tables, whose rows are never updated, are cut into primary
+# key ranges rather than read in timestamp order.
+RETENTION_CHUNK_SIZE = int(os.getenv("RETENTION_CHUNK_SIZE", 5000))
+RETENTION_TIME_BUDGET = int(os.getenv("RETENTION_TIME_BUDGET", 60))
+RETENTION_POLICIES = {
+    "users.UserHistory": {
+        "field": "datetime_visited",
+        "days": int(os.getenv("USER_HISTORY_RETENTION_DAYS", 30)),
+    },
+    "store.SearchLog": {
+        "field": "datetime_created",
+        "days": int(os.getenv("SEARCH_LOG_RETENTION_DAYS", 180)),
+        "append_only": True,
+    },
+    "store.ContactMessage": {
+        "field": "created_at",
+        "days": int(os.getenv("CONTACT_ATTACHMENT_RETENTION_DAYS", 365)),
+        "files": ["attachment"],
+        "keep_rows": True,
+        "append_only": True,
+    },
+    # Deleting a cart cascades to its items and their signals.
+    "store.Cart": {
+        "field": "datetime_updated",
+        "days": int(os.getenv("CART_RETENTION_DAYS", 90)),
+        "chunk_size": 500,
+    },
+}
@@ -0,0 +1,38 @@
+$(document).on("click", ".load-more-products", function (e) {
+  e.preventDefault();
+  const button = $(this);
+  const target = $(button.data("target"));
+
+  button.prop("disabled", true);
+
+  $.ajax({
+    url: button.data("url"),
+    method: "GET",
+    data: { cursor: button.attr("data-cursor") },
+    success: function (res) {
+      if (!res.success) {
+        button.prop("disabled", false);
+        return;
+      }
+
+      const items = $(res.html);
+      target.append(items);
+      items.find('[data-bs-toggle="tooltip"]').tooltip();
+      if (typeof convertToPersianNumbers === "function") {
+        items.each(function () {
+          convertToPersianNumbers(this);
+        });
+      }
+
+      if (res.has_next) {
+        button.attr("data-cursor", res.next_cursor);
+        button.prop("disabled", false);
+      } else {
+        button.closest("div").remove();
+      }
+    },
+    error: function () {
+      button.prop("disabled", false);
+    },
+  });
+});
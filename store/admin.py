@@ -1,7 +1,11 @@
 from django.contrib import admin
+from django.db.models import F
+from django.db.models.functions import Greatest
 from django.utils.translation import gettext_lazy as _
 from jalali_date.admin import ModelAdminJalaliMixin, TabularInlineJalaliMixin
+from mptt.admin import MPTTModelAdmin
 
+from .homepage import invalidate_homepage_cards
 from .models import (
     Address,
     Answer,
@@ -22,8 +26,10 @@ from .models import (
     ProductImages,
     Question,
     QuestionsOfSites,
+    StockReservation,
     Wishlist,
 )
+from .ratings import recompute_product_ratings
 
 
 @admin.register(QuestionsOfSites)
@@ -50,7 +56,7 @@ class BrandAdmin(ModelAdminJalaliMixin, admin.ModelAdmin):
 
 
 @admin.register(Category)
-class CategoryAdmin(ModelAdminJalaliMixin, admin.ModelAdmin):
+class CategoryAdmin(ModelAdminJalaliMixin, MPTTModelAdmin):
     list_display = ("title", "cover_img", "is_parent", "datetime_created")
     list_filter = ("datetime_created",)
     search_fields = ("title", "slug")
@@ -87,6 +93,27 @@ class ProductAdmin(ModelAdminJalaliMixin, admin.ModelAdmin):
     inlines = [ProductImagesInline, ProductAttributeInline]
     filter_horizontal = ("categories",)
 
+    def save_model(self, request, obj, form, change):
+        """
+        Apply stock edits as a delta with an ``F()`` expression, so units
+        reserved or sold while the form was open are not written back.
+        """
+
+        if not change or "stock" not in form.changed_data:
+            super().save_model(request, obj, form, change)
+            return
+
+        delta = obj.stock - form.initial["stock"]
+        obj.save(
+            update_fields=[
+                field.name
+                for field in obj._meta.concrete_fields
+                if not field.primary_key and field.name != "stock"
+            ]
+        )
+        Product.objects.filter(pk=obj.pk).update(stock=Greatest(F("stock") + delta, 0))
+        obj.refresh_from_db(fields=["stock"])
+
 
 @admin.register(ProductImages)
 class ProductImagesAdmin(ModelAdminJalaliMixin, admin.ModelAdmin):
@@ -115,7 +142,12 @@ class CommentAdmin(ModelAdminJalaliMixin, admin.ModelAdmin):
     list_filter = ("is_approved", "datetime_created")
     search_fields = ("title", "text", "product__title", "user__username")
     actions = ["approve_comments"]
-    readonly_fields = ("datetime_created", "datetime_updated")
+    readonly_fields = (
+        "num_likes",
+        "num_dislikes",
+        "datetime_created",
+        "datetime_updated",
+    )
     fieldsets = (
         (None, {"fields": ("product", "user", "title", "text", "is_approved")}),
         (
@@ -137,7 +169,7 @@ class CommentAdmin(ModelAdminJalaliMixin, admin.ModelAdmin):
         ),
         (
             _("Likes and Dislikes"),
-            {"fields": ("likes", "dislikes")},
+            {"fields": ("num_likes", "num_dislikes")},
         ),
         (
             _("Timestamps"),
@@ -148,7 +180,11 @@ class CommentAdmin(ModelAdminJalaliMixin, admin.ModelAdmin):
     )
 
     def approve_comments(self, request, queryset):
+        product_ids = set(queryset.values_list("product_id", flat=True))
         queryset.update(is_approved=True)
+        # Bulk updates skip the signals that maintain product ratings.
+        recompute_product_ratings(product_ids)
+        invalidate_homepage_cards()
 
     approve_comments.short_description = _("Approve selected comments")
 
@@ -207,6 +243,13 @@ class CartItemAdmin(ModelAdminJalaliMixin, admin.ModelAdmin):
     search_fields = ("product__title", "cart__customer__full_name")
 
 
+@admin.register(StockReservation)
+class StockReservationAdmin(ModelAdminJalaliMixin, admin.ModelAdmin):
+    list_display = ("product", "holder", "quantity", "expires_at")
+    list_filter = ("expires_at",)
+    search_fields = ("product__title", "holder")
+
+
 class OrderItemInline(TabularInlineJalaliMixin, admin.TabularInline):
     model = OrderItem
     extra = 1
@@ -285,12 +328,17 @@ class AnswerAdmin(ModelAdminJalaliMixin, admin.ModelAdmin):
     list_filter = ("is_approved", "datetime_created")
     search_fields = ("text", "question__text", "user__last_name)")
     actions = ["approve_answers"]
-    readonly_fields = ("datetime_created", "datetime_updated")
+    readonly_fields = (
+        "num_likes",
+        "num_dislikes",
+        "datetime_created",
+        "datetime_updated",
+    )
     fieldsets = (
         (None, {"fields": ("question", "user", "text", "is_approved")}),
         (
             _("Likes and Dislikes"),
-            {"fields": ("likes", "dislikes")},
+            {"fields": ("num_likes", "num_dislikes")},
         ),
         (
             _("Timestamps"),
@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.core import checks
 from django.utils.translation import gettext_lazy as _
 
 
@@ -9,3 +10,6 @@ class StoreConfig(AppConfig):
 
     def ready(self):
         import store.signals
+        from store.retention import check_retention_indexes
+
+        checks.register(check_retention_indexes)
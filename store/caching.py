@@ -0,0 +1,307 @@
+"""
+Stampede-safe caching helpers.
+
+:func:`get_or_compute` replaces the get, compute, set pattern. Values are
+stored in a :class:`CacheEntry` together with how long they took to
+compute, their soft expiry and the version they were built from, which
+allows:
+
+- probabilistic early expiration: a request may recompute a value shortly
+  before it expires, more likely the closer the expiry and the slower the
+  computation, so hot keys are refreshed before they ever go missing;
+- stale-while-revalidate: an expired or outdated entry stays readable for
+  ``stale_timeout`` seconds and is served while one worker recomputes it;
+- a distributed lock in Redis so only one worker computes a value at a
+  time, while the others serve the stale entry or briefly wait for the
+  new one;
+- hit, miss, stale and early refresh counters per key family, kept per
+  process and flushed to a Redis hash in batches.
+"""
+
+import logging
+import math
+import random
+import time
+import uuid
+from collections import Counter
+from typing import Any, NamedTuple
+
+from django.core.cache import cache
+from redis.exceptions import RedisError
+
+from .utils import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+CACHE_LOCK_KEY = "cache_lock:{key}"
+CACHE_LOCK_TIMEOUT = 30
+CACHE_LOCK_WAIT = 2
+CACHE_LOCK_POLL_INTERVAL = 0.05
+CACHE_STALE_TIMEOUT = 300
+CACHE_EARLY_EXPIRATION_BETA = 1.0
+CACHE_METRICS_KEY = "cache_metrics"
+CACHE_METRICS_FLUSH_INTERVAL = 10
+
+# Compare-and-delete, so a worker never releases a lock taken over by
+# another one after its own expired.
+_RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+# Per-process metric counters and when they were last flushed to Redis.
+_metrics = Counter()
+_metrics_flushed_at = time.monotonic()
+
+
+class CacheEntry(NamedTuple):
+    value: Any
+    version: Any = None
+    delta: float = 0.0
+    expires_at: float = None
+
+
+def _metric_name(key):
+    return key.split(":", 1)[0]
+
+
+def record_metric(name, outcome):
+    """
+    Count a cache outcome for ``name``, flushing counters every
+    ``CACHE_METRICS_FLUSH_INTERVAL`` seconds.
+    """
+
+    global _metrics_flushed_at
+
+    _metrics[f"{name}:{outcome}"] += 1
+    now = time.monotonic()
+    if now - _metrics_flushed_at < CACHE_METRICS_FLUSH_INTERVAL:
+        return
+
+    _metrics_flushed_at = now
+    counts = dict(_metrics)
+    _metrics.clear()
+    try:
+        pipeline = get_redis_client().pipeline(transaction=False)
+        for field, count in counts.items():
+            pipeline.hincrby(CACHE_METRICS_KEY, field, count)
+        pipeline.execute()
+    except RedisError:
+        logger.warning("Cache metrics unavailable.")
+
+
+def get_metrics():
+    """
+    Return the flushed counters as ``{name: {outcome: count}}``.
+    """
+
+    metrics = {}
+    try:
+        raw = get_redis_client().hgetall(CACHE_METRICS_KEY)
+    except RedisError:
+        logger.warning("Cache metrics unavailable.")
+        return metrics
+    for field, count in raw.items():
+        name, outcome = field.decode().rsplit(":", 1)
+        metrics.setdefault(name, {})[outcome] = int(count)
+    return metrics
+
+
+def acquire_lock(key, timeout=CACHE_LOCK_TIMEOUT):
+    """
+    Take the recompute lock of ``key``.
+
+    Returns:
+        str or None: The lock token, ``None`` if another worker holds it.
+        Without Redis every caller gets a token, trading stampede
+        protection for availability.
+    """
+
+    token = uuid.uuid4().hex
+    try:
+        acquired = get_redis_client().set(
+            CACHE_LOCK_KEY.format(key=key), token, nx=True, ex=timeout
+        )
+    except RedisError:
+        logger.warning("Cache lock unavailable for %s.", key)
+        return token
+    return token if acquired else None
+
+
+def release_lock(key, token=None):
+    """
+    Release the recompute lock of ``key`` if it is still held by ``token``.
+
+    Without a token the lock is released unconditionally, which is how
+    background refreshes started by :func:`get_or_compute` finish.
+    """
+
+    lock_key = CACHE_LOCK_KEY.format(key=key)
+    try:
+        if token is None:
+            get_redis_client().delete(lock_key)
+        else:
+            get_redis_client().eval(_RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+    except RedisError:
+        logger.warning("Cache lock unavailable for %s.", key)
+
+
+def get_cached(key):
+    """
+    Return the value stored by :func:`set_cached` under ``key``, even if
+    stale, or ``None``.
+    """
+
+    entry = cache.get(key)
+    return entry.value if isinstance(entry, CacheEntry) else None
+
+
+def set_cached(
+    key, value, timeout=None, version=None, delta=0.0, stale_timeout=CACHE_STALE_TIMEOUT
+):
+    """
+    Store ``value`` as a :class:`CacheEntry`.
+
+    The entry is fresh for ``timeout`` seconds (forever if ``None``) and
+    kept ``stale_timeout`` more seconds to be served while it is refreshed.
+    """
+
+    expires_at = None if timeout is None else time.time() + timeout
+    cache.set(
+        key,
+        CacheEntry(value, version, delta, expires_at),
+        timeout=None if timeout is None else timeout + stale_timeout,
+    )
+
+
+def _is_fresh(entry, version, beta):
+    if entry.version != version:
+        return False
+    if entry.expires_at is None:
+        return True
+    # XFetch: -log(random()) is exponentially distributed, so the chance of
+    # an early refresh grows as the expiry approaches.
+    early = entry.delta * beta * -math.log(1.0 - random.random())
+    return time.time() + early < entry.expires_at
+
+
+def _compute(key, compute, timeout, version, stale_timeout):
+    start = time.monotonic()
+    value = compute()
+    set_cached(
+        key,
+        value,
+        timeout=timeout,
+        version=version,
+        delta=time.monotonic() - start,
+        stale_timeout=stale_timeout,
+    )
+    return value
+
+
+def _wait_for_entry(key, version):
+    deadline = time.monotonic() + CACHE_LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(CACHE_LOCK_POLL_INTERVAL)
+        entry = cache.get(key)
+        if isinstance(entry, CacheEntry) and entry.version == version:
+            return entry
+    return None
+
+
+def get_or_compute(
+    key,
+    compute,
+    timeout=None,
+    version=None,
+    stale_timeout=CACHE_STALE_TIMEOUT,
+    beta=CACHE_EARLY_EXPIRATION_BETA,
+    refresh=None,
+    metric=None,
+):
+    """
+    Return the cached value of ``key``, computing it at most once at a time.
+
+    Args:
+        key (str): The cache key.
+        compute (Callable[[], Any]): Builds the value on a miss.
+        timeout (int or None): Seconds the value stays fresh.
+        version (Any): Entries stored with another version are stale, so
+            bumping a shared version key invalidates without a cold miss.
+        stale_timeout (int): Seconds a stale entry may still be served.
+        beta (float): Eagerness of early refreshes, 0 disables them.
+        refresh (Callable[[], None] or None): Called instead of ``compute``
+            to refresh a stale entry in the background, e.g. a task's
+            ``delay``. It must store the value with :func:`set_cached` and
+            release the lock with :func:`release_lock` or let it expire.
+            If it raises, the stale value is served and the lock released.
+        metric (str or None): Metric name, the key prefix by default.
+
+    Returns:
+        Any: The cached or freshly computed value.
+    """
+
+    metric = metric or _metric_name(key)
+    entry = cache.get(key)
+    if not isinstance(entry, CacheEntry):
+        entry = None
+
+    if entry is not None:
+        if _is_fresh(entry, version, beta):
+            record_metric(metric, "hit")
+            return entry.value
+
+        token = acquire_lock(key)
+        if token is None:
+            record_metric(metric, "stale")
+            return entry.value
+
+        expired = entry.expires_at is not None and time.time() >= entry.expires_at
+        record_metric(
+            metric, "refresh" if expired or entry.version != version else "early"
+        )
+        if refresh is not None:
+            try:
+                refresh()
+            except Exception:
+                # The broker is down: free the lock so a later request
+                # retries, and keep serving the stale value meanwhile.
+                logger.warning("Could not start the refresh of %s.", key, exc_info=True)
+                release_lock(key, token)
+            return entry.value
+        try:
+            return _compute(key, compute, timeout, version, stale_timeout)
+        finally:
+            release_lock(key, token)
+
+    record_metric(metric, "miss")
+    token = acquire_lock(key)
+    if token is not None:
+        try:
+            return _compute(key, compute, timeout, version, stale_timeout)
+        finally:
+            release_lock(key, token)
+
+    entry = _wait_for_entry(key, version)
+    if entry is not None:
+        return entry.value
+    return compute()
+
+
+def get_version(key):
+    """
+    Return the shared version stored under ``key``, creating it if missing.
+    """
+
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    cache.set(key, uuid.uuid4().hex, timeout=None)
@@ -1,4 +1,32 @@
-from .models import Product
+from .models import CartSummary
+from .product_snapshots import get_product_snapshots
+from .utils import get_unit_price
+
+
+def cart_line(snapshot, quantity):
+    """
+    Build a cart line from a product snapshot, shared by session carts and
+    the cached cart summaries of customers.
+
+    Returns:
+        dict: A dictionary containing:
+            - product (dict): The product snapshot.
+            - quantity (int): Quantity in cart.
+            - unit_price : Price per unit (discount or regular).
+            - total_price : unit_price × quantity.
+            - total_old_price : product price × quantity.
+            - total_discount : Total discount for that item.
+    """
+
+    unit_price = get_unit_price(snapshot["price"], snapshot["discount_price"])
+    return {
+        "product": snapshot,
+        "quantity": quantity,
+        "unit_price": unit_price,
+        "total_price": unit_price * quantity,
+        "total_old_price": snapshot["price"] * quantity,
+        "total_discount": (snapshot["price"] - unit_price) * quantity,
+    }
 
 
 class Cart:
@@ -20,12 +48,9 @@ class Cart:
 
         self.request = request
         self.session = request.session
-        cart = self.session.get("cart")
-
-        if not cart:
-            cart = self.session["cart"] = {}
-
-        self.cart = cart
+        # An empty cart is only stored once a product is added, so browsing
+        # without shopping does not create a session.
+        self.cart = self.session.get("cart") or {}
 
     def add(self, product_id, quantity=1, override_quantity=False):
         """
@@ -83,14 +108,16 @@ class Cart:
         Remove all items from the cart.
         """
 
-        self.session["cart"] = {}
+        self.cart = {}
         self.save()
 
     def save(self):
         """
-        Mark the session as modified to make sure it's saved.
+        Store the cart in the session and mark it as modified to make sure
+        it's saved.
         """
 
+        self.session["cart"] = self.cart
         self.session.modified = True
 
     def __len__(self):
@@ -102,49 +129,56 @@ class Cart:
         """
         return sum(item["quantity"] for item in self.cart.values())
 
+    def get_product_snapshots(self):
+        """
+        Return snapshots of the products in the cart keyed by product id.
+
+        The map is memoized on the request, so every cart built while
+        handling it shares one lookup, and is backed by the shared product
+        snapshot cache. Products added later in the request are fetched on
+        demand.
+
+        Returns:
+            dict: Product snapshot dicts keyed by integer product id.
+        """
+
+        snapshots = getattr(self.request, "_cart_product_snapshots", None)
+        if snapshots is None:
+            snapshots = self.request._cart_product_snapshots = {}
+
+        missing_ids = [
+            product_id for product_id in self.cart if int(product_id) not in snapshots
+        ]
+        if missing_ids:
+            snapshots.update(get_product_snapshots(missing_ids))
+        return snapshots
+
     def __iter__(self):
         """
-        Iterate over the items in the cart and get the products from the database.
+        Iterate over the items in the cart with their product snapshots.
 
         Yields:
-            dict: A dictionary containing:
-                - product (Product): The product instance.
-                - quantity (int): Quantity in cart.
-                - unit_price : Price per unit (discount or regular).
-                - total_price : unit_price × quantity.
-                - total_old_price : product.price × quantity.
-                - total_discount : Total discount for that item.
+            dict: A line built with :func:`cart_line`.
         """
 
-        product_ids = self.cart.keys()
-        products = Product.objects.filter(id__in=product_ids)
-        product_map = {str(product.id): product for product in products}
+        snapshots = self.get_product_snapshots()
 
         cart_copy = self.cart.copy()
 
         for product_id, item in cart_copy.items():
-            product = product_map.get(product_id)
+            product = snapshots.get(int(product_id))
             if not product:
                 self.remove(product_id)
                 continue
 
-            quantity = item["quantity"]
-            unit_price = (
-                product.discount_price if product.discount_price else product.price
-            )
-
-            yield {
-                "product": product,
-                "quantity": quantity,
-                "unit_price": unit_price,
-                "total_price": unit_price * quantity,
-                "total_old_price": product.price * quantity,
-                "total_discount": (
-                    (product.price - unit_price) * quantity
-                    if product.discount_price
-                    else 0
-                ),
-            }
+            yield cart_line(product, item["quantity"])
+
+    def summary(self):
+        """
+        Return the cart totals as an immutable :class:`CartSummary`.
+        """
+
+        return CartSummary.from_lines(self)
 
     def get_total_price(self):
         """
@@ -154,7 +188,7 @@ class Cart:
             int: Total discounted price.
         """
 
-        return sum(item["total_price"] for item in self)
+        return self.summary().total_price
 
     def get_total_old_price(self):
         """
@@ -164,7 +198,7 @@ class Cart:
             int: Total original price.
         """
 
-        return sum(item["total_old_price"] for item in self)
+        return self.summary().total_old_price
 
     def get_total_discount(self):
         """
@@ -174,4 +208,4 @@ class Cart:
             int: Total amount saved due to discounts.
         """
 
-        return sum(item["total_discount"] for item in self)
+        return self.summary().total_discount_price
@@ -0,0 +1,127 @@
+from typing import NamedTuple
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .caching import get_or_compute
+from .cart import Cart as SessionCart
+from .cart import cart_line
+from .models import CartItem, CartSummary, FavoriteList
+from .product_snapshots import get_product_snapshots, invalidate_product_snapshots
+
+CART_SUMMARY_CACHE_KEY = "cart_contents:{customer_id}"
+FAVORITE_IDS_CACHE_KEY = "favorite_ids:{customer_id}"
+CART_SUMMARY_TIMEOUT = 24 * 3600
+
+
+class CartContents(NamedTuple):
+    """
+    The lines of a cart with their totals, as rendered by the header and the
+    cart page.
+    """
+
+    items: tuple = ()
+    quantities: dict = {}
+    summary: CartSummary = CartSummary()
+
+
+def summarize_cart_lines(lines):
+    """
+    Build the cart contents rendered by the header and the cart page.
+
+    Args:
+        lines (Iterable[dict]): Lines built with :func:`store.cart.cart_line`.
+
+    Returns:
+        CartContents: Lines, a product id to quantity map and the totals.
+    """
+
+    lines = tuple(lines)
+    return CartContents(
+        items=lines,
+        quantities={line["product"]["id"]: line["quantity"] for line in lines},
+        summary=CartSummary.from_lines(lines),
+    )
+
+
+EMPTY_CART_SUMMARY = summarize_cart_lines([])
+
+
+def get_cart_summary(customer):
+    """
+    Return the cached :class:`CartContents` of a customer's cart, building
+    it on a miss.
+
+    A customer has a single cart, so entries are keyed by customer and can
+    be read without looking the cart up first. The cache entry is dropped
+    by signals whenever a cart item or a product in the cart changes.
+    """
+
+    def build():
+        items = list(
+            CartItem.objects.filter(cart__customer=customer).values_list(
+                "product_id", "quantity"
+            )
+        )
+        snapshots = get_product_snapshots(product_id for product_id, _ in items)
+        return summarize_cart_lines(
+            cart_line(snapshots[product_id], quantity)
+            for product_id, quantity in items
+            if product_id in snapshots
+        )
+
+    return get_or_compute(
+        CART_SUMMARY_CACHE_KEY.format(customer_id=customer.pk),
+        build,
+        timeout=CART_SUMMARY_TIMEOUT,
+    )
+
+
+def get_session_cart_summary(request):
+    return summarize_cart_lines(SessionCart(request))
+
+
+def get_favorite_product_ids(customer):
+    return get_or_compute(
+        FAVORITE_IDS_CACHE_KEY.format(customer_id=customer.pk),
+        lambda: list(
+            FavoriteList.objects.filter(customer=customer).values_list(
+                "product_id", flat=True
+            )
+        ),
+        timeout=CART_SUMMARY_TIMEOUT,
+    )
+
+
+def invalidate_cart_summaries(customer_ids):
+    cache.delete_many(
+        [
+            CART_SUMMARY_CACHE_KEY.format(customer_id=customer_id)
+            for customer_id in customer_ids
+        ]
+    )
+
+
+def invalidate_product_caches(product_ids, customers=True):
+    """
+    Drop the cached snapshots of products, then the cart summaries built
+    from them, once the transaction commits. In the other order, or before
+    the commit, a concurrent request could cache a summary built from the
+    old snapshot.
+    """
+
+    product_ids = list(product_ids)
+
+    def invalidate():
+        invalidate_product_snapshots(product_ids)
+        if customers:
+            customer_ids = CartItem.objects.filter(
+                product_id__in=product_ids
+            ).values_list("cart__customer_id", flat=True)
+            invalidate_cart_summaries(set(customer_ids))
+
+    transaction.on_commit(invalidate)
+
+
+def invalidate_favorite_ids(customer_id):
+    cache.delete(FAVORITE_IDS_CACHE_KEY.format(customer_id=customer_id))
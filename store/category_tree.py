@@ -0,0 +1,86 @@
+"""
+The category tree shown in menus and on the home page.
+
+The tree is cached as a flat tuple of rows under a key carrying its
+version, and each process keeps the nested tree built from the last few
+versions. Category signals replace the version, so edits show up on the
+next request while an unchanged tree costs one small cache read and a
+dict lookup per request.
+"""
+
+from functools import lru_cache
+
+from .caching import bump_version, get_or_compute, get_version
+from .models import Category
+
+CATEGORY_TREE_CACHE_KEY = "category_tree:{version}"
+CATEGORY_TREE_VERSION_KEY = "category_tree:version"
+CATEGORY_TREE_TIMEOUT = 24 * 3600
+
+
+def build_category_rows():
+    """
+    Return every category as an ``(id, parent_id, title, slug, url,
+    cover_url)`` tuple, parents before their children.
+    """
+
+    return tuple(
+        (
+            category.id,
+            category.parent_id,
+            category.title,
+            category.slug,
+            category.get_absolute_url(),
+            category.cover.url if category.cover else "",
+        )
+        for category in Category.objects.order_by("tree_id", "lft")
+    )
+
+
+@lru_cache(maxsize=4)
+def _load_tree(version):
+    """
+    Build the nested tree of a version, once per process.
+    """
+
+    # The key carries the version so a stale tree is never memoized under
+    # a newer version.
+    rows = get_or_compute(
+        CATEGORY_TREE_CACHE_KEY.format(version=version),
+        build_category_rows,
+        timeout=CATEGORY_TREE_TIMEOUT,
+    )
+
+    nodes = {}
+    roots = []
+    for pk, parent_id, title, slug, url, cover_url in rows:
+        node = {
+            "id": pk,
+            "title": title,
+            "slug": slug,
+            "url": url,
+            "cover_url": cover_url,
+            "children": [],
+        }
+        nodes[pk] = node
+        if parent_id is None or parent_id not in nodes:
+            roots.append(node)
+        else:
+            nodes[parent_id]["children"].append(node)
+    return roots
+
+
+def get_category_tree():
+    """
+    Return the root categories as nested dicts.
+
+    Each node has ``id``, ``title``, ``slug``, ``url``, ``cover_url`` and
+    ``children``. The nodes are shared by every request of the process and
+    must not be modified.
+    """
+
+    return _load_tree(get_version(CATEGORY_TREE_VERSION_KEY))
+
+
+def invalidate_category_tree():
+    bump_version(CATEGORY_TREE_VERSION_KEY)
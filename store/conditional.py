@@ -0,0 +1,267 @@
+"""
+Conditional GET for catalog pages and JSON endpoints.
+
+:func:`conditional_page` wraps a view in Django's ``condition`` decorator,
+so a client whose ETag still matches gets ``304 Not Modified`` before the
+view runs. ETags hash:
+
+- the catalog version, replaced by signals whenever products, categories,
+  brands, colors, tags or comments change;
+- the top searched categories shown in every page header;
+- the requested path and query string;
+- for product views, the product stamp: its own, its comments', questions',
+  answers', related products' and recommendations' last update, its stock
+  and card version;
+- for personal responses, the visitor: user, cart and favorites, so a page
+  is never revalidated for someone else or after their cart changed.
+
+The ``Last-Modified`` header of product views is the newest of the product
+stamp and the time the catalog version or the top searched categories last
+changed, so it moves whenever the ETag does for anything but the visitor.
+
+Responses that do not depend on the visitor are marked ``public``: a
+shared reverse proxy may keep them ``CATALOG_PROXY_MAX_AGE`` seconds while
+browsers revalidate on every load. The others, and those that used the
+visitor's CSRF token, are ``private``.
+"""
+
+import hashlib
+import json
+from functools import wraps
+from typing import NamedTuple
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .caching import bump_version, get_version
+from .cart_summary import get_cart_summary, get_favorite_product_ids
+from .models import Answer, Comment, Product, Question
+from .search_log import get_top_search_categories
+
+CATALOG_VERSION_KEY = "catalog:version"
+CATALOG_MODIFIED_KEY = "catalog:modified"
+
+
+class ProductStamp(NamedTuple):
+    last_modified: object
+    token: tuple
+
+
+def get_catalog_version():
+    return get_version(CATALOG_VERSION_KEY)
+
+
+def get_catalog_modified():
+    """
+    Return when the catalog version or the top searched categories last
+    changed.
+
+    A missing timestamp, e.g. after a cache flush, is set to now, which at
+    worst makes clients fetch a page they already had once more.
+    """
+
+    modified = cache.get(CATALOG_MODIFIED_KEY)
+    if modified is None:
+        modified = timezone.now()
+        if not cache.add(CATALOG_MODIFIED_KEY, modified, timeout=None):
+            modified = cache.get(CATALOG_MODIFIED_KEY)
+    return modified
+
+
+def mark_catalog_modified():
+    cache.set(CATALOG_MODIFIED_KEY, timezone.now(), timeout=None)
+
+
+def invalidate_catalog():
+    mark_catalog_modified()
+    bump_version(CATALOG_VERSION_KEY)
+
+
+def _latest_update(queryset):
+    return Subquery(
+        queryset.order_by("-datetime_updated").values("datetime_updated")[:1]
+    )
+
+
+def get_product_stamp(request, **lookup):
+    """
+    Return the :class:`ProductStamp` of the product matching ``lookup``
+    with one query, or ``None`` if it does not exist.
+
+    The stamp is memoized on the request, since both the ETag and the
+    ``Last-Modified`` header need it.
+    """
+
+    if hasattr(request, "_product_stamp"):
+        return request._product_stamp
+
+    row = (
+        Product.objects.filter(**lookup)
+        .annotate(
+            last_comment=_latest_update(Comment.objects.filter(product=OuterRef("pk"))),
+            last_question=_latest_update(
+                Question.objects.filter(product=OuterRef("pk"))
+            ),
+            last_answer=_latest_update(
+                Answer.objects.filter(question__product=OuterRef("pk"))
+            ),
+        )
+        .values_list(
+            "datetime_updated",
+            "last_comment",
+            "last_question",
+            "last_answer",
+            "related_products__datetime_updated",
+            "recommendations__datetime_updated",
+            "stock",
+            "card_version",
+        )
+        .first()
+    )
+
+    stamp = None
+    if row is not None:
+        updated, *children, stock, card_version = row
+        last_modified = max(
+            [updated, *(timestamp for timestamp in children if timestamp)]
+        )
+        stamp = ProductStamp(
+            last_modified, (last_modified.isoformat(), stock, card_version)
+        )
+    request._product_stamp = stamp
+    return stamp
+
+
+def get_visitor_state(request):
+    """
+    Return what a page shows about the visitor, ``None`` for an anonymous
+    visitor with an empty cart.
+
+    Anonymous carts are read straight from the session, so no session is
+    created for visitors who never added a product.
+    """
+
+    if hasattr(request, "_visitor_state"):
+        return request._visitor_state
+
+    if request.user.is_authenticated:
+        customer = getattr(request, "customer", None)
+        state = [request.user.pk]
+        if customer:
+            state += [
+                sorted(get_cart_summary(customer).quantities.items()),
+                sorted(get_favorite_product_ids(customer)),
+            ]
+    else:
+        cart = request.session.get("cart")
+        state = (
+            sorted((product_id, item["quantity"]) for product_id, item in cart.items())
+            if cart
+            else None
+        )
+
+    request._visitor_state = state
+    return state
+
+
+def conditional_page(stamp_func=None, personal=True, anonymous_only=False):
+    """
+    Answer conditional GET requests of a catalog view with ``304 Not
+    Modified`` and set its ``Cache-Control`` header.
+
+    Args:
+        stamp_func (Callable or None): Called with the view arguments,
+            returns the :class:`ProductStamp` the response depends on.
+        personal (bool): Whether the response shows the visitor's cart,
+            favorites or messages.
+        anonymous_only (bool): Skip conditional responses for signed-in
+            users, for views that record their visits.
+    """
+
+    def decorator(view):
+        def is_conditional(request):
+            if anonymous_only and request.user.is_authenticated:
+                return False
+            # Pending messages are shown by the next rendered page, so a
+            # 304 would hold them back.
+            return not (personal and len(get_messages(request)))
+
+        def etag_func(request, *args, **kwargs):
+            if not is_conditional(request):
+                return None
+            parts = [
+                get_catalog_version(),
+                [category["id"] for category in get_top_search_categories()],
+                request.get_full_path(),
+            ]
+            if stamp_func is not None:
+                stamp = stamp_func(request, *args, **kwargs)
+                if stamp is None:
+                    return None
+                parts.append(stamp.token)
+            if personal:
+                parts.append(get_visitor_state(request))
+            payload = json.dumps(parts, default=str).encode()
+            return hashlib.sha256(payload).hexdigest()[:32]
+
+        def last_modified_func(request, *args, **kwargs):
+            # Timestamps do not cover the visitor, so personal responses are
+            # only validated by their ETag.
+            if stamp_func is None or not is_conditional(request):
+                return None
+            if personal and get_visitor_state(request) is not None:
+                return None
+            stamp = stamp_func(request, *args, **kwargs)
+            if stamp is None:
+                return None
+            # The ETag also covers the catalog and the page header; Django
+            # asks for this header first, so a header refresh is recorded
+            # before the catalog timestamp is read.
+            get_top_search_categories()
+            last_modified = max(stamp.last_modified, get_catalog_modified())
+            # Without USE_TZ timestamps are naive local times, which the
+            # condition decorator would read as UTC.
+            if timezone.is_naive(last_modified):
+                return timezone.make_aware(
+                    last_modified, timezone.get_current_timezone()
+                )
+            return last_modified
+
+        conditional_view = condition(
+            etag_func=etag_func, last_modified_func=last_modified_func
+        )(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if response.status_code not in (200, 304) or response.has_header(
+                "Cache-Control"
+            ):
+                return response
+            # A page holding a CSRF token sets the visitor's cookie, so it
+            # must not be shared by a proxy either.
+            if request.META.get("CSRF_COOKIE_NEEDS_UPDATE") or (
+                personal
+                and (
+                    request.user.is_authenticated
+                    or get_visitor_state(request) is not None
+                )
+            ):
+                patch_cache_control(response, private=True, no_cache=True)
+            else:
+                patch_cache_control(
+                    response,
+                    public=True,
+                    max_age=0,
+                    s_maxage=settings.CATALOG_PROXY_MAX_AGE,
+                )
+            return response
+
+        return wrapper
+
+    return decorator
@@ -1,134 +1,63 @@
-from collections import defaultdict
+from functools import cache as memoize
 
-from django.core.cache import cache
-from django.db.models import Count
-
-from .cart import Cart as SessionCart
-from .models import Cart, Category, FavoriteList
-
-
-def build_category_tree(categories):
-    tree = []
-    lookup = defaultdict(list)
-
-    for category in categories:
-        lookup[category.parent_id].append(category)
-
-    for category in categories:
-        category.children_list = lookup.get(category.id, [])
-        if category.parent_id is None:
-            tree.append(category)
-
-    return tree
+from .cart_summary import (
+    EMPTY_CART_SUMMARY,
+    get_cart_summary,
+    get_favorite_product_ids,
+    get_session_cart_summary,
+)
+from .category_tree import get_category_tree
+from .models import Category
+from .search_log import get_top_search_categories
 
 
 def global_context(request):
-    categories = cache.get("all_categories")
-    if categories is None:
-        all_categories = list(
-            Category.objects.all().select_related("parent").order_by("datetime_created")
-        )
-        categories = build_category_tree(all_categories)
-        cache.set("all_categories", categories, timeout=3600)
+    """
+    Provide categories, cart and favorites data to every template.
 
-    cart_items = []
-    product_ids_in_cart = []
-    product_ids_in_favorite = []
-    cart_item_quantity = 0
-    favorite_item_count = 0
-    total_price = total_old_price = total_discount_price = num_of_items = 0
+    Every value is a memoized zero-argument callable. Django templates call
+    callables when resolving a variable, so nothing is fetched unless the
+    rendered template actually uses it, and at most once per request.
+    Authenticated carts and favorites come from per-customer cached
+    summaries that signals drop on every cart or favorite change.
+    """
 
     product = getattr(request, "product", None)
-
-    if request.user.is_authenticated:
-        customer = getattr(request, "customer", None)
-        if customer:
-            cart = (
-                Cart.objects.select_related("customer")
-                .prefetch_related("items__product__brand")
-                .filter(customer=customer)
-                .first()
-            )
-            if cart:
-                items = cart.items.select_related("product", "product__brand")
-                cart_items = [
-                    {
-                        "product": item.product,
-                        "quantity": item.quantity,
-                        "unit_price": item.product.discount_price or item.product.price,
-                        "total_price": item.total_item_price,
-                        "total_old_price": item.total_item_old_price,
-                        "total_discount": item.total_discount_price,
-                    }
-                    for item in items
-                ]
-                total_price = cart.total_price
-                total_old_price = cart.total_old_price
-                total_discount_price = cart.total_discount_price
-                num_of_items = cart.num_of_items
-                product_ids_in_cart = [item.product_id for item in items]
-
-                if product:
-                    cart_item = next(
-                        (
-                            item
-                            for item in cart_items
-                            if item["product"].id == product.id
-                        ),
-                        None,
-                    )
-                    if cart_item:
-                        cart_item_quantity = cart_item["quantity"]
-
-            product_ids_in_favorite = list(
-                FavoriteList.objects.filter(customer=customer).values_list(
-                    "product_id", flat=True
-                )
-            )
-            favorite_item_count = len(product_ids_in_favorite)
-
+    customer = getattr(request, "customer", None)
+
+    if not request.user.is_authenticated:
+        cart_summary = memoize(lambda: get_session_cart_summary(request))
+        favorite_ids = memoize(lambda: [])
+    elif customer:
+        cart_summary = memoize(lambda: get_cart_summary(customer))
+        favorite_ids = memoize(lambda: get_favorite_product_ids(customer))
     else:
-        cart = SessionCart(request)
-        cart_items = list(cart)
-        num_of_items = len(cart)
-        total_price = cart.get_total_price()
-        total_old_price = cart.get_total_old_price()
-        total_discount_price = cart.get_total_discount()
-        product_ids_in_cart = [
-            item["product"].id for item in cart_items if "product" in item
-        ]
+        cart_summary = memoize(lambda: EMPTY_CART_SUMMARY)
+        favorite_ids = memoize(lambda: [])
 
-        if product:
-            cart_item = next(
-                (item for item in cart_items if item["product"].id == product.id), None
-            )
-            if cart_item:
-                cart_item_quantity = cart_item["quantity"]
+    def cart_item_quantity():
+        if product is None:
+            return 0
+        return cart_summary().quantities.get(product.id, 0)
 
     return {
-        "global_categories": categories,
-        "items": cart_items,
-        "total_price": total_price,
-        "total_old_price": total_old_price,
-        "total_discount_price": total_discount_price,
-        "num_of_items": num_of_items,
-        "product_ids_in_cart": product_ids_in_cart,
+        "global_categories": memoize(get_category_tree),
+        "items": lambda: cart_summary().items,
+        "total_price": lambda: cart_summary().summary.total_price,
+        "total_old_price": lambda: cart_summary().summary.total_old_price,
+        "total_discount_price": lambda: cart_summary().summary.total_discount_price,
+        "num_of_items": lambda: cart_summary().summary.num_of_items,
+        "product_ids_in_cart": lambda: list(cart_summary().quantities),
         "cart_item_quantity": cart_item_quantity,
-        "favorite_item_count": favorite_item_count,
-        "product_ids_in_favorite": product_ids_in_favorite,
+        "favorite_item_count": lambda: len(favorite_ids()),
+        "product_ids_in_favorite": favorite_ids,
     }
 
 
 def global_store_context(request):
-    top_search_categories = (
-        Category.objects.filter(search_logs__isnull=False)
-        .annotate(search_count=Count("search_logs"))
-        .order_by("-search_count")[:5]
-    )
-
-    default_search_categories = Category.objects.filter(show_in_search_default=True)[:5]
-
     return {
-        "top_search_categories": top_search_categories,
-        "default_search_categories": default_search_categories,
+        "top_search_categories": memoize(get_top_search_categories),
+        "default_search_categories": Category.objects.filter(
+            show_in_search_default=True
+        )[:5],
     }
@@ -0,0 +1,193 @@
+"""
+Facet counts for category listings.
+
+Each category gets a facet index listing its active products ordered by
+price. Every brand and color is stored as a bitset (a Python ``int``) over
+those positions, so narrowing and counting facets for a filter state is a
+handful of ``&`` operations and ``int.bit_count()`` calls, with no query.
+Since positions follow the price order, a price range is a contiguous run
+of bits found with ``bisect``.
+
+Indexes cover the whole category subtree and are cached under a shared
+version; any change to products, categories or colors replaces the
+version and every index is rebuilt lazily on its next use.
+"""
+
+from bisect import bisect_left, bisect_right
+
+from .caching import bump_version, get_or_compute, get_version
+from .models import Brand, Color, Product
+
+FACET_INDEX_CACHE_KEY = "category_facets:{category_id}"
+FACET_VERSION_KEY = "category_facets:version"
+FACET_INDEX_TIMEOUT = 6 * 3600
+PRICE_BUCKET_COUNT = 5
+
+
+def _price_bucket_bounds(prices, count=PRICE_BUCKET_COUNT):
+    """
+    Split sorted prices into up to ``count`` ranges of similar size.
+
+    Boundaries are rounded down to two significant digits so the ranges
+    read well in the sidebar.
+
+    Returns:
+        list: ``(min_price, max_price)`` pairs, ``max_price`` is ``None``
+        for the last open-ended range.
+    """
+
+    thresholds = []
+    for index in range(1, count):
+        price = prices[len(prices) * index // count]
+        magnitude = 10 ** max(len(str(price)) - 2, 0)
+        threshold = price // magnitude * magnitude
+        if threshold > prices[0] and (not thresholds or threshold > thresholds[-1]):
+            thresholds.append(threshold)
+
+    lows = [0, *thresholds]
+    highs = [threshold - 1 for threshold in thresholds] + [None]
+    return list(zip(lows, highs))
+
+
+def build_facet_index(products):
+    """
+    Build the facet index of a product queryset with two queries.
+
+    Args:
+        products (QuerySet): The products of a listing, before filters.
+
+    Returns:
+        dict: Product ids and prices in price order, and brand and color
+        bitsets over those positions.
+    """
+
+    rows = list(products.order_by("price", "pk").values_list("pk", "brand_id", "price"))
+    positions = {pk: position for position, (pk, _, _) in enumerate(rows)}
+
+    brands = {}
+    for position, (_, brand_id, _) in enumerate(rows):
+        brands[brand_id] = brands.get(brand_id, 0) | 1 << position
+
+    colors = {}
+    product_colors = Product.colors.through.objects.filter(
+        product_id__in=positions
+    ).values_list("product_id", "color_id")
+    for product_id, color_id in product_colors:
+        colors[color_id] = colors.get(color_id, 0) | 1 << positions[product_id]
+
+    prices = [price for _, _, price in rows]
+    return {
+        "ids": [pk for pk, _, _ in rows],
+        "prices": prices,
+        "brands": brands,
+        "colors": colors,
+        "price_buckets": _price_bucket_bounds(prices) if prices else [],
+    }
+
+
+def get_category_facet_index(category):
+    """
+    Return the cached facet index of a category, building it on a miss.
+
+    After an invalidation the previous index is served while one worker
+    rebuilds it.
+    """
+
+    return get_or_compute(
+        FACET_INDEX_CACHE_KEY.format(category_id=category.pk),
+        lambda: build_facet_index(
+            Product.objects.filter(is_active=True).in_category(category)
+        ),
+        timeout=FACET_INDEX_TIMEOUT,
+        version=get_version(FACET_VERSION_KEY),
+    )
+
+
+def invalidate_category_facets():
+    bump_version(FACET_VERSION_KEY)
+
+
+def _union(bitsets, ids):
+    mask = 0
+    for pk in ids:
+        mask |= bitsets.get(pk, 0)
+    return mask
+
+
+def _price_mask(prices, min_price, max_price):
+    start = bisect_left(prices, min_price) if min_price is not None else 0
+    end = bisect_right(prices, max_price) if max_price is not None else len(prices)
+    if end <= start:
+        return 0
+    return (1 << end) - (1 << start)
+
+
+def get_category_facets(
+    category, brand_ids=(), color_ids=(), min_price=None, max_price=None
+):
+    """
+    Count the products behind every brand, color and price filter option.
+
+    Counts follow the usual faceted search rules: options of one facet are
+    OR-ed together, facets are AND-ed, and each facet is counted against
+    the filters of the other facets only, so picking a brand does not hide
+    the other brands.
+
+    Args:
+        category (Category): The listed category.
+        brand_ids (Iterable[int]): Selected brands.
+        color_ids (Iterable[int]): Selected colors.
+        min_price (int or None): Lowest selected price.
+        max_price (int or None): Highest selected price.
+
+    Returns:
+        dict: ``brands`` and ``colors`` as model instances annotated with
+        ``product_count`` and ``selected``, ``price_buckets`` as dicts, and
+        ``total``, the number of products matching every filter.
+    """
+
+    index = get_category_facet_index(category)
+    everything = (1 << len(index["ids"])) - 1
+    brand_ids, color_ids = set(brand_ids), set(color_ids)
+
+    brand_mask = _union(index["brands"], brand_ids) if brand_ids else everything
+    color_mask = _union(index["colors"], color_ids) if color_ids else everything
+    price_mask = _price_mask(index["prices"], min_price, max_price)
+
+    brand_counts = {
+        brand_id: (bitset & color_mask & price_mask).bit_count()
+        for brand_id, bitset in index["brands"].items()
+    }
+    color_counts = {
+        color_id: (bitset & brand_mask & price_mask).bit_count()
+        for color_id, bitset in index["colors"].items()
+    }
+
+    brands = list(Brand.objects.filter(pk__in=brand_counts).order_by("title"))
+    for brand in brands:
+        brand.product_count = brand_counts[brand.pk]
+        brand.selected = brand.pk in brand_ids
+
+    colors = list(Color.objects.filter(pk__in=color_counts).order_by("name"))
+    for color in colors:
+        color.product_count = color_counts[color.pk]
+        color.selected = color.pk in color_ids
+
+    price_buckets = []
+    for low, high in index["price_buckets"]:
+        bucket_mask = _price_mask(index["prices"], low, high)
+        price_buckets.append(
+            {
+                "min_price": low,
+                "max_price": high,
+                "product_count": (bucket_mask & brand_mask & color_mask).bit_count(),
+                "selected": (low, high) == (min_price, max_price),
+            }
+        )
+
+    return {
+        "brands": brands,
+        "colors": colors,
+        "price_buckets": price_buckets,
+        "total": (brand_mask & color_mask & price_mask).bit_count(),
+    }
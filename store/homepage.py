@@ -0,0 +1,107 @@
+"""
+Product cards shown on the home page.
+
+The cards are plain dicts built with two queries and cached together with
+the version they were built from. Product, comment and color signals
+replace the shared version; requests keep serving the previous cards
+while the ``rebuild_homepage_cards`` task refreshes them, and a cold cache
+is built by one request while the others wait for it.
+"""
+
+from .caching import (
+    bump_version,
+    get_or_compute,
+    get_version,
+    release_lock,
+    set_cached,
+)
+from .models import Product
+
+HOMEPAGE_CARDS_CACHE_KEY = "homepage_cards"
+HOMEPAGE_VERSION_KEY = "homepage_cards:version"
+HOMEPAGE_CARDS_TIMEOUT = 3600
+HOMEPAGE_PRODUCT_LIMIT = 20
+
+
+def product_card(product):
+    """
+    Return the fields a home page product card renders.
+
+    Args:
+        product (Product): A product annotated by ``with_rating()`` with
+            its colors prefetched.
+    """
+
+    return {
+        "id": product.id,
+        "title": product.title,
+        "english_title": product.english_title,
+        "url": product.get_absolute_url(),
+        "image_url": product.image.url if product.image else "",
+        "price": product.price,
+        "discount_price": product.discount_price,
+        "discount_percentage": product.get_discount_percentage(),
+        "avg_total_rating": round(product.avg_total_rating, 1),
+        "approved_comment_count": product.approved_comment_count,
+        "colors": [color.hex_code for color in product.colors.all()],
+    }
+
+
+def build_homepage_cards():
+    products = (
+        Product.objects.filter(is_active=True)
+        .with_rating()
+        .prefetch_related("colors")
+        .order_by("-datetime_created")
+    )
+    return {
+        "newest": [
+            product_card(product) for product in products[:HOMEPAGE_PRODUCT_LIMIT]
+        ],
+        "top": [
+            product_card(product)
+            for product in products.filter(top_product=True)[:HOMEPAGE_PRODUCT_LIMIT]
+        ],
+    }
+
+
+def refresh_homepage_cards():
+    """
+    Build the cards and store them under the current version.
+
+    The version is read before building, so a change made meanwhile leaves
+    the stored cards stale and triggers another rebuild.
+    """
+
+    version = get_version(HOMEPAGE_VERSION_KEY)
+    try:
+        cards = build_homepage_cards()
+        set_cached(
+            HOMEPAGE_CARDS_CACHE_KEY,
+            cards,
+            timeout=HOMEPAGE_CARDS_TIMEOUT,
+            version=version,
+        )
+    finally:
+        release_lock(HOMEPAGE_CARDS_CACHE_KEY)
+    return cards
+
+
+def get_homepage_cards():
+    """
+    Return the ``newest`` and ``top`` product cards of the home page.
+    """
+
+    from .tasks import rebuild_homepage_cards
+
+    return get_or_compute(
+        HOMEPAGE_CARDS_CACHE_KEY,
+        build_homepage_cards,
+        timeout=HOMEPAGE_CARDS_TIMEOUT,
+        version=get_version(HOMEPAGE_VERSION_KEY),
+        refresh=rebuild_homepage_cards.delay,
+    )
+
+
+def invalidate_homepage_cards():
+    bump_version(HOMEPAGE_VERSION_KEY)
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from store.retention import apply_retention_policy, get_retention_policies
+
+
+class Command(BaseCommand):
+    help = (
+        "Purge expired rows of the tables in settings.RETENTION_POLICIES and "
+        "report the purge rate of each table."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "labels",
+            nargs="*",
+            help="Only apply the policies of these models, e.g. users.UserHistory.",
+        )
+
+    def handle(self, *args, **options):
+        for policy in get_retention_policies():
+            if options["labels"] and policy.label not in options["labels"]:
+                continue
+            run = apply_retention_policy(policy)
+            self.stdout.write(
+                f"{run.label:<24}{run.purged:>10} rows{run.seconds:>8.1f} s"
+                f"{run.rows_per_second:>10.0f} rows/s"
+                + ("" if run.finished else "  (time budget spent)")
+            )
@@ -0,0 +1,58 @@
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from store.models import Cart, CartItem, Product
+from store.orders import place_order
+
+
+class Command(BaseCommand):
+    help = (
+        "Place a throwaway order with many lines and report its query count. "
+        "Everything is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lines",
+            type=int,
+            default=50,
+            help="Number of cart lines in the benchmarked order.",
+        )
+
+    def handle(self, *args, **options):
+        lines = options["lines"]
+        products = list(Product.objects.filter(stock__gte=1).order_by("pk")[:lines])
+        if len(products) < lines:
+            raise CommandError(
+                f"Need {lines} products in stock, found {len(products)}."
+            )
+
+        with transaction.atomic():
+            user = get_user_model().objects.create(
+                mobile=f"0{uuid.uuid4().int % 10**10:010d}"
+            )
+            customer = user.customer
+            cart = Cart.objects.create(customer=customer)
+            CartItem.objects.bulk_create(
+                [CartItem(cart=cart, product=product) for product in products]
+            )
+
+            with CaptureQueriesContext(connection) as queries:
+                started = time.monotonic()
+                place_order(customer, cart.pk, payment_method="benchmark")
+                elapsed = time.monotonic() - started
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Placed an order with {lines} lines "
+                f"in {len(queries)} queries and {elapsed * 1000:.1f} ms "
+                "(rolled back)."
+            )
+        )
@@ -0,0 +1,90 @@
+import random
+import time
+import tracemalloc
+from collections import Counter
+from itertools import accumulate
+
+from django.core.management.base import BaseCommand
+
+from store.recommendations import RECOMMENDATION_BLOCK_SIZE, build_neighbors
+
+
+class Command(BaseCommand):
+    help = (
+        "Build recommendations from synthetic baskets and report the build "
+        "time. Nothing is read from or written to the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--products",
+            type=int,
+            default=100_000,
+            help="Number of products in the synthetic catalog.",
+        )
+        parser.add_argument(
+            "--customers",
+            type=int,
+            default=200_000,
+            help="Number of synthetic baskets.",
+        )
+        parser.add_argument(
+            "--basket-size",
+            type=int,
+            default=10,
+            help="Average number of products per basket.",
+        )
+        parser.add_argument(
+            "--block-size",
+            type=int,
+            default=RECOMMENDATION_BLOCK_SIZE,
+            help="Rows of the co-occurrence matrix built per block.",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Seed of the synthetic data."
+        )
+        parser.add_argument(
+            "--trace-memory",
+            action="store_true",
+            help="Report the peak memory of the build, which slows it down.",
+        )
+
+    def handle(self, *args, **options):
+        products = options["products"]
+        rng = random.Random(options["seed"])
+
+        # Popularity follows a power law, like real catalogs where a few
+        # products collect most of the views.
+        cum_weights = list(accumulate(1 / (rank + 1) for rank in range(products)))
+        baskets = []
+        for _ in range(options["customers"]):
+            size = max(2, int(rng.expovariate(1 / options["basket_size"])))
+            basket = rng.choices(range(products), cum_weights=cum_weights, k=size)
+            baskets.append(tuple(dict.fromkeys(basket)))
+        interactions = sum(len(basket) for basket in baskets)
+
+        if options["trace_memory"]:
+            tracemalloc.start()
+        started = time.monotonic()
+        customer_counts = Counter(
+            product_id for basket in baskets for product_id in basket
+        )
+        rows = 0
+        for neighbors in build_neighbors(
+            baskets, customer_counts, customer_counts, options["block_size"]
+        ):
+            rows += len(neighbors)
+        elapsed = time.monotonic() - started
+        memory = ""
+        if options["trace_memory"]:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            memory = f", peak memory {peak / 2**20:.1f} MiB"
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Built {rows} rows from {len(baskets)} baskets "
+                f"({interactions} interactions) in {elapsed:.1f} s{memory} "
+                f"(block size {options['block_size']})."
+            )
+        )
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from store.caching import get_metrics
+
+OUTCOMES = ("hit", "early", "refresh", "stale", "miss")
+
+
+class Command(BaseCommand):
+    help = "Show hit, refresh, stale and miss counts of cached key families."
+
+    def handle(self, *args, **options):
+        metrics = get_metrics()
+        if not metrics:
+            self.stdout.write("No cache metrics recorded yet.")
+            return
+
+        self.stdout.write(
+            f"{'name':<24}"
+            + "".join(f"{outcome:>10}" for outcome in OUTCOMES)
+            + f"{'hit rate':>10}"
+        )
+        for name, counts in sorted(metrics.items()):
+            total = sum(counts.values())
+            served = counts.get("hit", 0) + counts.get("stale", 0)
+            self.stdout.write(
+                f"{name:<24}"
+                + "".join(f"{counts.get(outcome, 0):>10}" for outcome in OUTCOMES)
+                + f"{served / total:>10.1%}"
+            )
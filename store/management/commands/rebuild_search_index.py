@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.models import Product
+from store.search import SEARCH_INDEX_BATCH_SIZE, update_search_documents
+
+
+class Command(BaseCommand):
+    help = "Rebuild the normalized search document of every product."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=SEARCH_INDEX_BATCH_SIZE,
+            help="Number of products normalized and written per batch.",
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        updated = update_search_documents(
+            Product.objects.order_by("pk"), batch_size=options["batch_size"]
+        )
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt {updated} search documents in {elapsed:.2f} seconds."
+            )
+        )
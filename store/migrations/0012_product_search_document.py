@@ -0,0 +1,82 @@
+# Generated by Django 5.2.1 on 2026-10-18 23:35
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+from store.normalization import normalize_texts
+
+BACKFILL_BATCH_SIZE = 500
+
+
+def _write_search_documents(apps, products):
+    Product = apps.get_model('store', 'Product')
+    TaggedItem = apps.get_model('taggit', 'TaggedItem')
+    # Historical models cannot follow the taggit manager, so the tag names
+    # of the whole batch are read through the generic relation instead.
+    tags = {}
+    tagged_items = TaggedItem.objects.filter(
+        content_type__app_label='store',
+        content_type__model='product',
+        object_id__in=[product.pk for product in products],
+    ).values_list('object_id', 'tag__name')
+    for object_id, name in tagged_items:
+        tags.setdefault(object_id, []).append(name)
+
+    sources = []
+    for product in products:
+        parts = [product.title, product.english_title]
+        parts.extend(tags.get(product.pk, []))
+        if product.brand_id:
+            parts.extend([product.brand.title, product.brand.english_title])
+        parts.extend(category.title for category in product.categories.all())
+        sources.append(' '.join(part for part in parts if part))
+
+    for product, document in zip(products, normalize_texts(sources)):
+        product.search_document = document
+    Product.objects.bulk_update(products, ['search_document'])
+
+
+def backfill_search_documents(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    products = Product.objects.select_related('brand').prefetch_related('categories')
+    batch = []
+    for product in products.iterator(chunk_size=BACKFILL_BATCH_SIZE):
+        batch.append(product)
+        if len(batch) >= BACKFILL_BATCH_SIZE:
+            _write_search_documents(apps, batch)
+            batch = []
+    if batch:
+        _write_search_documents(apps, batch)
+
+
+def create_search_document_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS store_product_search_document_trgm '
+        'ON store_product USING gin (search_document gin_trgm_ops)'
+    )
+
+
+def drop_search_document_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS store_product_search_document_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0011_category_show_in_search_default_searchlog_and_more'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='product',
+            name='search_document',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='Search Document'),
+        ),
+        migrations.RunPython(backfill_search_documents, migrations.RunPython.noop),
+        migrations.RunPython(create_search_document_index, drop_search_document_index),
+    ]
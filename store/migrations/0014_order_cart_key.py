@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 23:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0013_stockreservation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='cart_key',
+            field=models.UUIDField(blank=True, editable=False, help_text='Id of the cart the order was placed from.', null=True, unique=True, verbose_name='Cart Key'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.1 on 2026-10-18 23:52
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+RATING_FIELDS = ['build_quality', 'value_for_price', 'innovation', 'features', 'ease_of_use', 'design']
+
+
+def backfill_product_ratings(apps, schema_editor):
+    Comment = apps.get_model('store', 'Comment')
+    ProductRating = apps.get_model('store', 'ProductRating')
+    rows = (
+        Comment.objects.filter(is_approved=True)
+        .values('product_id')
+        .annotate(comment_count=Count('pk'), **{f'{field}_sum': Sum(field) for field in RATING_FIELDS})
+    )
+    ratings = []
+    for row in rows:
+        sums = {f'{field}_sum': row[f'{field}_sum'] or 0 for field in RATING_FIELDS}
+        ratings.append(
+            ProductRating(
+                product_id=row['product_id'],
+                comment_count=row['comment_count'],
+                average=sum(sums.values()) / (row['comment_count'] * 6),
+                **sums,
+            )
+        )
+    ProductRating.objects.bulk_create(ratings, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_order_cart_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductRating',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating', serialize=False, to='store.product', verbose_name='Product')),
+                ('comment_count', models.PositiveIntegerField(default=0, verbose_name='Approved Comments')),
+                ('build_quality_sum', models.PositiveIntegerField(default=0, verbose_name='Build Quality Sum')),
+                ('value_for_price_sum', models.PositiveIntegerField(default=0, verbose_name='Value for Price Sum')),
+                ('innovation_sum', models.PositiveIntegerField(default=0, verbose_name='Innovation Sum')),
+                ('features_sum', models.PositiveIntegerField(default=0, verbose_name='Features Sum')),
+                ('ease_of_use_sum', models.PositiveIntegerField(default=0, verbose_name='Ease of Use Sum')),
+                ('design_sum', models.PositiveIntegerField(default=0, verbose_name='Design Sum')),
+                ('average', models.FloatField(blank=True, db_index=True, null=True, verbose_name='Average Rating')),
+                ('datetime_updated', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Updated At')),
+            ],
+            options={
+                'verbose_name': 'Product Rating',
+                'verbose_name_plural': 'Product Ratings',
+            },
+        ),
+        migrations.RunPython(backfill_product_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:00
+
+import django.db.models.deletion
+import mptt.fields
+from django.db import migrations, models
+
+
+def build_category_tree(apps, schema_editor):
+    Category = apps.get_model('store', 'Category')
+    categories = list(Category.objects.order_by('datetime_created', 'pk'))
+    children = {}
+    for category in categories:
+        children.setdefault(category.parent_id, []).append(category)
+
+    def number(category, tree_id, level, lft):
+        category.tree_id, category.level, category.lft = tree_id, level, lft
+        rght = lft + 1
+        for child in children.get(category.pk, []):
+            rght = number(child, tree_id, level + 1, rght) + 1
+        category.rght = rght
+        return rght
+
+    for tree_id, root in enumerate(children.get(None, []), start=1):
+        number(root, tree_id, 0, 1)
+    Category.objects.bulk_update(categories, ['lft', 'rght', 'tree_id', 'level'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0015_productrating'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='level',
+            field=models.PositiveIntegerField(default=0, editable=False),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='lft',
+            field=models.PositiveIntegerField(default=0, editable=False),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='rght',
+            field=models.PositiveIntegerField(default=0, editable=False),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='tree_id',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='category',
+            name='parent',
+            field=mptt.fields.TreeForeignKey(blank=True, default=None, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='children', to='store.category', verbose_name='Parent'),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['tree_id', 'lft', 'rght'], name='store_category_subtree_idx'),
+        ),
+        migrations.RunPython(build_category_tree, migrations.RunPython.noop),
+    ]
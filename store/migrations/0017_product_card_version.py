@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-19 00:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0016_category_tree'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='card_version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Card Version'),
+        ),
+    ]
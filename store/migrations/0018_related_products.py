@@ -0,0 +1,27 @@
+# Generated by Django 5.2.1 on 2026-10-19 00:14
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0017_product_card_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedProducts',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='related_products', serialize=False, to='store.product', verbose_name='Product')),
+                ('product_ids', models.JSONField(default=list, verbose_name='Related Products')),
+                ('datetime_updated', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Updated At')),
+            ],
+            options={
+                'verbose_name': 'Related Products',
+                'verbose_name_plural': 'Related Products',
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-19 00:16
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0018_related_products'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductRecommendations',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='recommendations', serialize=False, to='store.product', verbose_name='Product')),
+                ('also_viewed', models.JSONField(default=list, verbose_name='Also Viewed')),
+                ('also_bought', models.JSONField(default=list, verbose_name='Also Bought')),
+                ('datetime_updated', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Updated At')),
+            ],
+            options={
+                'verbose_name': 'Product Recommendations',
+                'verbose_name_plural': 'Product Recommendations',
+            },
+        ),
+    ]
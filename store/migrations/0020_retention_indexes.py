@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-19 00:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0019_product_recommendations'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cart',
+            name='datetime_updated',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Updated At'),
+        ),
+        migrations.AlterField(
+            model_name='contactmessage',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Created At'),
+        ),
+        migrations.AlterField(
+            model_name='searchlog',
+            name='datetime_created',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Created At'),
+        ),
+    ]
@@ -0,0 +1,96 @@
+# Generated by Django 5.2.1 on 2026-10-19 00:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+VOTE_SOURCES = [('Comment', 'comment'), ('Answer', 'answer')]
+VOTE_FIELDS = [('likes', 'like', 'num_likes'), ('dislikes', 'dislike', 'num_dislikes')]
+
+
+def copy_votes(apps, schema_editor):
+    Vote = apps.get_model('store', 'Vote')
+    for model_name, kind in VOTE_SOURCES:
+        model = apps.get_model('store', model_name)
+        for field, value, counter in VOTE_FIELDS:
+            through = model._meta.get_field(field).remote_field.through
+            pairs = through.objects.values_list(f'{kind}_id', 'user_id')
+            Vote.objects.bulk_create(
+                (Vote(user_id=user_id, kind=kind, object_id=object_id, value=value) for object_id, user_id in pairs.iterator()),
+                batch_size=1000,
+                ignore_conflicts=True,
+            )
+        for field, value, counter in VOTE_FIELDS:
+            counts = (
+                Vote.objects.filter(kind=kind, value=value, object_id=OuterRef('pk'))
+                .order_by()
+                .values('object_id')
+                .annotate(count=Count('pk'))
+                .values('count')
+            )
+            model.objects.update(**{counter: Coalesce(Subquery(counts), 0)})
+
+
+def restore_votes(apps, schema_editor):
+    Vote = apps.get_model('store', 'Vote')
+    for model_name, kind in VOTE_SOURCES:
+        model = apps.get_model('store', model_name)
+        for field, value, counter in VOTE_FIELDS:
+            through = model._meta.get_field(field).remote_field.through
+            votes = Vote.objects.filter(kind=kind, value=value, object_id__in=model.objects.values('pk'))
+            through.objects.bulk_create(
+                (through(user_id=user_id, **{f'{kind}_id': object_id}) for object_id, user_id in votes.values_list('object_id', 'user_id').iterator()),
+                batch_size=1000,
+                ignore_conflicts=True,
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0020_retention_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='answer',
+            name='num_dislikes',
+            field=models.PositiveIntegerField(default=0, verbose_name='Dislikes'),
+        ),
+        migrations.AddField(
+            model_name='answer',
+            name='num_likes',
+            field=models.PositiveIntegerField(default=0, verbose_name='Likes'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='num_dislikes',
+            field=models.PositiveIntegerField(default=0, verbose_name='Dislikes'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='num_likes',
+            field=models.PositiveIntegerField(default=0, verbose_name='Likes'),
+        ),
+        migrations.CreateModel(
+            name='Vote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('comment', 'Comment'), ('answer', 'Answer')], max_length=10, verbose_name='Kind')),
+                ('object_id', models.PositiveBigIntegerField(verbose_name='Object ID')),
+                ('value', models.CharField(choices=[('like', 'Like'), ('dislike', 'Dislike')], max_length=10, verbose_name='Value')),
+                ('datetime_created', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='votes', to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Vote',
+                'verbose_name_plural': 'Votes',
+                'indexes': [models.Index(fields=['kind', 'object_id'], name='store_vote_kind_4c5717_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'kind', 'object_id'), name='unique_vote')],
+            },
+        ),
+        migrations.RunPython(copy_votes, restore_votes),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.1 on 2026-10-19 00:26
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0021_votes'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='answer',
+            name='dislikes',
+        ),
+        migrations.RemoveField(
+            model_name='answer',
+            name='likes',
+        ),
+        migrations.RemoveField(
+            model_name='comment',
+            name='dislikes',
+        ),
+        migrations.RemoveField(
+            model_name='comment',
+            name='likes',
+        ),
+    ]
@@ -1,20 +1,28 @@
 import uuid
+from typing import NamedTuple
 
 from ckeditor.fields import RichTextField
 from django.conf import settings
 from django.core.validators import MaxValueValidator, MinValueValidator, ValidationError
 from django.db import models
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Coalesce, NullIf
 from django.db.models.signals import pre_save
 from django.shortcuts import reverse
+from django.utils import timezone
 from django.utils.html import format_html
 from django.utils.text import slugify
 from django.utils.translation import gettext_lazy as _
+from mptt.models import MPTTModel, TreeForeignKey
 from taggit.managers import TaggableManager
 
+from .normalization import normalize_text
+from .utils import get_unit_price
+
 
 def generate_unique_slug(instance, slug_field, title_field):
     """Generate a unique slug for the instance."""
-    slug = slugify(getattr(instance, title_field), allow_unicode=True)
+    slug = slugify(normalize_text(getattr(instance, title_field)), allow_unicode=True)
     Klass = instance.__class__
     qs = Klass.objects.filter(**{slug_field: slug}).exclude(id=instance.id)
     if qs.exists():
@@ -56,7 +64,7 @@ class Brand(models.Model):
         return reverse("store:brand-list", kwargs={"slug": self.slug})
 
 
-class Category(models.Model):
+class Category(MPTTModel):
     title = models.CharField(max_length=100, verbose_name=_("Category Name"))
     slug = models.SlugField(
         unique=True,
@@ -65,7 +73,7 @@ class Category(models.Model):
         null=True,
         verbose_name=_("Slug"),
     )
-    parent = models.ForeignKey(
+    parent = TreeForeignKey(
         "self",
         default=None,
         null=True,
@@ -97,6 +105,11 @@ class Category(models.Model):
         verbose_name = _("Category")
         verbose_name_plural = _("Categories")
         ordering = ["datetime_created"]
+        indexes = [
+            models.Index(
+                fields=["tree_id", "lft", "rght"], name="store_category_subtree_idx"
+            )
+        ]
 
     def __str__(self):
         return self.title
@@ -112,6 +125,21 @@ class Category(models.Model):
     def get_absolute_url(self):
         return reverse("store:category-list", kwargs={"slug": self.slug})
 
+    def subtree_lookup(self, prefix=""):
+        """
+        Return lookups matching this category and all its descendants.
+
+        The nested set bounds select the whole subtree with a range
+        condition on the ``(tree_id, lft)`` index, e.g.
+        ``Product.objects.filter(**category.subtree_lookup("categories__"))``.
+        """
+
+        return {
+            f"{prefix}tree_id": self.tree_id,
+            f"{prefix}lft__gte": self.lft,
+            f"{prefix}rght__lte": self.rght,
+        }
+
 
 class Color(models.Model):
     name = models.CharField(max_length=50, verbose_name=_("Color Name"))
@@ -129,6 +157,28 @@ class Color(models.Model):
         return self.name
 
 
+class ProductQuerySet(models.QuerySet):
+    def with_rating(self):
+        """
+        Annotate ``approved_comment_count`` and ``avg_total_rating`` from
+        the denormalized :class:`ProductRating` row, without touching
+        comments. Both are zero for products without approved comments, so
+        they can be used as keyset pagination keys.
+        """
+
+        return self.annotate(
+            approved_comment_count=Coalesce("rating__comment_count", 0),
+            avg_total_rating=Coalesce("rating__average", 0.0),
+        )
+
+    def in_category(self, category):
+        """
+        Filter products attached to ``category`` or any of its descendants.
+        """
+
+        return self.filter(**category.subtree_lookup("categories__")).distinct()
+
+
 class Product(models.Model):
 
     title = models.CharField(max_length=200, verbose_name=_("Product Name"))
@@ -174,11 +224,19 @@ class Product(models.Model):
     stock = models.PositiveIntegerField(verbose_name=_("Stock"))
     is_active = models.BooleanField(default=True, verbose_name=_("Is Active"))
     top_product = models.BooleanField(default=False, verbose_name=_("Top product"))
+    search_document = models.TextField(
+        blank=True, default="", editable=False, verbose_name=_("Search Document")
+    )
+    card_version = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name=_("Card Version")
+    )
     datetime_created = models.DateTimeField(
         auto_now_add=True, verbose_name=_("Created At")
     )
     datetime_updated = models.DateTimeField(auto_now=True, verbose_name=_("Updated At"))
 
+    objects = ProductQuerySet.as_manager()
+
     class Meta:
         verbose_name = _("Product")
         verbose_name_plural = _("Products")
@@ -187,6 +245,23 @@ class Product(models.Model):
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        # card_version only moves through F() updates (see
+        # store.product_cards.bump_card_versions); writing back the value
+        # loaded with the instance would undo concurrent bumps.
+        if not self._state.adding:
+            update_fields = kwargs.get("update_fields")
+            if update_fields is None:
+                update_fields = [
+                    field.name
+                    for field in self._meta.concrete_fields
+                    if not field.primary_key
+                ]
+            kwargs["update_fields"] = [
+                name for name in update_fields if name != "card_version"
+            ]
+        super().save(*args, **kwargs)
+
     def clean(self):
         if self.discount_price and self.discount_price >= self.price:
             raise ValidationError(
@@ -295,12 +370,8 @@ class Comment(models.Model):
         validators=[MinValueValidator(1), MaxValueValidator(5)],
         verbose_name=_("Design"),
     )
-    likes = models.ManyToManyField(
-        settings.AUTH_USER_MODEL, related_name="liked_comments", blank=True
-    )
-    dislikes = models.ManyToManyField(
-        settings.AUTH_USER_MODEL, related_name="disliked_comments", blank=True
-    )
+    num_likes = models.PositiveIntegerField(default=0, verbose_name=_("Likes"))
+    num_dislikes = models.PositiveIntegerField(default=0, verbose_name=_("Dislikes"))
     is_approved = models.BooleanField(default=False, verbose_name=_("Is Approved"))
     datetime_created = models.DateTimeField(
         auto_now_add=True, verbose_name=_("Created At")
@@ -316,6 +387,114 @@ class Comment(models.Model):
         return f"Comment by {self.user.username} on {self.product.title}"
 
 
+class ProductRating(models.Model):
+    """
+    Running totals of the approved comment ratings of a product.
+
+    Kept up to date incrementally by comment signals and reconciled
+    nightly, so listings can sort and display ratings without grouping
+    over comments.
+    """
+
+    product = models.OneToOneField(
+        Product,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="rating",
+        verbose_name=_("Product"),
+    )
+    comment_count = models.PositiveIntegerField(
+        default=0, verbose_name=_("Approved Comments")
+    )
+    build_quality_sum = models.PositiveIntegerField(
+        default=0, verbose_name=_("Build Quality Sum")
+    )
+    value_for_price_sum = models.PositiveIntegerField(
+        default=0, verbose_name=_("Value for Price Sum")
+    )
+    innovation_sum = models.PositiveIntegerField(
+        default=0, verbose_name=_("Innovation Sum")
+    )
+    features_sum = models.PositiveIntegerField(
+        default=0, verbose_name=_("Features Sum")
+    )
+    ease_of_use_sum = models.PositiveIntegerField(
+        default=0, verbose_name=_("Ease of Use Sum")
+    )
+    design_sum = models.PositiveIntegerField(default=0, verbose_name=_("Design Sum"))
+    average = models.FloatField(
+        null=True, blank=True, db_index=True, verbose_name=_("Average Rating")
+    )
+    datetime_updated = models.DateTimeField(
+        default=timezone.now, verbose_name=_("Updated At")
+    )
+
+    class Meta:
+        verbose_name = _("Product Rating")
+        verbose_name_plural = _("Product Ratings")
+
+    def __str__(self):
+        return f"{self.product_id}: {self.average} ({self.comment_count})"
+
+
+class RelatedProducts(models.Model):
+    """
+    The ranked ids of the products shown as related to a product.
+
+    Computed in the background by ``store.related``, so the product page
+    reads them with the product itself.
+    """
+
+    product = models.OneToOneField(
+        Product,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="related_products",
+        verbose_name=_("Product"),
+    )
+    product_ids = models.JSONField(default=list, verbose_name=_("Related Products"))
+    datetime_updated = models.DateTimeField(
+        default=timezone.now, verbose_name=_("Updated At")
+    )
+
+    class Meta:
+        verbose_name = _("Related Products")
+        verbose_name_plural = _("Related Products")
+
+    def __str__(self):
+        return f"{self.product_id}: {self.product_ids}"
+
+
+class ProductRecommendations(models.Model):
+    """
+    The products most often viewed or bought by the customers who viewed or
+    bought a product.
+
+    Computed in the background by ``store.recommendations`` from
+    ``UserHistory`` and ``OrderItem``.
+    """
+
+    product = models.OneToOneField(
+        Product,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="recommendations",
+        verbose_name=_("Product"),
+    )
+    also_viewed = models.JSONField(default=list, verbose_name=_("Also Viewed"))
+    also_bought = models.JSONField(default=list, verbose_name=_("Also Bought"))
+    datetime_updated = models.DateTimeField(
+        default=timezone.now, verbose_name=_("Updated At")
+    )
+
+    class Meta:
+        verbose_name = _("Product Recommendations")
+        verbose_name_plural = _("Product Recommendations")
+
+    def __str__(self):
+        return f"{self.product_id}: {self.also_viewed} / {self.also_bought}"
+
+
 class Customer(models.Model):
     user = models.OneToOneField(
         settings.AUTH_USER_MODEL,
@@ -377,6 +556,77 @@ class Address(models.Model):
         return f"{self.customer.full_name} - {self.city}, {self.province}"
 
 
+class CartSummary(NamedTuple):
+    """Totals of a cart."""
+
+    num_of_items: int = 0
+    total_price: int = 0
+    total_old_price: int = 0
+    total_discount_price: int = 0
+
+    @classmethod
+    def from_lines(cls, lines):
+        """
+        Sum cart lines built with :func:`store.cart.cart_line`, e.g. the
+        lines of a session cart.
+        """
+
+        num_of_items = total_price = total_old_price = 0
+        for line in lines:
+            num_of_items += line["quantity"]
+            total_price += line["total_price"]
+            total_old_price += line["total_old_price"]
+        return cls(
+            num_of_items, total_price, total_old_price, total_old_price - total_price
+        )
+
+
+def cart_summary_aggregates(prefix=""):
+    """
+    Build the aggregate expressions behind :class:`CartSummary`.
+
+    The unit price follows :func:`store.utils.get_unit_price`: a discount
+    price of zero counts as no discount.
+
+    Args:
+        prefix (str): Lookup path from the queried model to ``CartItem``,
+            e.g. ``"items__"`` when annotating carts.
+
+    Returns:
+        dict: Keyword arguments for ``aggregate()`` or ``annotate()``, named
+        ``summary_<field>``.
+    """
+
+    quantity = F(f"{prefix}quantity")
+    price = F(f"{prefix}product__price")
+    unit_price = Coalesce(NullIf(f"{prefix}product__discount_price", Value(0)), price)
+    return {
+        "summary_num_of_items": Coalesce(Sum(quantity), 0),
+        "summary_total_price": Coalesce(Sum(unit_price * quantity), 0),
+        "summary_total_old_price": Coalesce(Sum(price * quantity), 0),
+    }
+
+
+def build_cart_summary(totals):
+    return CartSummary(
+        num_of_items=totals["summary_num_of_items"],
+        total_price=totals["summary_total_price"],
+        total_old_price=totals["summary_total_old_price"],
+        total_discount_price=(
+            totals["summary_total_old_price"] - totals["summary_total_price"]
+        ),
+    )
+
+
+class CartQuerySet(models.QuerySet):
+    def with_summary(self):
+        """
+        Annotate every cart with the totals read by :meth:`Cart.summary`.
+        """
+
+        return self.annotate(**cart_summary_aggregates("items__"))
+
+
 class Cart(models.Model):
     id = models.UUIDField(_("id"), default=uuid.uuid4, primary_key=True)
     customer = models.ForeignKey(
@@ -388,7 +638,11 @@ class Cart(models.Model):
     datetime_created = models.DateTimeField(
         auto_now_add=True, verbose_name=_("Created At")
     )
-    datetime_updated = models.DateTimeField(auto_now=True, verbose_name=_("Updated At"))
+    datetime_updated = models.DateTimeField(
+        auto_now=True, db_index=True, verbose_name=_("Updated At")
+    )
+
+    objects = CartQuerySet.as_manager()
 
     class Meta:
         verbose_name = _("Cart")
@@ -398,29 +652,34 @@ class Cart(models.Model):
     def __str__(self):
         return f"Cart of {self.customer.full_name} - {self.num_of_items} items"
 
+    def summary(self):
+        """
+        Return the cart totals as an immutable :class:`CartSummary`.
+
+        Carts fetched with ``Cart.objects.with_summary()`` reuse their
+        annotations; otherwise the totals are computed with one aggregate
+        query over the cart items joined to their products.
+        """
+
+        if hasattr(self, "summary_num_of_items"):
+            return build_cart_summary(self.__dict__)
+        return build_cart_summary(self.items.aggregate(**cart_summary_aggregates()))
+
     @property
     def total_price(self):
-        cart_items = self.items.all()
-        total = sum([item.total_item_price for item in cart_items])
-        return total
+        return self.summary().total_price
 
     @property
     def total_old_price(self):
-        cart_items = self.items.all()
-        total = sum([item.total_item_old_price for item in cart_items])
-        return total
+        return self.summary().total_old_price
 
     @property
     def total_discount_price(self):
-        cart_items = self.items.all()
-        total = sum([item.total_discount_price for item in cart_items])
-        return total
+        return self.summary().total_discount_price
 
     @property
     def num_of_items(self):
-        cart_items = self.items.all()
-        quantity = sum([item.quantity for item in cart_items])
-        return quantity
+        return self.summary().num_of_items
 
 
 class CartItem(models.Model):
@@ -447,10 +706,11 @@ class CartItem(models.Model):
 
     @property
     def total_discount_price(self):
-        if self.product.discount_price is not None:
-            discount = self.product.price - self.product.discount_price
-            return discount * self.quantity
-        return 0
+        return (self.product.price - self.unit_price) * self.quantity
+
+    @property
+    def unit_price(self):
+        return get_unit_price(self.product.price, self.product.discount_price)
 
     @property
     def total_item_old_price(self):
@@ -458,17 +718,42 @@ class CartItem(models.Model):
 
     @property
     def total_item_price(self):
-        price_to_use = (
-            self.product.discount_price
-            if self.product.discount_price is not None
-            else self.product.price
-        )
-        return price_to_use * self.quantity
+        return self.unit_price * self.quantity
 
     def __str__(self):
         return f"{self.quantity} x {self.product.title}"
 
 
+class StockReservation(models.Model):
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name="reservations",
+        verbose_name=_("Product"),
+    )
+    holder = models.CharField(max_length=64, verbose_name=_("Holder"))
+    quantity = models.PositiveIntegerField(
+        validators=[MinValueValidator(1)], verbose_name=_("Quantity")
+    )
+    expires_at = models.DateTimeField(db_index=True, verbose_name=_("Expires At"))
+    datetime_created = models.DateTimeField(
+        auto_now_add=True, verbose_name=_("Created At")
+    )
+
+    class Meta:
+        verbose_name = _("Stock Reservation")
+        verbose_name_plural = _("Stock Reservations")
+        ordering = ["expires_at"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["holder", "product"], name="unique_stock_reservation"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} for {self.holder}"
+
+
 class Order(models.Model):
     STATUS_CHOICES = (
         ("pending", _("Pending")),
@@ -499,6 +784,14 @@ class Order(models.Model):
         verbose_name=_("Status"),
     )
     payment_method = models.CharField(max_length=50, verbose_name=_("Payment Method"))
+    cart_key = models.UUIDField(
+        null=True,
+        blank=True,
+        unique=True,
+        editable=False,
+        verbose_name=_("Cart Key"),
+        help_text=_("Id of the cart the order was placed from."),
+    )
     datetime_created = models.DateTimeField(
         auto_now_add=True, verbose_name=_("Created At")
     )
@@ -643,12 +936,8 @@ class Answer(models.Model):
     )
     text = models.TextField(verbose_name=_("Answer Text"))
     is_approved = models.BooleanField(default=False, verbose_name=_("Is Approved"))
-    likes = models.ManyToManyField(
-        settings.AUTH_USER_MODEL, related_name="liked_answers", blank=True
-    )
-    dislikes = models.ManyToManyField(
-        settings.AUTH_USER_MODEL, related_name="disliked_answers", blank=True
-    )
+    num_likes = models.PositiveIntegerField(default=0, verbose_name=_("Likes"))
+    num_dislikes = models.PositiveIntegerField(default=0, verbose_name=_("Dislikes"))
     datetime_created = models.DateTimeField(
         auto_now_add=True, verbose_name=_("Created At")
     )
@@ -660,6 +949,57 @@ class Answer(models.Model):
         ordering = ["-datetime_created"]
 
 
+class Vote(models.Model):
+    """
+    A like or dislike of a user on a comment or an answer.
+
+    A user votes once per object, which the unique constraint enforces, so a
+    vote is a single insert. ``Comment`` and ``Answer`` keep the resulting
+    totals in ``num_likes`` and ``num_dislikes``.
+    """
+
+    COMMENT = "comment"
+    ANSWER = "answer"
+    KIND_CHOICES = [
+        (COMMENT, _("Comment")),
+        (ANSWER, _("Answer")),
+    ]
+    LIKE = "like"
+    DISLIKE = "dislike"
+    VALUE_CHOICES = [
+        (LIKE, _("Like")),
+        (DISLIKE, _("Dislike")),
+    ]
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="votes",
+        verbose_name=_("User"),
+    )
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, verbose_name=_("Kind"))
+    object_id = models.PositiveBigIntegerField(verbose_name=_("Object ID"))
+    value = models.CharField(
+        max_length=10, choices=VALUE_CHOICES, verbose_name=_("Value")
+    )
+    datetime_created = models.DateTimeField(
+        auto_now_add=True, verbose_name=_("Created At")
+    )
+
+    class Meta:
+        verbose_name = _("Vote")
+        verbose_name_plural = _("Votes")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "kind", "object_id"], name="unique_vote"
+            ),
+        ]
+        indexes = [models.Index(fields=["kind", "object_id"])]
+
+    def __str__(self):
+        return f"{self.user} {self.value}s {self.kind} {self.object_id}"
+
+
 # pages model
 class ContactMessage(models.Model):
     SUBJECT_CHOICES = [
@@ -686,7 +1026,9 @@ class ContactMessage(models.Model):
         blank=True,
         verbose_name=_("Attachment"),
     )
-    created_at = models.DateTimeField(auto_now_add=True, verbose_name=_("Created At"))
+    created_at = models.DateTimeField(
+        auto_now_add=True, db_index=True, verbose_name=_("Created At")
+    )
 
     class Meta:
         verbose_name = _("Contact Message")
@@ -767,7 +1109,7 @@ class SearchLog(models.Model):
         blank=True,
     )
     datetime_created = models.DateTimeField(
-        auto_now_add=True, verbose_name=_("Created At")
+        auto_now_add=True, db_index=True, verbose_name=_("Created At")
     )
 
     class Meta:
@@ -0,0 +1,90 @@
+"""
+Persian text normalization shared by indexing and query parsing.
+
+Both stored search text and user queries go through the same mapping so
+that equivalent spellings compare equal with a plain (indexable) lookup
+instead of case-folding or character juggling at query time.
+"""
+
+ARABIC_TO_PERSIAN = {
+    "ي": "ی",  # Arabic yeh
+    "ى": "ی",  # Alef maksura
+    "ئ": "ی",  # Yeh with hamza above
+    "ك": "ک",  # Arabic kaf
+    "ة": "ه",  # Teh marbuta
+    "ۀ": "ه",  # Heh with yeh above
+    "أ": "ا",  # Alef with hamza above
+    "إ": "ا",  # Alef with hamza below
+    "ٱ": "ا",  # Alef wasla
+    "ؤ": "و",  # Waw with hamza above
+}
+
+PERSIAN_DIGITS = "۰۱۲۳۴۵۶۷۸۹"
+ARABIC_DIGITS = "٠١٢٣٤٥٦٧٨٩"
+
+# Harakat, tanwin, superscript alef and tatweel carry no meaning for search.
+IGNORED_CHARACTERS = [chr(code) for code in range(0x064B, 0x0660)] + [
+    "\u0670",  # Superscript alef
+    "\u0640",  # Tatweel
+    "\u200c",  # Zero width non-joiner
+    "\u200d",  # Zero width joiner
+    "\u200e",  # Left-to-right mark
+    "\u200f",  # Right-to-left mark
+    "\ufeff",  # Zero width no-break space
+]
+
+_TRANSLATION_TABLE = str.maketrans(
+    {
+        **ARABIC_TO_PERSIAN,
+        **{digit: str(value) for value, digit in enumerate(PERSIAN_DIGITS)},
+        **{digit: str(value) for value, digit in enumerate(ARABIC_DIGITS)},
+        **{character: None for character in IGNORED_CHARACTERS},
+    }
+)
+
+# Separator used to normalize a whole batch with a single translate() call.
+_BATCH_SEPARATOR = "\x00"
+
+
+def normalize_text(text):
+    """
+    Normalize Persian/English text for search.
+
+    Unifies Arabic and Persian letter forms, converts Persian and Arabic
+    digits to ASCII, drops diacritics, tatweel and zero-width characters,
+    case-folds and collapses whitespace.
+
+    Args:
+        text (str or None): Raw text.
+
+    Returns:
+        str: Normalized text, empty for ``None``.
+    """
+
+    if not text:
+        return ""
+    return " ".join(text.translate(_TRANSLATION_TABLE).casefold().split())
+
+
+def normalize_texts(texts):
+    """
+    Normalize a batch of texts in one pass.
+
+    The batch is joined and translated with a single ``str.translate``
+    call, which is much faster than normalizing values one by one when
+    backfilling the catalog.
+
+    Args:
+        texts (Iterable[str or None]): Raw texts.
+
+    Returns:
+        list[str]: Normalized texts in the same order.
+    """
+
+    texts = [(text or "").replace(_BATCH_SEPARATOR, "") for text in texts]
+    if not texts:
+        return []
+
+    joined = _BATCH_SEPARATOR.join(texts)
+    normalized = joined.translate(_TRANSLATION_TABLE).casefold()
+    return [" ".join(part.split()) for part in normalized.split(_BATCH_SEPARATOR)]
@@ -0,0 +1,140 @@
+"""
+Keyset (cursor) pagination for product listings.
+
+Instead of ``OFFSET`` and a ``COUNT(*)``, every page is fetched with a
+``WHERE (sort_key, pk) < (last_sort_key, last_pk)`` condition built from the
+last row of the previous page, so deep pages cost the same as the first one
+and rows inserted meanwhile never shift the pages.
+"""
+
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core import signing
+from django.db.models import Q
+
+PRODUCT_PAGE_SIZE = 24
+CURSOR_SALT = "store.pagination.cursor"
+
+
+class KeysetPage:
+    """
+    A page of results and the cursor of the next one.
+
+    Iterates like a list so templates can loop over it directly.
+    """
+
+    def __init__(self, items, next_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+
+def _get_ordering(queryset):
+    """
+    Return the queryset ordering with the primary key as a final tiebreaker.
+    """
+
+    ordering = [
+        field
+        for field in (queryset.query.order_by or queryset.model._meta.ordering)
+        if isinstance(field, str)
+    ]
+    names = {field.lstrip("-") for field in ordering}
+    if not names & {"pk", queryset.model._meta.pk.name}:
+        descending = bool(ordering) and ordering[-1].startswith("-")
+        ordering.append("-pk" if descending else "pk")
+    return ordering
+
+
+def _serialize(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def encode_cursor(values):
+    return signing.dumps([_serialize(value) for value in values], salt=CURSOR_SALT)
+
+
+def decode_cursor(cursor, length):
+    """
+    Return the sort values stored in ``cursor``, or ``None`` if it is
+    missing, tampered with or belongs to a different ordering.
+    """
+
+    if not cursor:
+        return None
+    try:
+        values = signing.loads(cursor, salt=CURSOR_SALT)
+    except signing.BadSignature:
+        return None
+    if not isinstance(values, list) or len(values) != length:
+        return None
+    return values
+
+
+def _after(ordering, values):
+    """
+    Build the condition selecting rows that sort after ``values``.
+    """
+
+    condition = Q()
+    for index, field in enumerate(ordering):
+        name = field.lstrip("-")
+        lookup = "lt" if field.startswith("-") else "gt"
+        step = Q(**{f"{name}__{lookup}": values[index]})
+        for previous, value in zip(ordering[:index], values[:index]):
+            step &= Q(**{previous.lstrip("-"): value})
+        condition |= step
+    return condition
+
+
+def paginate_keyset(queryset, cursor=None, page_size=PRODUCT_PAGE_SIZE):
+    """
+    Return one page of ``queryset`` after the position in ``cursor``.
+
+    The queryset's own ordering is used as the key, so any field or
+    annotation it is ordered by (price, creation date, rating, relevance)
+    works as long as it is not null.
+
+    Args:
+        queryset (QuerySet): An ordered queryset.
+        cursor (str or None): The ``next_cursor`` of the previous page.
+        page_size (int): Number of items per page.
+
+    Returns:
+        KeysetPage: The items and the cursor of the following page.
+    """
+
+    ordering = _get_ordering(queryset)
+    queryset = queryset.order_by(*ordering)
+
+    values = decode_cursor(cursor, len(ordering))
+    if values is not None:
+        queryset = queryset.filter(_after(ordering, values))
+
+    items = list(queryset[: page_size + 1])
+    if len(items) <= page_size:
+        return KeysetPage(items)
+
+    items = items[:page_size]
+    last = items[-1]
+    return KeysetPage(
+        items,
+        encode_cursor([getattr(last, field.lstrip("-")) for field in ordering]),
+    )
@@ -0,0 +1,128 @@
+"""
+Cached HTML of product cards.
+
+Each card is rendered once per product version and template, and a
+listing reads all of its cards with a single ``get_many``. The version is
+the ``Product.card_version`` counter, loaded with the listing rows, so the
+keys are known without another round trip; it is bumped whenever a
+product, its colors or its rating change, and outdated fragments simply
+expire.
+
+Cart and favorite buttons depend on the visitor, so the cached fragments
+hold markers that are swapped for the matching button per request.
+"""
+
+from functools import lru_cache
+
+from django.core.cache import cache
+from django.db.models import F, prefetch_related_objects
+from django.template.loader import render_to_string
+
+from .models import Product
+
+PRODUCT_CARD_TEMPLATE = "store/partials/product-card.html"
+PRODUCT_CARD_CACHE_KEY = "product_card:{template}:{product_id}:{version}"
+PRODUCT_CARD_TIMEOUT = 24 * 3600
+CART_ACTION_MARKER = "<!-- cart-action -->"
+FAVORITE_ACTION_MARKER = "<!-- favorite-action -->"
+PRODUCT_ID_PLACEHOLDER = "__product_id__"
+
+
+def bump_card_versions(product_ids=None):
+    """
+    Move products to a new card version so their cached cards are rebuilt.
+
+    Args:
+        product_ids (Iterable[int] or QuerySet or None): Products to bump,
+            all if None.
+    """
+
+    products = Product.objects.all()
+    if product_ids is not None:
+        products = products.filter(pk__in=product_ids)
+    products.update(card_version=F("card_version") + 1)
+
+
+@lru_cache(maxsize=None)
+def _action_buttons(template, flag):
+    """
+    Return a button rendered for both states, with the product id left as
+    a placeholder, once per process.
+    """
+
+    return {
+        state: render_to_string(
+            template, {flag: state, "product_id": PRODUCT_ID_PLACEHOLDER}
+        )
+        for state in (False, True)
+    }
+
+
+def _card_key(template, product):
+    return PRODUCT_CARD_CACHE_KEY.format(
+        template=template, product_id=product.pk, version=product.card_version
+    )
+
+
+def render_product_cards(
+    products, cart_ids=(), favorite_ids=(), template=PRODUCT_CARD_TEMPLATE
+):
+    """
+    Return the HTML of the cards of ``products``.
+
+    Cached fragments are read with one ``get_many``; missing ones are
+    rendered, after prefetching their colors in one query, and stored with
+    one ``set_many``.
+
+    Args:
+        products (Iterable[Product]): Products annotated by
+            ``with_rating()``.
+        cart_ids (Iterable[int]): Products in the visitor's cart.
+        favorite_ids (Iterable[int]): The visitor's favorite products.
+        template (str): The card template.
+
+    Returns:
+        list[str]: One card per product, in order.
+    """
+
+    products = list(products)
+    keys = [_card_key(template, product) for product in products]
+    fragments = cache.get_many(keys)
+
+    missing = [product for product, key in zip(products, keys) if key not in fragments]
+    if missing:
+        prefetch_related_objects(missing, "colors")
+        rendered = {
+            _card_key(template, product): render_to_string(
+                template, {"product": product}
+            )
+            for product in missing
+        }
+        cache.set_many(rendered, timeout=PRODUCT_CARD_TIMEOUT)
+        fragments.update(rendered)
+
+    cart_ids, favorite_ids = set(cart_ids), set(favorite_ids)
+    cart_buttons = _action_buttons(
+        "store/partials/product-card-cart-action.html", "in_cart"
+    )
+    favorite_buttons = _action_buttons(
+        "store/partials/product-card-favorite-action.html", "in_favorite"
+    )
+
+    cards = []
+    for product, key in zip(products, keys):
+        product_id = str(product.pk)
+        cart_button = cart_buttons[product.pk in cart_ids]
+        favorite_button = favorite_buttons[product.pk in favorite_ids]
+        cards.append(
+            fragments[key]
+            .replace(
+                CART_ACTION_MARKER,
+                cart_button.replace(PRODUCT_ID_PLACEHOLDER, product_id),
+            )
+            .replace(
+                FAVORITE_ACTION_MARKER,
+                favorite_button.replace(PRODUCT_ID_PLACEHOLDER, product_id),
+            )
+        )
+    return cards
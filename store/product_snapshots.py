@@ -0,0 +1,81 @@
+from django.core.cache import cache
+
+from .models import Product
+
+PRODUCT_SNAPSHOT_CACHE_KEY = "product_snapshot:{product_id}"
+PRODUCT_SNAPSHOT_TIMEOUT = 24 * 3600
+
+
+def product_snapshot(product):
+    """
+    Return the product fields cart templates need as a plain dict.
+
+    Snapshots are cheap to cache and to unpickle compared to model
+    instances, and keep rendering the cart free of lazy relation lookups.
+    Stock is left out: it changes with every reservation, and keeping it
+    would mean dropping the snapshot, and every cart summary holding the
+    product, on each add to cart.
+    """
+
+    return {
+        "id": product.id,
+        "title": product.title,
+        "url": product.get_absolute_url(),
+        "image_url": product.image.url if product.image else "",
+        "brand": str(product.brand),
+        "brand_url": product.brand.get_absolute_url(),
+        "price": product.price,
+        "discount_price": product.discount_price,
+    }
+
+
+def get_product_snapshots(product_ids):
+    """
+    Return snapshots of the given products, shared by all carts.
+
+    Snapshots are read with a single ``get_many`` and only the misses are
+    loaded from the database and written back. Products that no longer
+    exist are left out of the result.
+
+    Args:
+        product_ids (Iterable[int or str]): Ids of the products.
+
+    Returns:
+        dict: Snapshot dicts keyed by integer product id.
+    """
+
+    product_ids = {int(product_id) for product_id in product_ids}
+    if not product_ids:
+        return {}
+
+    keys = {
+        PRODUCT_SNAPSHOT_CACHE_KEY.format(product_id=product_id): product_id
+        for product_id in product_ids
+    }
+    snapshots = {
+        keys[key]: snapshot for key, snapshot in cache.get_many(list(keys)).items()
+    }
+
+    missing_ids = product_ids - snapshots.keys()
+    if missing_ids:
+        products = Product.objects.filter(id__in=missing_ids).select_related("brand")
+        fetched = {product.id: product_snapshot(product) for product in products}
+        cache.set_many(
+            {
+                PRODUCT_SNAPSHOT_CACHE_KEY.format(product_id=product_id): snapshot
+                for product_id, snapshot in fetched.items()
+            },
+            timeout=PRODUCT_SNAPSHOT_TIMEOUT,
+        )
+        snapshots.update(fetched)
+
+    return snapshots
+
+
+def invalidate_product_snapshots(product_ids):
+    cache.delete_many(
+        [
+            PRODUCT_SNAPSHOT_CACHE_KEY.format(product_id=product_id)
+            for product_id in product_ids
+        ]
+    )
@@ -0,0 +1,206 @@
+from django.db.models import Case, Count, F, FloatField, Sum, Value, When
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from .models import Comment, Product, ProductRating
+from .product_cards import bump_card_versions
+
+RATING_FIELDS = (
+    "build_quality",
+    "value_for_price",
+    "innovation",
+    "features",
+    "ease_of_use",
+    "design",
+)
+SUM_FIELDS = tuple(f"{field}_sum" for field in RATING_FIELDS)
+
+
+def comment_rating_state(comment):
+    """
+    Return what a comment contributes to its product rating.
+
+    Args:
+        comment (Comment or dict): A comment, or its ``values()`` row.
+
+    Returns:
+        dict or None: Product id and scores, ``None`` if not approved.
+    """
+
+    if comment is None:
+        return None
+    get = comment.get if isinstance(comment, dict) else comment.__dict__.get
+    if not get("is_approved"):
+        return None
+    return {
+        "product_id": get("product_id"),
+        **{field: get(field) or 0 for field in RATING_FIELDS},
+    }
+
+
+def get_comment_rating_state(comment_pk):
+    row = (
+        Comment.objects.filter(pk=comment_pk)
+        .values("product_id", "is_approved", *RATING_FIELDS)
+        .first()
+    )
+    return comment_rating_state(row)
+
+
+def _apply_rating_delta(product_id, count, scores):
+    ProductRating.objects.get_or_create(product_id=product_id)
+
+    new_count = F("comment_count") + count
+    new_sums = {
+        f"{field}_sum": F(f"{field}_sum") + scores[field] for field in RATING_FIELDS
+    }
+    total = sum(new_sums.values(), Value(0))
+    ProductRating.objects.filter(product_id=product_id).update(
+        comment_count=new_count,
+        **new_sums,
+        # SET expressions see the old row, so the average is derived from
+        # the same deltas instead of the updated columns.
+        average=Case(
+            When(
+                comment_count__gt=-count,
+                then=Cast(total, FloatField()) / (Cast(new_count, FloatField()) * 6),
+            ),
+            default=None,
+            output_field=FloatField(),
+        ),
+        datetime_updated=timezone.now(),
+    )
+    bump_card_versions([product_id])
+
+
+def apply_comment_rating_change(before, after):
+    """
+    Move a comment's contribution between rating states.
+
+    Each argument is a :func:`comment_rating_state`; the old contribution
+    is subtracted and the new one added with ``F()`` updates, so concurrent
+    changes to comments of one product never overwrite each other.
+    """
+
+    if before == after:
+        return
+
+    deltas = {}
+    for state, sign in ((before, -1), (after, 1)):
+        if state is None:
+            continue
+        count, scores = deltas.setdefault(
+            state["product_id"], [0, dict.fromkeys(RATING_FIELDS, 0)]
+        )
+        deltas[state["product_id"]][0] = count + sign
+        for field in RATING_FIELDS:
+            scores[field] += sign * state[field]
+
+    for product_id, (count, scores) in deltas.items():
+        if count or any(scores.values()):
+            _apply_rating_delta(product_id, count, scores)
+
+
+def recompute_product_ratings(product_ids=None):
+    """
+    Rebuild rating rows from approved comments.
+
+    Runs one grouped query over comments, one read of the stored ratings
+    and one upsert of the rows whose totals changed, so it is used for the
+    nightly reconcile and after bulk approvals that skip signals. Only the
+    cards of those products are moved to a new version.
+
+    Args:
+        product_ids (Iterable[int] or None): Products to rebuild, all if None.
+
+    Returns:
+        int: Number of rating rows written.
+    """
+
+    comments = Comment.objects.filter(is_approved=True)
+    products = Product.objects.all()
+    ratings = ProductRating.objects.all()
+    if product_ids is not None:
+        product_ids = list(product_ids)
+        comments = comments.filter(product_id__in=product_ids)
+        products = products.filter(pk__in=product_ids)
+        ratings = ratings.filter(product_id__in=product_ids)
+
+    totals = {
+        row["product_id"]: row
+        for row in comments.values("product_id").annotate(
+            comment_count=Count("pk"),
+            **{f"{field}_sum": Sum(field) for field in RATING_FIELDS},
+        )
+    }
+    stored = {
+        product_id: tuple(values)
+        for product_id, *values in ratings.values_list(
+            "product_id", "comment_count", *SUM_FIELDS
+        ).iterator()
+    }
+
+    now = timezone.now()
+    changed = []
+    for product_id in products.values_list("pk", flat=True).iterator():
+        row = totals.get(product_id, {})
+        count = row.get("comment_count", 0)
+        sums = {field: row.get(field) or 0 for field in SUM_FIELDS}
+        if stored.get(product_id) == (count, *sums.values()):
+            continue
+        changed.append(
+            ProductRating(
+                product_id=product_id,
+                comment_count=count,
+                average=sum(sums.values()) / (count * 6) if count else None,
+                datetime_updated=now,
+                **sums,
+            )
+        )
+
+    if changed:
+        ProductRating.objects.bulk_create(
+            changed,
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=["product"],
+            update_fields=[
+                "comment_count",
+                *SUM_FIELDS,
+                "average",
+                "datetime_updated",
+            ],
+        )
+        bump_card_versions([rating.product_id for rating in changed])
+    return len(changed)
+
+
+def get_rating_averages(product):
+    """
+    Return the per-dimension and overall averages shown on product pages.
+    """
+
+    try:
+        rating = product.rating
+    except ProductRating.DoesNotExist:
+        rating = None
+
+    if rating is None or not rating.comment_count:
+        averages = dict.fromkeys(RATING_FIELDS, 0.0)
+        total_avg = 0.0
+    else:
+        averages = {
+            field: round(getattr(rating, f"{field}_sum") / rating.comment_count, 1)
+            for field in RATING_FIELDS
+        }
+        total_avg = round(rating.average, 1)
+
+    return {
+        "avg_quality": averages["build_quality"],
+        "avg_value": averages["value_for_price"],
+        "avg_innovation": averages["innovation"],
+        "avg_features": averages["features"],
+        "avg_ease_of_use": averages["ease_of_use"],
+        "avg_design": averages["design"],
+        "total_avg": total_avg,
+    }
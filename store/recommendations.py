@@ -0,0 +1,297 @@
+"""
+"Customers who viewed this also viewed" and "also bought" recommendations.
+
+Neighbors come from a sparse item-to-item co-occurrence matrix. The
+products a customer viewed (``UserHistory``) or bought (``OrderItem``) form
+a basket, and two products co-occur once per customer whose basket holds
+both. Rows are ``{product_id: count}`` dicts, the dictionary-of-keys layout
+of a sparse matrix, built in blocks of ``RECOMMENDATION_BLOCK_SIZE``
+products: every block scans the baskets again but only keeps its own rows,
+so memory is bounded by the block and not by the catalog. Counts are
+normalized with cosine similarity so best sellers do not top every list,
+and the best ``RECOMMENDATION_LIMIT`` neighbors of each product are stored
+in ``ProductRecommendations``.
+
+The nightly task rebuilds every row. The periodic task reads the baskets
+that changed since its last run and rebuilds only the rows of the products
+in them. Changes are found by when rows were written, not when the visit
+happened, since buffered visits reach the database minutes later.
+"""
+
+import heapq
+import math
+from collections import Counter
+from itertools import groupby
+from typing import Callable, NamedTuple
+
+from django.core.cache import cache
+from django.db.models import Count, QuerySet
+from django.utils import timezone
+
+from users.models import UserHistory
+
+from .models import OrderItem, Product, ProductRecommendations
+
+RECOMMENDATION_LIMIT = 12
+RECOMMENDATION_BLOCK_SIZE = 5000
+# Longer baskets, e.g. crawlers, are cut to their latest products since
+# every basket adds the square of its size to the matrix.
+RECOMMENDATION_MAX_BASKET_SIZE = 200
+RECOMMENDATION_QUERY_CHUNK_SIZE = 10000
+RECOMMENDATION_WRITE_BATCH_SIZE = 500
+RECOMMENDATIONS_UPDATED_AT_KEY = "recommendations:updated_at"
+
+
+class BasketSource(NamedTuple):
+    """
+    Where the baskets of one kind of recommendation come from.
+    """
+
+    field: str
+    get_queryset: Callable[[], QuerySet]
+    customer_field: str
+    product_field: str
+    time_field: str
+    written_field: str
+
+
+BASKET_SOURCES = (
+    BasketSource(
+        "also_viewed",
+        lambda: UserHistory.objects.all(),
+        "customer_id",
+        "product_id",
+        "datetime_visited",
+        "datetime_recorded",
+    ),
+    BasketSource(
+        "also_bought",
+        lambda: OrderItem.objects.exclude(order__status="canceled"),
+        "order__customer_id",
+        "product_id",
+        "datetime_created",
+        "datetime_created",
+    ),
+)
+
+
+def load_baskets(source, customer_ids=None, product_ids=None):
+    """
+    Return the baskets of every customer, or only of the given customers or
+    of the customers holding one of the given products.
+
+    Returns:
+        list[tuple[int]]: Distinct product ids per customer, latest first.
+    """
+
+    rows = source.get_queryset()
+    if customer_ids is not None:
+        rows = rows.filter(**{f"{source.customer_field}__in": customer_ids})
+    if product_ids is not None:
+        holders = (
+            source.get_queryset()
+            .filter(**{f"{source.product_field}__in": product_ids})
+            .values(source.customer_field)
+        )
+        rows = rows.filter(**{f"{source.customer_field}__in": holders})
+    rows = (
+        rows.order_by(source.customer_field, f"-{source.time_field}")
+        .values_list(source.customer_field, source.product_field)
+        .iterator(chunk_size=RECOMMENDATION_QUERY_CHUNK_SIZE)
+    )
+
+    baskets = []
+    for _, products in groupby(rows, key=lambda row: row[0]):
+        basket = tuple(dict.fromkeys(product_id for _, product_id in products))
+        if len(basket) > 1:
+            baskets.append(basket[:RECOMMENDATION_MAX_BASKET_SIZE])
+    return baskets
+
+
+def changed_customers(source, since):
+    return set(
+        source.get_queryset()
+        .filter(**{f"{source.written_field}__gt": since})
+        .values_list(source.customer_field, flat=True)
+        .distinct()
+    )
+
+
+def customer_counts(source):
+    """
+    Return the number of distinct customers of every product.
+    """
+
+    return dict(
+        source.get_queryset()
+        .values_list(source.product_field)
+        .annotate(customers=Count(source.customer_field, distinct=True))
+        .values_list(source.product_field, "customers")
+    )
+
+
+def cooccurrence_rows(baskets, product_ids):
+    """
+    Return the rows of the co-occurrence matrix for ``product_ids``.
+
+    Args:
+        baskets (Iterable[tuple[int]]): Distinct product ids per customer.
+        product_ids (Iterable[int]): The rows to build.
+
+    Returns:
+        dict: ``{product_id: Counter({neighbor_id: customers})}``.
+    """
+
+    rows = {product_id: Counter() for product_id in product_ids}
+    for basket in baskets:
+        for product_id in basket:
+            row = rows.get(product_id)
+            if row is not None:
+                row.update(basket)
+    for product_id, row in rows.items():
+        row.pop(product_id, None)
+    return rows
+
+
+def top_neighbors(product_id, row, customer_counts, limit=RECOMMENDATION_LIMIT):
+    """
+    Return the ``limit`` neighbors of a row with the highest cosine
+    similarity, ``count / sqrt(customers(a) * customers(b))``.
+    """
+
+    own = customer_counts.get(product_id) or 1
+    return [
+        neighbor_id
+        for neighbor_id, _ in heapq.nlargest(
+            limit,
+            row.items(),
+            key=lambda item: (
+                item[1] / math.sqrt(own * (customer_counts.get(item[0]) or 1)),
+                item[1],
+            ),
+        )
+    ]
+
+
+def build_neighbors(
+    baskets, product_ids, customer_counts, block_size=RECOMMENDATION_BLOCK_SIZE
+):
+    """
+    Yield ``{product_id: neighbor_ids}`` for ``product_ids``, one block of
+    rows at a time.
+    """
+
+    product_ids = sorted(product_ids)
+    for start in range(0, len(product_ids), block_size):
+        rows = cooccurrence_rows(baskets, product_ids[start : start + block_size])
+        yield {
+            product_id: top_neighbors(product_id, row, customer_counts)
+            for product_id, row in rows.items()
+        }
+
+
+def _write(field, neighbors, now):
+    ProductRecommendations.objects.bulk_create(
+        [
+            ProductRecommendations(
+                product_id=product_id, datetime_updated=now, **{field: neighbor_ids}
+            )
+            for product_id, neighbor_ids in neighbors.items()
+        ],
+        batch_size=RECOMMENDATION_WRITE_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=["product"],
+        update_fields=[field, "datetime_updated"],
+    )
+
+
+def update_recommendations(since=None):
+    """
+    Recompute stored recommendations.
+
+    Args:
+        since (datetime or None): Only rebuild the rows of products in
+            baskets changed after this time. ``None`` rebuilds every row
+            and clears the rows of products no basket holds anymore.
+
+    Returns:
+        int: Number of rows written.
+    """
+
+    now = timezone.now()
+    written = 0
+    existing = (
+        set(ProductRecommendations.objects.values_list("pk", flat=True))
+        if since is None
+        else set()
+    )
+    empty = set(existing)
+    for source in BASKET_SOURCES:
+        if since is None:
+            baskets = load_baskets(source)
+        else:
+            changed = load_baskets(
+                source, customer_ids=changed_customers(source, since)
+            )
+            affected = {product_id for basket in changed for product_id in basket}
+            if not affected:
+                continue
+            baskets = load_baskets(source, product_ids=affected)
+
+        product_ids = {product_id for basket in baskets for product_id in basket}
+        if since is not None:
+            product_ids &= affected
+        # Stored rows missing from the baskets are cleared.
+        product_ids |= existing
+        counts = customer_counts(source)
+        for neighbors in build_neighbors(baskets, product_ids, counts):
+            _write(source.field, neighbors, now)
+            written += len(neighbors)
+            empty -= {pk for pk, neighbor_ids in neighbors.items() if neighbor_ids}
+
+    if empty:
+        ProductRecommendations.objects.filter(pk__in=empty).delete()
+    return written
+
+
+def update_changed_recommendations():
+    """
+    Rebuild the rows affected by baskets changed since the previous run.
+    """
+
+    since = cache.get(RECOMMENDATIONS_UPDATED_AT_KEY)
+    started = timezone.now()
+    written = update_recommendations(since=since)
+    cache.set(RECOMMENDATIONS_UPDATED_AT_KEY, started, timeout=None)
+    return written
+
+
+def get_recommended_products(product):
+    """
+    Return the active ``also_viewed`` and ``also_bought`` products of
+    ``product`` in rank order, with one query for both lists.
+
+    Args:
+        product (Product): A product loaded with
+            ``select_related("recommendations")``.
+    """
+
+    try:
+        recommendations = product.recommendations
+    except ProductRecommendations.DoesNotExist:
+        return {"also_viewed": [], "also_bought": []}
+
+    products = (
+        Product.objects.filter(
+            pk__in={*recommendations.also_viewed, *recommendations.also_bought},
+            is_active=True,
+        )
+        .prefetch_related("colors")
+        .in_bulk()
+    )
+    return {
+        field: [
+            products[pk] for pk in getattr(recommendations, field) if pk in products
+        ]
+        for field in ("also_viewed", "also_bought")
+    }
@@ -0,0 +1,346 @@
+"""
+Related products.
+
+Every active product gets a ranked list of related products, computed in
+the background and stored in ``RelatedProducts`` so the product page reads
+it together with the product.
+
+Scoring works on bitsets (Python ``int``) over the active products ordered
+by price, like the category facets: every tag, category and brand is a
+bitset of its products, and the candidates of a product are the products
+sharing a tag or a category with it. Scores of all candidates are summed at
+once in a bit-sliced counter, where plane ``i`` holds bit ``i`` of every
+product's score, so adding a weighted feature costs a few ``&`` and ``^``
+over whole bitsets rather than a loop over products. Positions follow the
+price order, so products of a similar price are a contiguous run of bits
+and ties go to the candidates closest in price.
+
+Products whose tags, categories, brand or price change are queued in a
+Redis set; a periodic task recomputes them and their candidates, and a
+nightly rebuild catches the rest of the drift. A new product starts that
+task at once, so its page does not wait for the next periodic run.
+"""
+
+import logging
+from bisect import bisect_left, bisect_right
+
+from django.utils import timezone
+from redis.exceptions import RedisError
+
+from .models import Product, RelatedProducts
+from .utils import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+RELATED_PRODUCT_LIMIT = 8
+RELATED_TAG_WEIGHT = 3
+RELATED_CATEGORY_WEIGHT = 2
+RELATED_BRAND_WEIGHT = 2
+RELATED_PRICE_WEIGHT = 1
+# Products within this share of a product's price count as similar.
+RELATED_PRICE_RANGE = 0.25
+RELATED_DIRTY_KEY = "related_products:dirty"
+RELATED_DIRTY_BATCH_SIZE = 1000
+RELATED_WRITE_BATCH_SIZE = 500
+
+
+def _add_bitset(bitset, index, planes):
+    """
+    Add ``bitset << index`` to the bit-sliced counters in ``planes``.
+    """
+
+    if len(planes) < index:
+        planes.extend([0] * (index - len(planes)))
+    carry = bitset
+    while carry:
+        if index == len(planes):
+            planes.append(carry)
+            return
+        plane = planes[index]
+        planes[index] = plane ^ carry
+        carry &= plane
+        index += 1
+
+
+def _add_weighted(planes, bitset, weight):
+    index = 0
+    while weight:
+        if weight & 1:
+            _add_bitset(bitset, index, planes)
+        weight >>= 1
+        index += 1
+
+
+def _positions(bitset):
+    positions = []
+    while bitset:
+        lowest = bitset & -bitset
+        positions.append(lowest.bit_length() - 1)
+        bitset ^= lowest
+    return positions
+
+
+def _range_mask(start, end):
+    return (1 << end) - (1 << start) if end > start else 0
+
+
+def _closest(mask, position, count):
+    """
+    Return the ``count`` set bits of ``mask`` closest to ``position``.
+    """
+
+    if mask.bit_count() <= count:
+        return _positions(mask)
+    radius = count
+    while True:
+        window = mask & _range_mask(max(position - radius, 0), position + radius + 1)
+        if window.bit_count() >= count:
+            break
+        radius *= 2
+    return sorted(_positions(window), key=lambda bit: abs(bit - position))[:count]
+
+
+def _top_positions(planes, candidates, limit):
+    """
+    Return the positions of up to ``limit`` candidates with the highest
+    scores, walking the counter planes from the most significant one.
+
+    Returns:
+        tuple: The winning positions as a bitset, and the bitset of
+        candidates tied for the last places.
+    """
+
+    chosen = 0
+    remaining = candidates
+    for plane in reversed(planes):
+        high = remaining & plane
+        needed = limit - chosen.bit_count()
+        if high.bit_count() <= needed:
+            chosen |= high
+            remaining &= ~plane
+        else:
+            remaining = high
+        if chosen.bit_count() == limit:
+            return chosen, 0
+    return chosen, remaining
+
+
+def _score(planes, position):
+    return sum((plane >> position & 1) << index for index, plane in enumerate(planes))
+
+
+def _union(bitsets, keys):
+    mask = 0
+    for key in keys:
+        mask |= bitsets[key]
+    return mask
+
+
+def build_related_index():
+    """
+    Build the bitsets of every active product with three queries.
+
+    Returns:
+        dict: Product ids and prices in price order, the tags, categories
+        and brand of every position, and a bitset per tag, category and
+        brand.
+    """
+
+    rows = list(
+        Product.objects.filter(is_active=True)
+        .order_by("price", "pk")
+        .values_list("pk", "brand_id", "price")
+    )
+    positions = {pk: position for position, (pk, _, _) in enumerate(rows)}
+
+    def group(pairs):
+        members = {}
+        bitsets = {}
+        for product_id, key in pairs:
+            position = positions.get(product_id)
+            if position is None or key is None:
+                continue
+            members.setdefault(position, []).append(key)
+            bitsets[key] = bitsets.get(key, 0) | 1 << position
+        return members, bitsets
+
+    product_tags, tags = group(
+        Product.objects.filter(is_active=True, tags__isnull=False).values_list(
+            "pk", "tags"
+        )
+    )
+    product_categories, categories = group(
+        Product.categories.through.objects.filter(product__is_active=True).values_list(
+            "product_id", "category_id"
+        )
+    )
+    brands = {}
+    for position, (_, brand_id, _) in enumerate(rows):
+        brands[brand_id] = brands.get(brand_id, 0) | 1 << position
+
+    return {
+        "ids": [pk for pk, _, _ in rows],
+        "prices": [price for _, _, price in rows],
+        "positions": positions,
+        "brand_of": [brand_id for _, brand_id, _ in rows],
+        "product_tags": product_tags,
+        "product_categories": product_categories,
+        "tags": tags,
+        "categories": categories,
+        "brands": brands,
+    }
+
+
+def candidate_mask(index, position):
+    """
+    Return the products sharing a tag or a category with a product.
+    """
+
+    candidates = _union(
+        index["tags"], index["product_tags"].get(position, ())
+    ) | _union(index["categories"], index["product_categories"].get(position, ()))
+    return candidates & ~(1 << position)
+
+
+def rank_related_products(index, position, limit=RELATED_PRODUCT_LIMIT):
+    """
+    Return the ids of the products most related to the product at
+    ``position``, best first.
+    """
+
+    candidates = candidate_mask(index, position)
+    if not candidates:
+        return []
+
+    planes = []
+    for tag_id in index["product_tags"].get(position, ()):
+        _add_weighted(planes, index["tags"][tag_id], RELATED_TAG_WEIGHT)
+    for category_id in index["product_categories"].get(position, ()):
+        _add_weighted(planes, index["categories"][category_id], RELATED_CATEGORY_WEIGHT)
+    brand_id = index["brand_of"][position]
+    if brand_id is not None:
+        _add_weighted(planes, index["brands"][brand_id], RELATED_BRAND_WEIGHT)
+    prices = index["prices"]
+    price = prices[position]
+    similar_prices = _range_mask(
+        bisect_left(prices, price * (1 - RELATED_PRICE_RANGE)),
+        bisect_right(prices, price * (1 + RELATED_PRICE_RANGE)),
+    )
+    _add_weighted(planes, similar_prices, RELATED_PRICE_WEIGHT)
+
+    chosen, tied = _top_positions(planes, candidates, limit)
+    winners = _positions(chosen)
+    if tied:
+        winners += _closest(tied, position, limit - len(winners))
+    winners.sort(key=lambda bit: (-_score(planes, bit), abs(bit - position)))
+    return [index["ids"][bit] for bit in winners]
+
+
+def update_related_products(product_ids=None):
+    """
+    Recompute and store related products.
+
+    Args:
+        product_ids (Iterable[int] or None): Products whose tags,
+            categories, brand or price changed. They are recomputed with
+            every product sharing a tag or category with them, whose
+            ranking may include them. ``None`` recomputes every product.
+
+    Returns:
+        int: Number of products recomputed.
+    """
+
+    index = build_related_index()
+    if product_ids is None:
+        targets = range(len(index["ids"]))
+    else:
+        affected = 0
+        for product_id in product_ids:
+            position = index["positions"].get(product_id)
+            if position is not None:
+                affected |= 1 << position | candidate_mask(index, position)
+        targets = _positions(affected)
+
+    now = timezone.now()
+    rows = [
+        RelatedProducts(
+            product_id=index["ids"][position],
+            product_ids=rank_related_products(index, position),
+            datetime_updated=now,
+        )
+        for position in targets
+    ]
+    RelatedProducts.objects.bulk_create(
+        rows,
+        batch_size=RELATED_WRITE_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=["product"],
+        update_fields=["product_ids", "datetime_updated"],
+    )
+    return len(rows)
+
+
+def mark_related_products_dirty(product_ids):
+    """
+    Queue products for the next incremental update.
+    """
+
+    product_ids = list(product_ids)
+    if not product_ids:
+        return
+    try:
+        get_redis_client().sadd(RELATED_DIRTY_KEY, *product_ids)
+    except RedisError:
+        logger.warning("Related products queue unavailable, left to the rebuild.")
+
+
+def schedule_related_products_update():
+    """
+    Start the update of queued products now instead of at the next
+    periodic run.
+    """
+
+    from .tasks import update_queued_related_products
+
+    try:
+        update_queued_related_products.delay()
+    except Exception:
+        logger.warning("Could not start the related products update.", exc_info=True)
+
+
+def update_dirty_related_products(batch_size=RELATED_DIRTY_BATCH_SIZE):
+    """
+    Recompute the products queued by :func:`mark_related_products_dirty`.
+
+    Returns:
+        int: Number of products recomputed.
+    """
+
+    product_ids = get_redis_client().spop(RELATED_DIRTY_KEY, batch_size)
+    if not product_ids:
+        return 0
+    return update_related_products({int(product_id) for product_id in product_ids})
+
+
+def get_related_products(product):
+    """
+    Return the active related products of ``product`` in rank order, with
+    one query for the products.
+
+    Args:
+        product (Product): A product loaded with
+            ``select_related("related_products")``.
+    """
+
+    try:
+        product_ids = product.related_products.product_ids
+    except RelatedProducts.DoesNotExist:
+        # Not computed yet, e.g. a new product: queue it for the next update.
+        mark_related_products_dirty([product.pk])
+        return []
+    products = (
+        Product.objects.filter(pk__in=product_ids, is_active=True)
+        .prefetch_related("colors")
+        .in_bulk()
+    )
+    return [products[pk] for pk in product_ids if pk in products]
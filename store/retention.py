@@ -0,0 +1,227 @@
+"""
+Retention of append-heavy tables.
+
+``settings.RETENTION_POLICIES`` maps a model label to the timestamp field
+rows expire by and how long they are kept. A run works through the expired
+rows in chunks of primary keys, each chunk its own short statement, and
+stops once its time budget is spent; the next run picks up where it left
+off, so a large backlog drains over several runs without long locks.
+
+Expired rows are found through the timestamp field, which must be indexed
+(see :func:`check_retention_indexes`), and read in timestamp order a chunk
+at a time. Policies of append-only tables with integer primary keys, where
+keys follow time, may set ``append_only`` to cut the keys between the
+lowest and highest expired one into ranges instead. Tables whose rows are
+updated in place, e.g. upserted visits or carts, must not: their keys do
+not follow the timestamp, so ranges would span mostly live rows.
+
+A policy with ``files`` also deletes the stored files of the purged rows,
+and with ``keep_rows`` only clears those files, keeping the rows.
+"""
+
+import logging
+import time
+from datetime import timedelta
+from typing import NamedTuple
+
+from django.apps import apps
+from django.conf import settings
+from django.core import checks
+from django.db import models
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class RetentionPolicy(NamedTuple):
+    label: str
+    model: type
+    field: str
+    days: int
+    chunk_size: int
+    time_budget: float
+    files: tuple
+    keep_rows: bool
+    append_only: bool
+
+
+class RetentionRun(NamedTuple):
+    label: str
+    purged: int
+    seconds: float
+    finished: bool
+
+    @property
+    def rows_per_second(self):
+        return self.purged / self.seconds if self.seconds else 0.0
+
+
+def get_retention_policy(label):
+    """
+    Build the policy of a model from ``settings.RETENTION_POLICIES``.
+
+    Args:
+        label (str): The model label, e.g. ``"users.UserHistory"``.
+    """
+
+    options = settings.RETENTION_POLICIES[label]
+    return RetentionPolicy(
+        label=label,
+        model=apps.get_model(label),
+        field=options["field"],
+        days=options["days"],
+        chunk_size=options.get("chunk_size", settings.RETENTION_CHUNK_SIZE),
+        time_budget=options.get("time_budget", settings.RETENTION_TIME_BUDGET),
+        files=tuple(options.get("files", ())),
+        keep_rows=options.get("keep_rows", False),
+        append_only=options.get("append_only", False),
+    )
+
+
+def get_retention_policies():
+    return [get_retention_policy(label) for label in settings.RETENTION_POLICIES]
+
+
+def expired_rows(policy, cutoff):
+    """
+    Return the rows of a policy older than ``cutoff``, or with
+    ``keep_rows`` the old rows that still have a file.
+    """
+
+    rows = policy.model._base_manager.filter(**{f"{policy.field}__lt": cutoff})
+    if policy.keep_rows:
+        with_file = Q()
+        for name in policy.files:
+            with_file |= Q(**{f"{name}__isnull": False}) & ~Q(**{name: ""})
+        rows = rows.filter(with_file)
+    return rows
+
+
+def iter_chunks(policy, rows):
+    """
+    Yield querysets of at most ``policy.chunk_size`` rows of ``rows``.
+
+    Chunks are evaluated lazily, so every chunk must be purged before the
+    next one is requested.
+    """
+
+    if policy.append_only and isinstance(policy.model._meta.pk, models.IntegerField):
+        bounds = rows.aggregate(low=Min("pk"), high=Max("pk"))
+        if bounds["low"] is None:
+            return
+        for start in range(bounds["low"], bounds["high"] + 1, policy.chunk_size):
+            yield rows.filter(pk__gte=start, pk__lt=start + policy.chunk_size)
+        return
+
+    while True:
+        pks = list(
+            rows.order_by(policy.field, "pk").values_list("pk", flat=True)[
+                : policy.chunk_size
+            ]
+        )
+        if not pks:
+            return
+        yield rows.filter(pk__in=pks)
+        if len(pks) < policy.chunk_size:
+            return
+
+
+def purge_chunk(policy, chunk):
+    """
+    Delete the rows of a chunk, or clear their files with ``keep_rows``.
+
+    Returns:
+        int: Number of purged rows, not counting cascaded deletes.
+    """
+
+    files = []
+    if policy.files:
+        for values in chunk.values_list(*policy.files):
+            for name, value in zip(policy.files, values):
+                if value:
+                    files.append((policy.model._meta.get_field(name).storage, value))
+
+    if policy.keep_rows:
+        purged = chunk.update(**{name: "" for name in policy.files})
+    else:
+        purged = chunk.delete()[1].get(policy.model._meta.label, 0)
+
+    for storage, name in files:
+        try:
+            storage.delete(name)
+        except OSError:
+            logger.warning(f"Could not delete expired file {name}.")
+    return purged
+
+
+def apply_retention_policy(policy):
+    """
+    Purge the expired rows of a policy until they run out or the time
+    budget of the run is spent.
+
+    Returns:
+        RetentionRun: Purged rows, elapsed seconds and whether every
+        expired row was reached.
+    """
+
+    cutoff = timezone.now() - timedelta(days=policy.days)
+    started = time.monotonic()
+    purged = 0
+    finished = True
+    for chunk in iter_chunks(policy, expired_rows(policy, cutoff)):
+        purged += purge_chunk(policy, chunk)
+        if time.monotonic() - started >= policy.time_budget:
+            finished = False
+            break
+
+    run = RetentionRun(policy.label, purged, time.monotonic() - started, finished)
+    logger.info(
+        f"Purged {run.purged} {policy.label} rows older than {policy.days} days "
+        f"in {run.seconds:.1f} s ({run.rows_per_second:.0f} rows/s)"
+        + ("." if finished else ", time budget spent.")
+    )
+    return run
+
+
+def apply_retention_policies():
+    return [apply_retention_policy(policy) for policy in get_retention_policies()]
+
+
+def _is_indexed(model, field_name):
+    field = model._meta.get_field(field_name)
+    if field.primary_key or field.unique or field.db_index:
+        return True
+    return any(
+        index.fields and index.fields[0].lstrip("-") == field_name
+        for index in model._meta.indexes
+    )
+
+
+def check_retention_indexes(app_configs, **kwargs):
+    """
+    Warn about retention policies on a timestamp field without an index,
+    which would make every run scan the whole table.
+    """
+
+    errors = []
+    for label, options in settings.RETENTION_POLICIES.items():
+        try:
+            model = apps.get_model(label)
+            indexed = _is_indexed(model, options["field"])
+        except (LookupError, KeyError) as error:
+            errors.append(
+                checks.Error(
+                    f"Invalid retention policy {label}: {error}.", id="store.E001"
+                )
+            )
+            continue
+        if not indexed:
+            errors.append(
+                checks.Warning(
+                    f"Retention field {label}.{options['field']} is not indexed.",
+                    hint="Add db_index=True to the field.",
+                    id="store.W001",
+                )
+            )
+    return errors
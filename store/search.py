@@ -0,0 +1,125 @@
+from django.db import connection
+from django.db.models import Case, DecimalField, IntegerField, Value, When
+from django.db.models.functions import Cast
+
+from .models import Product
+from .normalization import normalize_text, normalize_texts
+
+SEARCH_INDEX_BATCH_SIZE = 500
+
+
+def _search_document_source(product):
+    parts = [product.title, product.english_title]
+    parts.extend(tag.name for tag in product.tags.all())
+    if product.brand_id:
+        parts.extend([product.brand.title, product.brand.english_title])
+    parts.extend(category.title for category in product.categories.all())
+    return " ".join(part for part in parts if part)
+
+
+def build_search_document(product):
+    """
+    Build the denormalized text that product search matches against.
+
+    The document joins the product titles, tag names, brand titles and
+    category titles into one normalized string so a single indexed column
+    answers every search instead of joining taggit and categories per query.
+    """
+
+    return normalize_text(_search_document_source(product))
+
+
+def update_search_document(product):
+    """
+    Recompute and store the search document of a single product.
+
+    Uses a queryset update so no model signals fire and
+    ``datetime_updated`` is left untouched.
+    """
+
+    document = build_search_document(product)
+    Product.objects.filter(pk=product.pk).update(search_document=document)
+    product.search_document = document
+
+
+def update_search_documents(products, batch_size=SEARCH_INDEX_BATCH_SIZE):
+    """
+    Recompute the search documents of many products.
+
+    Products are processed in batches: each batch is normalized with a
+    single :func:`normalize_texts` call and written with one
+    ``bulk_update``.
+
+    Args:
+        products (QuerySet): Products to refresh.
+        batch_size (int): Number of products per batch.
+
+    Returns:
+        int: Number of products updated.
+    """
+
+    products = products.select_related("brand").prefetch_related(
+        "tags", "categories"
+    )
+
+    updated = 0
+    batch = []
+    for product in products.iterator(chunk_size=batch_size):
+        batch.append(product)
+        if len(batch) >= batch_size:
+            updated += _write_search_documents(batch)
+            batch = []
+    if batch:
+        updated += _write_search_documents(batch)
+    return updated
+
+
+def _write_search_documents(products):
+    documents = normalize_texts(_search_document_source(p) for p in products)
+    for product, document in zip(products, documents):
+        product.search_document = document
+    Product.objects.bulk_update(products, ["search_document"])
+    return len(products)
+
+
+def search_products(query, queryset=None):
+    """
+    Return active products matching ``query`` ordered by relevance.
+
+    The query is normalized like the stored documents and every term must
+    appear in the search document. On PostgreSQL the ``LIKE`` lookups are
+    served by the trigram GIN index and results are ranked by trigram word
+    similarity, kept to six decimal places; other databases fall back to
+    ranking title prefix matches first.
+    """
+
+    if queryset is None:
+        queryset = Product.objects.filter(is_active=True)
+
+    query = normalize_text(query)
+    terms = query.split()
+    if not terms:
+        return queryset.none()
+
+    for term in terms:
+        queryset = queryset.filter(search_document__contains=term)
+
+    if connection.vendor == "postgresql":
+        from django.contrib.postgres.search import TrigramWordSimilarity
+
+        # A fixed precision rank survives the round trip through the page
+        # cursor, so the keyset comparison on it stays exact.
+        return queryset.annotate(
+            rank=Cast(
+                TrigramWordSimilarity(query, "search_document"),
+                DecimalField(max_digits=7, decimal_places=6),
+            )
+        ).order_by("-rank", "-datetime_created")
+
+    return queryset.annotate(
+        rank=Case(
+            When(search_document__startswith=query, then=Value(0)),
+            default=Value(1),
+            output_field=IntegerField(),
+        )
+    ).order_by("rank", "-datetime_created")
@@ -0,0 +1,286 @@
+import json
+import logging
+from collections import Counter
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db.models import Count
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+from redis.exceptions import RedisError
+
+from .caching import get_cached, get_or_compute, set_cached
+from .models import Category, SearchLog
+from .utils import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+SEARCH_LOG_BUFFER_KEY = "search_log:buffer"
+SEARCH_LOG_PROCESSING_KEY = "search_log:processing"
+SEARCH_LOG_BATCH_SIZE = 500
+SEARCH_LOG_MAX_BATCHES = 20
+
+
+def buffer_search_log(query, product_id, user_id=None):
+    """
+    Queue a search for logging without writing to the database.
+
+    Args:
+        query (str): The searched text.
+        product_id (int): The first matching product, used later to resolve
+            the category of the search.
+        user_id (int or None): The searching user, if authenticated.
+    """
+
+    entry = {"query": query[:255], "product_id": product_id, "user_id": user_id}
+    try:
+        get_redis_client().rpush(SEARCH_LOG_BUFFER_KEY, json.dumps(entry))
+    except RedisError:
+        logger.warning("Search log buffer unavailable, writing synchronously.")
+        write_search_logs([entry])
+
+
+def _claim_batch(client, size):
+    """
+    Move up to ``size`` buffered entries to the processing list and return
+    them. Entries left there by a drain that failed are returned first,
+    so nothing is lost before it is written.
+    """
+
+    if not client.exists(SEARCH_LOG_PROCESSING_KEY):
+        count = min(size, client.llen(SEARCH_LOG_BUFFER_KEY))
+        pipeline = client.pipeline(transaction=False)
+        for _ in range(count):
+            pipeline.lmove(
+                SEARCH_LOG_BUFFER_KEY, SEARCH_LOG_PROCESSING_KEY, "LEFT", "RIGHT"
+            )
+        pipeline.execute()
+    return [json.loads(raw) for raw in client.lrange(SEARCH_LOG_PROCESSING_KEY, 0, -1)]
+
+
+def _resolve_categories(product_ids):
+    """
+    Map each product id to the id of its first category.
+
+    Mirrors ``product.categories.first()`` for a whole batch in one query.
+    """
+
+    category_by_product = {}
+    rows = (
+        Category.objects.filter(products__in=product_ids)
+        .order_by("datetime_created", "pk")
+        .values_list("products", "pk")
+    )
+    for product_id, category_id in rows:
+        category_by_product.setdefault(product_id, category_id)
+    return category_by_product
+
+
+def write_search_logs(entries):
+    """
+    Resolve categories for buffered entries and insert them in bulk.
+
+    Returns:
+        list[SearchLog]: The created logs.
+    """
+
+    if not entries:
+        return []
+
+    category_by_product = _resolve_categories(
+        {entry["product_id"] for entry in entries}
+    )
+    logs = [
+        SearchLog(
+            user_id=entry["user_id"],
+            query=entry["query"],
+            category_id=category_by_product.get(entry["product_id"]),
+        )
+        for entry in entries
+    ]
+    logs = SearchLog.objects.bulk_create(logs, batch_size=SEARCH_LOG_BATCH_SIZE)
+    _record_category_searches(logs)
+    return logs
+
+
+def drain_search_logs(
+    batch_size=SEARCH_LOG_BATCH_SIZE, max_batches=SEARCH_LOG_MAX_BATCHES
+):
+    """
+    Move buffered searches into ``SearchLog`` in batches.
+
+    Returns:
+        int: Number of logs written.
+    """
+
+    client = get_redis_client()
+    written = 0
+    for _ in range(max_batches):
+        entries = _claim_batch(client, batch_size)
+        if not entries:
+            break
+        written += len(write_search_logs(entries))
+        client.delete(SEARCH_LOG_PROCESSING_KEY)
+        if len(entries) < batch_size:
+            break
+    return written
+
+
+# Top searched categories
+#
+# Every written log increments its category in an hourly sorted set and in
+# an all-time sorted set. A periodic task unions the hourly buckets into
+# window sets and caches the resolved top categories, so readers only do a
+# single cache lookup.
+
+SEARCH_RANKING_BUCKET_KEY = "search_log:categories:{bucket}"
+SEARCH_RANKING_ALL_TIME_KEY = "search_log:categories:all"
+SEARCH_RANKING_WINDOW_KEY = "search_log:categories:window:{window}"
+SEARCH_RANKING_BUCKET_TTL = 8 * 24 * 3600
+SEARCH_RANKING_WINDOWS = {"24h": 24, "7d": 7 * 24}
+TOP_SEARCH_CATEGORIES_CACHE_KEY = "top_search_categories:{window}"
+TOP_SEARCH_CATEGORIES_WINDOW = "7d"
+TOP_SEARCH_CATEGORIES_LIMIT = 5
+
+
+def _bucket_name(moment):
+    return moment.strftime("%Y%m%d%H")
+
+
+def _record_category_searches(logs):
+    counts = Counter(log.category_id for log in logs if log.category_id)
+    if not counts:
+        return
+
+    bucket_key = SEARCH_RANKING_BUCKET_KEY.format(bucket=_bucket_name(timezone.now()))
+    try:
+        pipeline = get_redis_client().pipeline(transaction=False)
+        for category_id, count in counts.items():
+            pipeline.zincrby(bucket_key, count, category_id)
+            pipeline.zincrby(SEARCH_RANKING_ALL_TIME_KEY, count, category_id)
+        pipeline.expire(bucket_key, SEARCH_RANKING_BUCKET_TTL)
+        pipeline.execute()
+    except RedisError:
+        logger.warning("Could not update search category rankings.")
+
+
+def rebuild_search_rankings():
+    """
+    Rebuild the ranking sorted sets from the ``SearchLog`` table.
+
+    Used to seed Redis the first time (or after a flush); afterwards the
+    sets are maintained incrementally by :func:`write_search_logs`.
+    """
+
+    client = get_redis_client()
+    since = timezone.now() - timedelta(hours=max(SEARCH_RANKING_WINDOWS.values()))
+
+    all_time = (
+        SearchLog.objects.filter(category__isnull=False)
+        .values_list("category")
+        .annotate(count=Count("pk"))
+    )
+    hourly = (
+        SearchLog.objects.filter(category__isnull=False, datetime_created__gte=since)
+        .annotate(hour=TruncHour("datetime_created"))
+        .values_list("hour", "category")
+        .annotate(count=Count("pk"))
+    )
+
+    pipeline = client.pipeline(transaction=True)
+    pipeline.delete(SEARCH_RANKING_ALL_TIME_KEY)
+    for category_id, count in all_time:
+        pipeline.zadd(SEARCH_RANKING_ALL_TIME_KEY, {category_id: count})
+    for hour, category_id, count in hourly:
+        bucket_key = SEARCH_RANKING_BUCKET_KEY.format(bucket=_bucket_name(hour))
+        pipeline.zadd(bucket_key, {category_id: count})
+        pipeline.expire(bucket_key, SEARCH_RANKING_BUCKET_TTL)
+    pipeline.execute()
+
+
+def _resolve_top_categories(category_ids):
+    categories = Category.objects.in_bulk(category_ids)
+    return [
+        {
+            "id": categories[category_id].pk,
+            "title": categories[category_id].title,
+            "url": categories[category_id].get_absolute_url(),
+        }
+        for category_id in category_ids
+        if category_id in categories
+    ]
+
+
+def refresh_top_search_categories(limit=TOP_SEARCH_CATEGORIES_LIMIT):
+    """
+    Recompute the windowed rankings and cache the top categories.
+
+    Returns:
+        dict: Cached top categories per window.
+    """
+
+    client = get_redis_client()
+    if not client.exists(SEARCH_RANKING_ALL_TIME_KEY):
+        rebuild_search_rankings()
+
+    now = timezone.now()
+    ranking_keys = {"all": SEARCH_RANKING_ALL_TIME_KEY}
+    for window, hours in SEARCH_RANKING_WINDOWS.items():
+        window_key = SEARCH_RANKING_WINDOW_KEY.format(window=window)
+        bucket_keys = [
+            SEARCH_RANKING_BUCKET_KEY.format(
+                bucket=_bucket_name(now - timedelta(hours=offset))
+            )
+            for offset in range(hours)
+        ]
+        pipeline = client.pipeline(transaction=True)
+        pipeline.delete(window_key)
+        pipeline.zunionstore(window_key, bucket_keys)
+        pipeline.execute()
+        ranking_keys[window] = window_key
+
+    top_categories = {}
+    for window, ranking_key in ranking_keys.items():
+        category_ids = [
+            int(category_id)
+            for category_id in client.zrevrange(ranking_key, 0, limit - 1)
+        ]
+        top_categories[window] = _resolve_top_categories(category_ids)
+        cache_key = TOP_SEARCH_CATEGORIES_CACHE_KEY.format(window=window)
+        if (
+            window == TOP_SEARCH_CATEGORIES_WINDOW
+            and get_cached(cache_key) != top_categories[window]
+        ):
+            # Imported here: conditional GET reads the top categories.
+            from .conditional import mark_catalog_modified
+
+            mark_catalog_modified()
+        set_cached(cache_key, top_categories[window])
+    return top_categories
+
+
+def get_top_search_categories(window=TOP_SEARCH_CATEGORIES_WINDOW):
+    """
+    Return the most searched categories as ``{"id", "title", "url"}`` dicts.
+
+    Served from the cache filled by :func:`refresh_top_search_categories`;
+    the first call after a cache flush refreshes it inline.
+    """
+
+    try:
+        return get_or_compute(
+            TOP_SEARCH_CATEGORIES_CACHE_KEY.format(window=window),
+            lambda: refresh_top_search_categories().get(window, []),
+        )
+    except RedisError:
+        logger.warning("Search category rankings unavailable.")
+        return []
+
+
+def invalidate_top_search_categories():
+    cache.delete_many(
+        [
+            TOP_SEARCH_CATEGORIES_CACHE_KEY.format(window=window)
+            for window in ["all", *SEARCH_RANKING_WINDOWS]
+        ]
+    )
@@ -1,9 +1,66 @@
+from django.conf import settings
 from django.contrib.auth.signals import user_logged_in
 from django.core.cache import cache
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
 from django.dispatch import receiver
+from django.utils import timezone
+from taggit.models import Tag, TaggedItem
 
 from .cart import Cart as SessionCart
-from .models import Cart, CartItem, Customer
+from .cart_summary import (
+    invalidate_cart_summaries,
+    invalidate_favorite_ids,
+    invalidate_product_caches,
+)
+from .category_tree import invalidate_category_tree
+from .conditional import invalidate_catalog
+from .facets import invalidate_category_facets
+from .homepage import invalidate_homepage_cards
+from .models import (
+    Answer,
+    Brand,
+    Cart,
+    CartItem,
+    Category,
+    Color,
+    Comment,
+    Customer,
+    FavoriteList,
+    Product,
+    ProductAttribute,
+    ProductImages,
+    Question,
+)
+from .product_cards import bump_card_versions
+from .ratings import (
+    apply_comment_rating_change,
+    comment_rating_state,
+    get_comment_rating_state,
+)
+from .related import mark_related_products_dirty, schedule_related_products_update
+from .search import update_search_document, update_search_documents
+from .search_log import invalidate_top_search_categories
+from .stock import (
+    STOCK_HOLDER_SESSION_KEY,
+    customer_stock_holder,
+    get_reserved_quantities,
+    limit_reservations,
+    transfer_reservations,
+)
+from .suggestions import (
+    invalidate_suggestion_index,
+    refresh_product_suggestion,
+    remove_product_suggestion,
+)
+from .votes import delete_votes, withdraw_user_votes
 
 
 @receiver(user_logged_in)
@@ -17,15 +74,22 @@ def merge_session_cart_with_db(sender, user, request, **kwargs):
     in the database.
 
     Steps performed:
-    1. Retrieve or create a Customer object linked to the logged-in user.
+    1. Retrieve the Customer object linked to the logged-in user.
     2. Retrieve or create a Cart object for the customer.
-    3. Load items from the session-based cart.
+    3. Hand the guest stock reservations over to the customer, then fetch
+       the stock and reservations of every product in the session cart and
+       the matching database cart items in one query each.
     4. For each item in the session cart:
-        - If the product already exists in the database cart, increment its quantity.
-        - If not, create a new CartItem in the database cart.
-        - Ensure that quantities do not exceed the available product stock.
-    5. Clear the session cart and mark the session as modified.
-    6. Invalidate related cache entries to reflect updated cart data.
+        - If the product already exists in the database cart, add to its quantity.
+        - If not, prepare a new CartItem for the database cart.
+        - Clamp the quantity to the stock available to the customer, and
+          drop lines left without any.
+    5. Write new, changed and dropped items with one bulk_create, one
+       bulk_update and one delete inside a single transaction, and return
+       reserved units above the merged quantities to stock.
+    6. Clear the session cart and invalidate the cached cart summary.
+
+    The number of queries does not depend on the size of the session cart.
     """
 
     session_cart = SessionCart(request)
@@ -38,19 +102,433 @@ def merge_session_cart_with_db(sender, user, request, **kwargs):
     except Customer.DoesNotExist:
         return
 
-    db_cart, created = Cart.objects.get_or_create(customer=customer)
+    quantities = {
+        int(product_id): item["quantity"]
+        for product_id, item in session_cart.cart.items()
+    }
 
-    for item in session_cart:
-        product = item["product"]
-        quantity = item["quantity"]
+    holder = customer_stock_holder(customer)
+    guest_holder = request.session.pop(STOCK_HOLDER_SESSION_KEY, None)
 
-        cart_item, created = CartItem.objects.get_or_create(
-            cart=db_cart, product=product
+    with transaction.atomic():
+        if guest_holder:
+            transfer_reservations(guest_holder, holder)
+        db_cart, created = Cart.objects.get_or_create(customer=customer)
+        stock = dict(
+            Product.objects.filter(id__in=quantities).values_list("id", "stock")
         )
-        if not created:
-            cart_item.quantity += quantity
-        else:
-            cart_item.quantity = quantity
-        cart_item.save()
+        # Units already reserved by the customer count as available to them.
+        for product_id, reserved in get_reserved_quantities(holder, stock).items():
+            stock[product_id] += reserved
+        existing_items = {
+            cart_item.product_id: cart_item
+            for cart_item in CartItem.objects.select_for_update().filter(
+                cart=db_cart, product_id__in=stock
+            )
+        }
+
+        new_items = []
+        changed_items = []
+        dropped_items = []
+        merged = {}
+        for product_id, quantity in quantities.items():
+            if product_id not in stock:
+                continue
+
+            cart_item = existing_items.get(product_id)
+            if cart_item is not None:
+                quantity += cart_item.quantity
+            quantity = max(min(quantity, stock[product_id]), 0)
+            merged[product_id] = quantity
+
+            if quantity < 1:
+                if cart_item is not None:
+                    dropped_items.append(cart_item.pk)
+                continue
+            if cart_item is None:
+                new_items.append(
+                    CartItem(cart=db_cart, product_id=product_id, quantity=quantity)
+                )
+            elif cart_item.quantity != quantity:
+                cart_item.quantity = quantity
+                changed_items.append(cart_item)
+
+        CartItem.objects.bulk_create(new_items)
+        CartItem.objects.bulk_update(changed_items, ["quantity"])
+        if dropped_items:
+            CartItem.objects.filter(pk__in=dropped_items).delete()
+        limit_reservations(holder, merged)
+        if new_items or changed_items or dropped_items:
+            Cart.objects.filter(pk=db_cart.pk).update(datetime_updated=timezone.now())
 
+    # Bulk writes skip the CartItem signals that normally drop the summary.
+    invalidate_cart_summaries([customer.pk])
     session_cart.clear()
+
+
+@receiver(post_save, sender=Product)
+def refresh_product_search_document(sender, instance, raw=False, **kwargs):
+    """
+    Keep the product search document in sync with its own fields.
+    """
+
+    if raw:
+        return
+    update_search_document(instance)
+    refresh_product_suggestion(instance)
+
+
+@receiver(post_delete, sender=Product)
+def drop_product_suggestion(sender, instance, **kwargs):
+    remove_product_suggestion(instance.pk)
+
+
+@receiver(m2m_changed, sender=Product.categories.through)
+@receiver(m2m_changed, sender=TaggedItem)
+def refresh_search_document_on_relation_change(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    """
+    Refresh search documents when product tags or categories change.
+
+    Handles both directions of the categories relation, e.g.
+    ``product.categories.add(...)`` and ``category.products.add(...)``.
+    """
+
+    if isinstance(instance, Product):
+        if action in ("post_add", "post_remove", "post_clear"):
+            update_search_document(instance)
+            if sender is TaggedItem:
+                refresh_product_suggestion(instance)
+        return
+
+    if not (reverse and isinstance(instance, Category)):
+        return
+
+    if action == "pre_clear":
+        # The cleared products are gone by post_clear, remember them now.
+        instance._search_cleared_pks = list(
+            instance.products.values_list("pk", flat=True)
+        )
+    elif action == "post_clear":
+        pks = getattr(instance, "_search_cleared_pks", [])
+        update_search_documents(Product.objects.filter(pk__in=pks))
+    elif action in ("post_add", "post_remove"):
+        update_search_documents(Product.objects.filter(pk__in=pk_set))
+
+
+@receiver(post_save, sender=Brand)
+@receiver(post_save, sender=Category)
+def refresh_search_documents_of_related_products(
+    sender, instance, created, raw=False, **kwargs
+):
+    """
+    Refresh the search documents of products of a renamed brand or category.
+    """
+
+    if raw or created:
+        return
+    update_search_documents(instance.products.all())
+
+
+@receiver(post_save, sender=Tag)
+def refresh_search_documents_of_tagged_products(
+    sender, instance, created, raw=False, **kwargs
+):
+    """
+    Refresh the search documents of products carrying a renamed tag.
+    """
+
+    if raw or created:
+        return
+    update_search_documents(Product.objects.filter(tags=instance))
+    invalidate_suggestion_index()
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def refresh_top_search_categories_cache(sender, **kwargs):
+    """
+    Drop cached top searched categories so renamed or deleted categories
+    are not served from the cache.
+    """
+
+    invalidate_top_search_categories()
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def refresh_category_tree(sender, **kwargs):
+    """
+    Move the category tree to a new version once the change is committed,
+    so no request rebuilds it from the rows before the change.
+    """
+
+    transaction.on_commit(invalidate_category_tree)
+
+
+def _deleted_in_bulk(origin):
+    """
+    Whether a cart item is deleted with its cart or by a queryset delete,
+    whose caller updates the cart once instead of once per item.
+    """
+
+    return isinstance(origin, (Cart, QuerySet))
+
+
+@receiver(post_save, sender=CartItem)
+@receiver(post_delete, sender=CartItem)
+def drop_cart_summary_on_item_change(sender, instance, origin=None, **kwargs):
+    """
+    Drop the cart summary of the item's customer once the change is
+    committed, so a concurrent request cannot cache the old lines again.
+    """
+
+    if _deleted_in_bulk(origin):
+        return
+    if CartItem.cart.is_cached(instance):
+        # Items loaded through ``cart.items`` already know their cart.
+        customer_id = instance.cart.customer_id
+    else:
+        customer_id = (
+            Cart.objects.filter(pk=instance.cart_id)
+            .values_list("customer_id", flat=True)
+            .first()
+        )
+    if customer_id is not None:
+        transaction.on_commit(lambda: invalidate_cart_summaries([customer_id]))
+
+
+@receiver(post_save, sender=CartItem)
+@receiver(post_delete, sender=CartItem)
+def touch_cart_on_item_change(sender, instance, origin=None, **kwargs):
+    """
+    Keep ``Cart.datetime_updated`` at the last change of its items, which is
+    what the cart retention policy expires carts by.
+    """
+
+    if _deleted_in_bulk(origin):
+        return
+    Cart.objects.filter(pk=instance.cart_id).update(datetime_updated=timezone.now())
+
+
+@receiver(post_delete, sender=Cart)
+def drop_cart_summary_on_cart_delete(sender, instance, **kwargs):
+    customer_id = instance.customer_id
+    transaction.on_commit(lambda: invalidate_cart_summaries([customer_id]))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def drop_product_snapshot(sender, instance, raw=False, **kwargs):
+    """
+    Drop the cached snapshot of a product and the cart summaries holding it,
+    whose price, stock or title may have changed.
+    """
+
+    invalidate_product_caches([instance.pk], customers=not raw)
+
+
+@receiver(post_save, sender=Brand)
+def drop_product_snapshots_of_brand(sender, instance, created, raw=False, **kwargs):
+    """
+    Drop cached snapshots and cart summaries that embed a renamed brand.
+    """
+
+    if raw or created:
+        return
+    invalidate_product_caches(list(instance.products.values_list("pk", flat=True)))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Color)
+@receiver(m2m_changed, sender=Product.categories.through)
+@receiver(m2m_changed, sender=Product.colors.through)
+def drop_category_facets(sender, **kwargs):
+    """
+    Drop every cached facet index once a change to products, their
+    categories or colors is committed.
+    """
+
+    if kwargs.get("raw") or kwargs.get("action", "post_").startswith("pre_"):
+        return
+    transaction.on_commit(invalidate_category_facets)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=Color)
+@receiver(post_delete, sender=Color)
+@receiver(m2m_changed, sender=Product.colors.through)
+def drop_homepage_cards(sender, **kwargs):
+    """
+    Mark the cached home page cards stale once the change is committed.
+    """
+
+    if kwargs.get("raw") or kwargs.get("action", "post_").startswith("pre_"):
+        return
+    transaction.on_commit(invalidate_homepage_cards)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Brand)
+@receiver(post_save, sender=Color)
+@receiver(post_delete, sender=Color)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=ProductImages)
+@receiver(post_delete, sender=ProductImages)
+@receiver(post_save, sender=ProductAttribute)
+@receiver(post_delete, sender=ProductAttribute)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=TaggedItem)
+@receiver(post_delete, sender=TaggedItem)
+@receiver(m2m_changed, sender=Product.categories.through)
+@receiver(m2m_changed, sender=Product.colors.through)
+def drop_catalog_pages(sender, **kwargs):
+    """
+    Change the ETag of every catalog page and product view once the change
+    is committed.
+    """
+
+    if kwargs.get("raw") or kwargs.get("action", "post_").startswith("pre_"):
+        return
+    transaction.on_commit(invalidate_catalog)
+
+
+@receiver(post_delete, sender=Comment)
+@receiver(post_delete, sender=Question)
+@receiver(post_delete, sender=Answer)
+def touch_product_of_discussion(sender, instance, **kwargs):
+    """
+    Mark the product as updated when one of its comments, questions or
+    answers is deleted, since its page stamp only sees the latest update.
+    """
+
+    if sender is Answer:
+        products = Product.objects.filter(questions=instance.question_id)
+    else:
+        products = Product.objects.filter(pk=instance.product_id)
+    products.update(datetime_updated=timezone.now())
+
+
+@receiver(post_delete, sender=Comment)
+@receiver(post_delete, sender=Answer)
+def delete_votes_of_discussion(sender, instance, **kwargs):
+    delete_votes(instance)
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def withdraw_votes_of_user(sender, instance, **kwargs):
+    withdraw_user_votes(instance)
+
+
+@receiver(post_save, sender=Product)
+def bump_product_card_version(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_card_versions([instance.pk])
+
+
+@receiver(post_save, sender=Color)
+def bump_card_versions_of_color(sender, instance, created, raw=False, **kwargs):
+    if not (raw or created):
+        bump_card_versions(Product.objects.filter(colors=instance).values("pk"))
+
+
+@receiver(m2m_changed, sender=Product.colors.through)
+def bump_card_versions_on_color_change(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        bump_card_versions([instance.pk])
+    elif pk_set:
+        bump_card_versions(pk_set)
+    else:
+        # A cleared color no longer knows its products; rebuild every card.
+        bump_card_versions()
+
+
+@receiver(post_save, sender=Product)
+def queue_related_products_of_product(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    mark_related_products_dirty([instance.pk])
+    if created:
+        transaction.on_commit(schedule_related_products_update)
+
+
+@receiver(m2m_changed, sender=Product.categories.through)
+@receiver(m2m_changed, sender=TaggedItem)
+def queue_related_products_on_relation_change(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    """
+    Queue products whose tags or categories changed for the next related
+    products update. Categories cleared from the category side are left to
+    the nightly rebuild.
+    """
+
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if isinstance(instance, Product):
+        mark_related_products_dirty([instance.pk])
+    elif reverse and isinstance(instance, Category) and pk_set:
+        mark_related_products_dirty(pk_set)
+
+
+@receiver(post_delete, sender=Category)
+def rebuild_category_tree(sender, instance, **kwargs):
+    """
+    Renumber the category tree after a delete.
+
+    Children of a deleted category are detached with a plain ``UPDATE``
+    (``on_delete=SET_NULL``), which leaves their nested set bounds inside
+    the removed subtree.
+    """
+
+    if Category.objects.filter(parent=None, level__gt=0).exists():
+        Category.objects.rebuild()
+
+
+@receiver(post_save, sender=FavoriteList)
+@receiver(post_delete, sender=FavoriteList)
+def drop_favorite_ids(sender, instance, **kwargs):
+    invalidate_favorite_ids(instance.customer_id)
+
+
+@receiver(pre_save, sender=Comment)
+def remember_comment_rating(sender, instance, raw=False, **kwargs):
+    if raw or instance.pk is None:
+        instance._rating_before = None
+    else:
+        instance._rating_before = get_comment_rating_state(instance.pk)
+
+
+@receiver(post_save, sender=Comment)
+def update_product_rating_on_comment_save(sender, instance, raw=False, **kwargs):
+    """
+    Apply an approved, edited or unapproved comment to its product rating.
+    """
+
+    if raw:
+        return
+    apply_comment_rating_change(
+        getattr(instance, "_rating_before", None), comment_rating_state(instance)
+    )
+
+
+@receiver(post_delete, sender=Comment)
+def update_product_rating_on_comment_delete(sender, instance, **kwargs):
+    apply_comment_rating_change(comment_rating_state(instance), None)
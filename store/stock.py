@@ -0,0 +1,457 @@
+"""
+Stock reservations for carts and checkout.
+
+Adding a product to a cart takes the units out of ``Product.stock`` with a
+conditional ``UPDATE ... SET stock = stock - n WHERE stock >= n`` and
+records them in a ``StockReservation`` row for the cart's holder. The
+decrement is a single statement, so concurrent requests for the same
+product never read-then-write a stale stock value and the product row is
+only locked for the few statements of the reservation transaction.
+
+Reservations expire ``STOCK_RESERVATION_TTL`` seconds after the cart line
+was last touched; a periodic task returns expired units to stock. Checkout
+re-reserves every line, so carts whose reservations expired are validated
+again before an order is placed.
+"""
+
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import BigIntegerField, Case, F, Value, When
+from django.utils import timezone
+
+from .models import Product, StockReservation
+
+STOCK_HOLDER_SESSION_KEY = "stock_holder"
+STOCK_RELEASE_BATCH_SIZE = 500
+
+
+class InsufficientStock(Exception):
+    """
+    Raised when a reservation asks for more units than are available.
+
+    Attributes:
+        product_id (int): The requested product.
+        available (int): Units the holder may reserve in total.
+    """
+
+    def __init__(self, product_id, available):
+        self.product_id = product_id
+        self.available = available
+        super().__init__(
+            f"Only {available} items of product {product_id} are available."
+        )
+
+
+def customer_stock_holder(customer):
+    return f"customer:{customer.pk}"
+
+
+def get_stock_holder(request):
+    """
+    Return the reservation holder of the cart used by ``request``.
+
+    Customers hold reservations under their id. Guests get a random token
+    stored in the session, which survives the session key rotation on
+    login so the guest reservations can be handed over to the customer.
+    """
+
+    customer = getattr(request, "customer", None)
+    if request.user.is_authenticated and customer:
+        return customer_stock_holder(customer)
+
+    holder = request.session.get(STOCK_HOLDER_SESSION_KEY)
+    if holder is None:
+        holder = f"guest:{uuid.uuid4().hex}"
+        request.session[STOCK_HOLDER_SESSION_KEY] = holder
+    return holder
+
+
+def _expires_at():
+    return timezone.now() + timedelta(seconds=settings.STOCK_RESERVATION_TTL)
+
+
+def _restock(quantities):
+    """
+    Return units to stock for many products with a single ``UPDATE``.
+
+    Args:
+        quantities (dict): Units to add back keyed by product id.
+    """
+
+    if not quantities:
+        return
+    Product.objects.filter(pk__in=quantities).update(
+        stock=F("stock")
+        + Case(
+            *[
+                When(pk=product_id, then=Value(quantity))
+                for product_id, quantity in quantities.items()
+            ],
+            default=Value(0),
+            output_field=BigIntegerField(),
+        )
+    )
+
+
+def reserve_stock(product_id, holder, quantity):
+    """
+    Set the number of units of a product reserved for ``holder``.
+
+    Only the difference with the current reservation is taken from or
+    returned to stock, and the reservation expiry is extended. A quantity
+    of zero releases the reservation.
+
+    Args:
+        product_id (int): The product to reserve.
+        holder (str): The holder from :func:`get_stock_holder`.
+        quantity (int): Total units the holder wants.
+
+    Raises:
+        InsufficientStock: If not enough units are available.
+    """
+
+    if quantity <= 0:
+        release_stock(product_id, holder)
+        return
+
+    with transaction.atomic():
+        reservations = StockReservation.objects.select_for_update()
+        reservation, created = reservations.get_or_create(
+            product_id=product_id,
+            holder=holder,
+            defaults={"quantity": quantity, "expires_at": _expires_at()},
+        )
+        reserved = 0 if created else reservation.quantity
+        delta = quantity - reserved
+
+        if not created:
+            reservation.quantity = quantity
+            reservation.expires_at = _expires_at()
+            reservation.save(update_fields=["quantity", "expires_at"])
+
+        # Touch the product row last so its lock is held as briefly as possible.
+        if delta > 0:
+            taken = Product.objects.filter(pk=product_id, stock__gte=delta).update(
+                stock=F("stock") - delta
+            )
+            if not taken:
+                stock = (
+                    Product.objects.filter(pk=product_id)
+                    .values_list("stock", flat=True)
+                    .first()
+                )
+                raise InsufficientStock(product_id, (stock or 0) + reserved)
+        elif delta < 0:
+            _restock({product_id: -delta})
+
+
+def renew_reservations(holder, quantities):
+    """
+    Extend the reservations of a cart and re-reserve the units of lines
+    whose reservations expired.
+
+    Missing units are taken per line with the same conditional ``UPDATE``
+    as :func:`reserve_stock`. A line whose missing units are no longer all
+    in stock keeps what it still holds and is validated again at checkout.
+
+    Args:
+        holder (str): The reservation holder of the cart.
+        quantities (dict): Units in the cart keyed by product id.
+
+    Returns:
+        dict: Units reserved for lines left short, keyed by product id.
+    """
+
+    quantities = {
+        product_id: quantity
+        for product_id, quantity in quantities.items()
+        if quantity > 0
+    }
+    if not quantities:
+        return {}
+
+    with transaction.atomic():
+        reservations = {
+            reservation.product_id: reservation
+            for reservation in StockReservation.objects.select_for_update().filter(
+                holder=holder, product_id__in=quantities
+            )
+        }
+        expires_at = _expires_at()
+        short, created = {}, []
+        for product_id, quantity in quantities.items():
+            reservation = reservations.get(product_id)
+            reserved = reservation.quantity if reservation else 0
+            missing = quantity - reserved
+            if missing > 0:
+                if Product.objects.filter(pk=product_id, stock__gte=missing).update(
+                    stock=F("stock") - missing
+                ):
+                    reserved = quantity
+                else:
+                    short[product_id] = reserved
+            if reservation is not None:
+                reservation.quantity = reserved
+                reservation.expires_at = expires_at
+            elif reserved:
+                created.append(
+                    StockReservation(
+                        product_id=product_id,
+                        holder=holder,
+                        quantity=reserved,
+                        expires_at=expires_at,
+                    )
+                )
+
+        StockReservation.objects.bulk_update(
+            reservations.values(), ["quantity", "expires_at"]
+        )
+        StockReservation.objects.bulk_create(created)
+    return short
+
+
+def take_stock(quantities):
+    """
+    Take units of many products from stock in one conditional ``UPDATE``.
+
+    Either every product has enough stock and all are decremented, or the
+    caller's transaction must be rolled back.
+
+    Args:
+        quantities (dict): Units to take keyed by product id.
+
+    Raises:
+        InsufficientStock: For the first product without enough stock.
+    """
+
+    if not quantities:
+        return
+    needed = Case(
+        *[
+            When(pk=product_id, then=Value(quantity))
+            for product_id, quantity in quantities.items()
+        ],
+        output_field=BigIntegerField(),
+    )
+    try:
+        with transaction.atomic():
+            taken = Product.objects.filter(pk__in=quantities, stock__gte=needed).update(
+                stock=F("stock") - needed
+            )
+            if taken != len(quantities):
+                raise InsufficientStock(None, 0)
+    except InsufficientStock:
+        # The savepoint is rolled back, so stock can be read to find the
+        # product that ran out.
+        stock = dict(
+            Product.objects.filter(pk__in=quantities).values_list("pk", "stock")
+        )
+        for product_id, quantity in quantities.items():
+            if stock.get(product_id, 0) < quantity:
+                raise InsufficientStock(product_id, stock.get(product_id, 0))
+        raise
+
+
+def release_stock(product_id, holder):
+    """
+    Drop the reservation of ``holder`` on a product and restock its units.
+    """
+
+    release_holder(holder, product_ids=[product_id])
+
+
+def release_holder(holder, product_ids=None):
+    """
+    Drop the reservations of ``holder`` and restock their units.
+
+    Args:
+        holder (str): The reservation holder.
+        product_ids (Iterable[int] or None): Limit to these products.
+    """
+
+    with transaction.atomic():
+        reservations = StockReservation.objects.select_for_update().filter(
+            holder=holder
+        )
+        if product_ids is not None:
+            reservations = reservations.filter(product_id__in=product_ids)
+        quantities = dict(reservations.values_list("product_id", "quantity"))
+        if quantities:
+            StockReservation.objects.filter(
+                holder=holder, product_id__in=quantities
+            ).delete()
+            _restock(quantities)
+
+
+def get_reserved_quantities(holder, product_ids=None):
+    reservations = StockReservation.objects.filter(holder=holder)
+    if product_ids is not None:
+        reservations = reservations.filter(product_id__in=product_ids)
+    return dict(reservations.values_list("product_id", "quantity"))
+
+
+def transfer_reservations(from_holder, to_holder):
+    """
+    Hand the reservations of one holder over to another.
+
+    Used when a guest logs in: reserved units move to the customer without
+    touching stock, and reservations on the same product are added up.
+    """
+
+    if from_holder == to_holder:
+        return
+
+    with transaction.atomic():
+        incoming = list(
+            StockReservation.objects.select_for_update().filter(holder=from_holder)
+        )
+        if not incoming:
+            return
+        existing = {
+            reservation.product_id: reservation
+            for reservation in StockReservation.objects.select_for_update().filter(
+                holder=to_holder,
+                product_id__in=[reservation.product_id for reservation in incoming],
+            )
+        }
+
+        expires_at = _expires_at()
+        merged, moved, merged_pks = [], [], []
+        for reservation in incoming:
+            target = existing.get(reservation.product_id)
+            if target is None:
+                reservation.holder = to_holder
+                reservation.expires_at = expires_at
+                moved.append(reservation)
+            else:
+                target.quantity += reservation.quantity
+                target.expires_at = expires_at
+                merged.append(target)
+                merged_pks.append(reservation.pk)
+
+        StockReservation.objects.filter(pk__in=merged_pks).delete()
+        StockReservation.objects.bulk_update(merged, ["quantity", "expires_at"])
+        StockReservation.objects.bulk_update(moved, ["holder", "expires_at"])
+
+
+def limit_reservations(holder, quantities):
+    """
+    Shrink the reservations of ``holder`` to at most the given units and
+    return the surplus to stock, with a fixed number of queries.
+
+    Args:
+        holder (str): The reservation holder.
+        quantities (dict): Units the holder may keep keyed by product id,
+            zero to release a reservation.
+    """
+
+    with transaction.atomic():
+        reservations = StockReservation.objects.select_for_update().filter(
+            holder=holder, product_id__in=quantities
+        )
+        surplus, shrunk, dropped = {}, [], []
+        for reservation in reservations:
+            allowed = quantities[reservation.product_id]
+            if reservation.quantity <= allowed:
+                continue
+            surplus[reservation.product_id] = reservation.quantity - allowed
+            if allowed > 0:
+                reservation.quantity = allowed
+                shrunk.append(reservation)
+            else:
+                dropped.append(reservation.pk)
+        StockReservation.objects.filter(pk__in=dropped).delete()
+        StockReservation.objects.bulk_update(shrunk, ["quantity"])
+        _restock(surplus)
+
+
+def commit_reservations(holder, product_ids=None):
+    """
+    Consume the reservations of ``holder`` once their units are sold.
+
+    The units already left ``Product.stock`` when they were reserved, so
+    the reservations are simply deleted.
+
+    Returns:
+        dict: Consumed units keyed by product id.
+    """
+
+    with transaction.atomic():
+        reservations = StockReservation.objects.select_for_update().filter(
+            holder=holder
+        )
+        if product_ids is not None:
+            reservations = reservations.filter(product_id__in=product_ids)
+        quantities = dict(reservations.values_list("product_id", "quantity"))
+        StockReservation.objects.filter(
+            holder=holder, product_id__in=quantities
+        ).delete()
+    return quantities
+
+
+def consume_stock(holder, quantities):
+    """
+    Take sold units out of stock, using the holder's reservations first.
+
+    Reserved units already left ``Product.stock``; only units whose
+    reservation expired are taken with :func:`take_stock`, and reserved
+    units beyond the sold quantity are returned.
+
+    Args:
+        holder (str): The reservation holder of the sold cart.
+        quantities (dict): Sold units keyed by product id.
+
+    Raises:
+        InsufficientStock: If an unreserved unit is no longer available.
+    """
+
+    with transaction.atomic():
+        reserved = commit_reservations(holder, product_ids=list(quantities))
+        shortfall = {
+            product_id: quantity - reserved.get(product_id, 0)
+            for product_id, quantity in quantities.items()
+            if quantity > reserved.get(product_id, 0)
+        }
+        surplus = {
+            product_id: quantity - quantities[product_id]
+            for product_id, quantity in reserved.items()
+            if quantity > quantities[product_id]
+        }
+        take_stock(shortfall)
+        _restock(surplus)
+
+
+def release_expired_reservations(batch_size=STOCK_RELEASE_BATCH_SIZE):
+    """
+    Return the units of expired reservations to stock.
+
+    Expired rows are claimed in batches with ``SKIP LOCKED`` so concurrent
+    workers and carts refreshing a reservation never wait on each other.
+
+    Returns:
+        int: Number of released reservations.
+    """
+
+    released = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                StockReservation.objects.select_for_update(skip_locked=True)
+                .filter(expires_at__lte=timezone.now())
+                .values_list("pk", "product_id", "quantity")[:batch_size]
+            )
+            if not rows:
+                break
+
+            quantities = {}
+            for _, product_id, quantity in rows:
+                quantities[product_id] = quantities.get(product_id, 0) + quantity
+            StockReservation.objects.filter(pk__in=[row[0] for row in rows]).delete()
+            _restock(quantities)
+        released += len(rows)
+        if len(rows) < batch_size:
+            break
+    return released
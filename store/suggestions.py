@@ -0,0 +1,263 @@
+import json
+import logging
+import time
+from bisect import bisect_left
+
+from redis.exceptions import RedisError
+
+from .caching import acquire_lock, release_lock
+from .models import Product
+from .normalization import normalize_text
+from .utils import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+# One JSON entry per product id in a Redis hash, plus a marker field set
+# once the hash was built from the database. Every write bumps the version
+# so workers know to reload their index.
+SUGGESTION_ENTRIES_KEY = "search_suggestions:entries"
+SUGGESTION_BUILT_FIELD = "built"
+SUGGESTION_VERSION_KEY = "search_suggestions:version"
+SUGGESTION_WRITE_BATCH_SIZE = 1000
+SUGGESTION_MIN_QUERY_LENGTH = 2
+SUGGESTION_LIMIT = 10
+SUGGESTION_VERSION_CHECK_INTERVAL = 5
+
+# Per-process state: the built index, the version of the entries it was
+# built from and when that version was last compared with the shared one.
+_index = None
+_index_version = None
+_version_checked_at = 0.0
+
+
+def build_suggestion_entry(product):
+    """
+    Build the cached suggestion payload of a product.
+
+    URL and image path are resolved here once so serving a suggestion
+    never touches the model again.
+    """
+
+    terms = set(normalize_text(product.title).split())
+    terms.update(normalize_text(product.english_title).split())
+    for tag in product.tags.all():
+        terms.update(normalize_text(tag.name).split())
+
+    return {
+        "title": product.title,
+        "url": product.get_absolute_url(),
+        "image": product.image.url if product.image else "",
+        "normalized_title": normalize_text(product.title),
+        "terms": sorted(terms),
+        "created": product.datetime_created.timestamp(),
+    }
+
+
+def build_suggestion_entries():
+    products = (
+        Product.objects.filter(is_active=True)
+        .only("title", "english_title", "slug", "image", "datetime_created")
+        .prefetch_related("tags")
+    )
+    return {
+        product.pk: build_suggestion_entry(product)
+        for product in products.iterator(chunk_size=1000)
+    }
+
+
+class PrefixIndex:
+    """
+    Sorted-array prefix index over product title and tag terms.
+
+    Every ``(term, product_id)`` pair is kept in one sorted list, so all
+    products having a term starting with a prefix are found with two
+    ``bisect`` calls.
+    """
+
+    def __init__(self, entries):
+        self.entries = entries
+        pairs = sorted(
+            (term, product_id)
+            for product_id, entry in entries.items()
+            for term in entry["terms"]
+        )
+        self._terms = [term for term, _ in pairs]
+        self._product_ids = [product_id for _, product_id in pairs]
+
+    def _ids_with_prefix(self, prefix):
+        start = bisect_left(self._terms, prefix)
+        end = bisect_left(self._terms, prefix + "\uffff", lo=start)
+        return set(self._product_ids[start:end])
+
+    def search(self, query, limit=SUGGESTION_LIMIT):
+        """
+        Return up to ``limit`` suggestions whose terms start with every
+        word of ``query``, title prefix matches first, newest next.
+        """
+
+        query = normalize_text(query)
+        words = query.split()
+        if not words:
+            return []
+
+        matches = None
+        for word in sorted(words, key=len, reverse=True):
+            ids = self._ids_with_prefix(word)
+            matches = ids if matches is None else matches & ids
+            if not matches:
+                return []
+
+        ranked = sorted(
+            (self.entries[product_id] for product_id in matches),
+            key=lambda entry: (
+                not entry["normalized_title"].startswith(query),
+                -entry["created"],
+            ),
+        )
+        return [
+            {"title": entry["title"], "url": entry["url"], "image": entry["image"]}
+            for entry in ranked[:limit]
+        ]
+
+
+def _build_entries():
+    """
+    Build every entry from the database and store them in the shared hash.
+
+    Entries are added with ``HSETNX``, so a product saved while the build
+    ran keeps the entry its own save wrote.
+    """
+
+    entries = build_suggestion_entries()
+    client = get_redis_client()
+    product_ids = list(entries)
+    for start in range(0, len(product_ids), SUGGESTION_WRITE_BATCH_SIZE):
+        pipeline = client.pipeline(transaction=False)
+        for product_id in product_ids[start : start + SUGGESTION_WRITE_BATCH_SIZE]:
+            pipeline.hsetnx(
+                SUGGESTION_ENTRIES_KEY, product_id, json.dumps(entries[product_id])
+            )
+        pipeline.execute()
+    pipeline = client.pipeline()
+    pipeline.hset(SUGGESTION_ENTRIES_KEY, SUGGESTION_BUILT_FIELD, 1)
+    pipeline.incr(SUGGESTION_VERSION_KEY)
+    pipeline.execute()
+    return entries
+
+
+def _load_entries():
+    """
+    Return the shared version and entries, building the entries if the
+    hash was never built.
+
+    Returns:
+        tuple: The version and the entries. The version is ``None`` for
+        entries built from the database, so the next version check
+        reloads them from the hash.
+    """
+
+    client = get_redis_client()
+    pipeline = client.pipeline()
+    pipeline.get(SUGGESTION_VERSION_KEY)
+    pipeline.hgetall(SUGGESTION_ENTRIES_KEY)
+    version, raw = pipeline.execute()
+    if SUGGESTION_BUILT_FIELD.encode() in raw:
+        del raw[SUGGESTION_BUILT_FIELD.encode()]
+        return version, {
+            int(product_id): json.loads(entry) for product_id, entry in raw.items()
+        }
+
+    token = acquire_lock(SUGGESTION_ENTRIES_KEY)
+    if token is None:
+        return None, build_suggestion_entries()
+    try:
+        return None, _build_entries()
+    finally:
+        release_lock(SUGGESTION_ENTRIES_KEY, token)
+
+
+def get_suggestion_index():
+    """
+    Return this process's prefix index, reloading it when the shared
+    snapshot version changed.
+
+    The shared version is compared at most every
+    ``SUGGESTION_VERSION_CHECK_INTERVAL`` seconds.
+    """
+
+    global _index, _index_version, _version_checked_at
+
+    now = time.monotonic()
+    if (
+        _index is not None
+        and now - _version_checked_at < SUGGESTION_VERSION_CHECK_INTERVAL
+    ):
+        return _index
+
+    _version_checked_at = now
+    try:
+        if (
+            _index is not None
+            and _index_version is not None
+            and get_redis_client().get(SUGGESTION_VERSION_KEY) == _index_version
+        ):
+            return _index
+        version, entries = _load_entries()
+    except RedisError:
+        logger.warning("Search suggestion entries unavailable.")
+        if _index is not None:
+            return _index
+        version, entries = None, build_suggestion_entries()
+
+    _index = PrefixIndex(entries)
+    _index_version = version
+    return _index
+
+
+def get_suggestions(query, limit=SUGGESTION_LIMIT):
+    if len(query.strip()) < SUGGESTION_MIN_QUERY_LENGTH:
+        return []
+    return get_suggestion_index().search(query, limit=limit)
+
+
+def _write_entry(product_id, entry=None):
+    """
+    Replace or, without ``entry``, remove one product's entry and bump
+    the shared version.
+    """
+
+    try:
+        pipeline = get_redis_client().pipeline()
+        if entry is None:
+            pipeline.hdel(SUGGESTION_ENTRIES_KEY, product_id)
+        else:
+            pipeline.hset(SUGGESTION_ENTRIES_KEY, product_id, json.dumps(entry))
+        pipeline.incr(SUGGESTION_VERSION_KEY)
+        pipeline.execute()
+    except RedisError:
+        logger.warning("Search suggestion entries unavailable.")
+
+
+def refresh_product_suggestion(product):
+    """
+    Update the entry of a single product and bump the shared version.
+    """
+
+    if product.is_active:
+        _write_entry(product.pk, build_suggestion_entry(product))
+    else:
+        _write_entry(product.pk)
+
+
+def remove_product_suggestion(product_id):
+    _write_entry(product_id)
+
+
+def invalidate_suggestion_index():
+    try:
+        pipeline = get_redis_client().pipeline()
+        pipeline.delete(SUGGESTION_ENTRIES_KEY)
+        pipeline.incr(SUGGESTION_VERSION_KEY)
+        pipeline.execute()
+    except RedisError:
+        logger.warning("Search suggestion entries unavailable.")
@@ -1,6 +1,18 @@
+import logging
+
 from celery import shared_task
 from django.core.mail import send_mail
 
+from .homepage import refresh_homepage_cards
+from .ratings import recompute_product_ratings
+from .recommendations import update_changed_recommendations, update_recommendations
+from .related import update_dirty_related_products, update_related_products
+from .retention import apply_retention_policies as apply_policies
+from .search_log import drain_search_logs, refresh_top_search_categories
+from .stock import release_expired_reservations
+
+logger = logging.getLogger(__name__)
+
 
 @shared_task
 def send_order_confirmation_email(user_email):
@@ -11,3 +23,104 @@ def send_order_confirmation_email(user_email):
         [user_email],
         fail_silently=False,
     )
+
+
+@shared_task
+def drain_search_log_buffer():
+    """
+    Write buffered searches to SearchLog with bulk inserts.
+    """
+    written = drain_search_logs()
+    if written:
+        logger.info(f"Wrote {written} buffered search logs.")
+    return written
+
+
+@shared_task
+def refresh_search_rankings():
+    """
+    Recompute the windowed top searched categories and cache them.
+    """
+    top_categories = refresh_top_search_categories()
+    return {window: len(categories) for window, categories in top_categories.items()}
+
+
+@shared_task
+def release_expired_stock_reservations():
+    """
+    Return the stock held by expired cart reservations.
+    """
+    released = release_expired_reservations()
+    if released:
+        logger.info(f"Released {released} expired stock reservations.")
+    return released
+
+
+@shared_task
+def reconcile_product_ratings():
+    """
+    Rebuild every product rating from approved comments.
+    """
+    updated = recompute_product_ratings()
+    logger.info(f"Reconciled {updated} changed product ratings.")
+    return updated
+
+
+@shared_task
+def rebuild_homepage_cards():
+    """
+    Rebuild the cached home page product cards after a change.
+    """
+    cards = refresh_homepage_cards()
+    return {section: len(products) for section, products in cards.items()}
+
+
+@shared_task
+def update_queued_related_products():
+    """
+    Recompute related products of products whose tags, categories, brand
+    or price changed.
+    """
+    updated = update_dirty_related_products()
+    if updated:
+        logger.info(f"Updated related products of {updated} products.")
+    return updated
+
+
+@shared_task
+def rebuild_related_products():
+    """
+    Recompute the related products of every active product.
+    """
+    updated = update_related_products()
+    logger.info(f"Rebuilt related products of {updated} products.")
+    return updated
+
+
+@shared_task
+def update_changed_product_recommendations():
+    """
+    Recompute the recommendations touched by new views and orders.
+    """
+    written = update_changed_recommendations()
+    if written:
+        logger.info(f"Updated {written} product recommendations.")
+    return written
+
+
+@shared_task
+def rebuild_product_recommendations():
+    """
+    Recompute the recommendations of every product.
+    """
+    written = update_recommendations()
+    logger.info(f"Rebuilt {written} product recommendations.")
+    return written
+
+
+@shared_task
+def apply_retention_policies():
+    """
+    Purge expired rows of the tables in settings.RETENTION_POLICIES.
+    """
+    return {run.label: run.purged for run in apply_policies()}
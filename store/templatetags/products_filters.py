@@ -1,4 +1,7 @@
 from django import template
+from django.utils.safestring import mark_safe
+
+from store.product_cards import PRODUCT_CARD_TEMPLATE, render_product_cards
 
 register = template.Library()
 
@@ -6,3 +9,23 @@ register = template.Library()
 @register.filter
 def top_only(products):
     return [p for p in products if p.top_product]
+
+
+def _context_ids(context, name):
+    ids = context.get(name) or ()
+    return ids() if callable(ids) else ids
+
+
+@register.simple_tag(takes_context=True)
+def product_cards(context, products, template=PRODUCT_CARD_TEMPLATE):
+    """
+    Render the cached cards of ``products`` with the visitor's cart and
+    favorite buttons.
+    """
+    cards = render_product_cards(
+        products,
+        cart_ids=_context_ids(context, "product_ids_in_cart"),
+        favorite_ids=_context_ids(context, "product_ids_in_favorite"),
+        template=template,
+    )
+    return mark_safe("".join(cards))
@@ -1,3 +1,946 @@
-from django.test import TestCase
+import time
+import uuid
+from datetime import timedelta
+from types import SimpleNamespace
 
-# Create your tests here.
+from django.contrib.admin.sites import AdminSite
+from django.contrib.auth import get_user_model
+from django.contrib.auth.signals import user_logged_in
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from users.history import write_visits
+from users.models import UserHistory
+
+from .admin import ProductAdmin
+from .caching import (
+    CacheEntry,
+    acquire_lock,
+    get_or_compute,
+    get_version,
+    release_lock,
+    set_cached,
+)
+from .cart_summary import get_cart_summary
+from .conditional import CATALOG_MODIFIED_KEY, invalidate_catalog
+from .facets import FACET_VERSION_KEY, get_category_facets
+from .models import (
+    Brand,
+    Cart,
+    CartItem,
+    CartSummary,
+    Category,
+    Color,
+    Comment,
+    Order,
+    Product,
+    ProductRating,
+    ProductRecommendations,
+    StockReservation,
+    Vote,
+)
+from .normalization import normalize_text, normalize_texts
+from .orders import place_order
+from .pagination import decode_cursor, encode_cursor, paginate_keyset
+from .product_cards import (
+    PRODUCT_ID_PLACEHOLDER,
+    bump_card_versions,
+    render_product_cards,
+)
+from .product_snapshots import PRODUCT_SNAPSHOT_CACHE_KEY, get_product_snapshots
+from .ratings import recompute_product_ratings
+from .recommendations import update_recommendations
+from .retention import apply_retention_policy, get_retention_policy
+from .search import search_products
+from .search_log import get_top_search_categories
+from .stock import (
+    InsufficientStock,
+    consume_stock,
+    limit_reservations,
+    release_expired_reservations,
+    release_holder,
+    renew_reservations,
+    reserve_stock,
+    transfer_reservations,
+)
+from .votes import cast_vote
+
+LOCAL_CACHE = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+class CountingCache(LocMemCache):
+    """A local memory cache counting its ``get_many`` calls."""
+
+    get_many_calls = 0
+
+    def get_many(self, keys, version=None):
+        CountingCache.get_many_calls += 1
+        return super().get_many(keys, version=version)
+
+
+COUNTING_CACHE = {"default": {"BACKEND": "store.tests.CountingCache"}}
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class StockReservationTests(TestCase):
+    def setUp(self):
+        brand = Brand.objects.create(
+            title="سامسونگ", english_title="Samsung", cover="brand.jpg"
+        )
+        self.product = Product.objects.create(
+            title="گوشی",
+            english_title="Phone",
+            brand=brand,
+            image="product.jpg",
+            price=1000,
+            stock=5,
+        )
+
+    def stock(self):
+        self.product.refresh_from_db(fields=["stock"])
+        return self.product.stock
+
+    def reserved(self, holder):
+        return (
+            StockReservation.objects.filter(holder=holder, product=self.product)
+            .values_list("quantity", flat=True)
+            .first()
+        )
+
+    def test_reserve_takes_only_the_difference(self):
+        reserve_stock(self.product.pk, "guest:a", 2)
+        reserve_stock(self.product.pk, "guest:a", 3)
+        self.assertEqual(self.stock(), 2)
+        self.assertEqual(self.reserved("guest:a"), 3)
+
+        reserve_stock(self.product.pk, "guest:a", 1)
+        self.assertEqual(self.stock(), 4)
+        self.assertEqual(self.reserved("guest:a"), 1)
+
+    def test_reserve_beyond_stock_raises(self):
+        reserve_stock(self.product.pk, "guest:a", 4)
+        with self.assertRaises(InsufficientStock) as raised:
+            reserve_stock(self.product.pk, "guest:b", 2)
+        self.assertEqual(raised.exception.available, 1)
+        self.assertEqual(self.stock(), 1)
+        self.assertIsNone(self.reserved("guest:b"))
+
+    def test_release_returns_units(self):
+        reserve_stock(self.product.pk, "guest:a", 3)
+        release_holder("guest:a")
+        self.assertEqual(self.stock(), 5)
+        self.assertIsNone(self.reserved("guest:a"))
+
+    def test_expired_reservations_are_released(self):
+        reserve_stock(self.product.pk, "guest:a", 2)
+        reserve_stock(self.product.pk, "guest:b", 1)
+        StockReservation.objects.filter(holder="guest:a").update(
+            expires_at=timezone.now() - timedelta(seconds=1)
+        )
+
+        self.assertEqual(release_expired_reservations(), 1)
+        self.assertEqual(self.stock(), 4)
+        self.assertIsNone(self.reserved("guest:a"))
+        self.assertEqual(self.reserved("guest:b"), 1)
+
+    def test_transfer_adds_up_reservations(self):
+        reserve_stock(self.product.pk, "guest:a", 2)
+        reserve_stock(self.product.pk, "customer:1", 1)
+        transfer_reservations("guest:a", "customer:1")
+        self.assertIsNone(self.reserved("guest:a"))
+        self.assertEqual(self.reserved("customer:1"), 3)
+        self.assertEqual(self.stock(), 2)
+
+    def test_limit_returns_surplus(self):
+        reserve_stock(self.product.pk, "customer:1", 4)
+        limit_reservations("customer:1", {self.product.pk: 1})
+        self.assertEqual(self.reserved("customer:1"), 1)
+        self.assertEqual(self.stock(), 4)
+
+        limit_reservations("customer:1", {self.product.pk: 0})
+        self.assertIsNone(self.reserved("customer:1"))
+        self.assertEqual(self.stock(), 5)
+
+    def test_renew_re_reserves_expired_lines(self):
+        reserve_stock(self.product.pk, "guest:a", 2)
+        StockReservation.objects.update(
+            expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        release_expired_reservations()
+
+        self.assertEqual(renew_reservations("guest:a", {self.product.pk: 2}), {})
+        self.assertEqual(self.reserved("guest:a"), 2)
+        self.assertEqual(self.stock(), 3)
+
+    def test_renew_leaves_short_lines_unreserved(self):
+        reserve_stock(self.product.pk, "guest:b", 4)
+        short = renew_reservations("guest:a", {self.product.pk: 2})
+        self.assertEqual(short, {self.product.pk: 0})
+        self.assertIsNone(self.reserved("guest:a"))
+        self.assertEqual(self.stock(), 1)
+
+    def test_consume_takes_unreserved_units(self):
+        reserve_stock(self.product.pk, "customer:1", 1)
+        consume_stock("customer:1", {self.product.pk: 3})
+        self.assertIsNone(self.reserved("customer:1"))
+        self.assertEqual(self.stock(), 2)
+
+    def test_reservations_keep_cached_snapshots(self):
+        get_product_snapshots([self.product.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_stock(self.product.pk, "guest:a", 2)
+            release_holder("guest:a")
+        key = PRODUCT_SNAPSHOT_CACHE_KEY.format(product_id=self.product.pk)
+        self.assertIsNotNone(cache.get(key))
+
+    def test_admin_applies_stock_edits_as_delta(self):
+        admin = ProductAdmin(Product, AdminSite())
+        edited = Product.objects.get(pk=self.product.pk)
+        edited.stock = 7
+        form = SimpleNamespace(changed_data=["stock"], initial={"stock": 5})
+
+        # Units reserved while the form was open stay out of stock.
+        reserve_stock(self.product.pk, "guest:a", 3)
+        admin.save_model(RequestFactory().post("/"), edited, form, change=True)
+        self.assertEqual(self.stock(), 4)
+        self.assertEqual(edited.stock, 4)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class ProductCardVersionTests(TestCase):
+    def test_save_keeps_concurrent_card_version_bumps(self):
+        brand = Brand.objects.create(
+            title="سامسونگ", english_title="Samsung", cover="brand.jpg"
+        )
+        product = Product.objects.create(
+            title="گوشی", brand=brand, image="product.jpg", price=1000, stock=5
+        )
+        product.refresh_from_db()
+        version = product.card_version
+
+        # Another worker bumps the version while this instance is in memory.
+        bump_card_versions([product.pk])
+        product.title = "گوشی جدید"
+        product.save()
+
+        product.refresh_from_db()
+        self.assertEqual(product.title, "گوشی جدید")
+        self.assertEqual(product.card_version, version + 2)
+
+    def test_reconcile_bumps_only_products_whose_totals_changed(self):
+        brand = Brand.objects.create(
+            title="سامسونگ", english_title="Samsung", cover="brand.jpg"
+        )
+        steady, drifted = (
+            Product.objects.create(
+                title=title, brand=brand, image="product.jpg", price=1000, stock=5
+            )
+            for title in ("گوشی", "تبلت")
+        )
+        recompute_product_ratings()
+        ProductRating.objects.filter(product=drifted).update(comment_count=3)
+        versions = dict(Product.objects.values_list("pk", "card_version"))
+
+        self.assertEqual(recompute_product_ratings(), 1)
+
+        self.assertEqual(
+            dict(Product.objects.values_list("pk", "card_version")),
+            {steady.pk: versions[steady.pk], drifted.pk: versions[drifted.pk] + 1},
+        )
+        self.assertEqual(ProductRating.objects.get(product=drifted).comment_count, 0)
+
+
+@override_settings(CACHES=COUNTING_CACHE)
+class ProductCardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        brand = Brand.objects.create(
+            title="سامسونگ", english_title="Samsung", cover="brand.jpg"
+        )
+        for title in ("گوشی", "تبلت", "ساعت"):
+            Product.objects.create(
+                title=title, brand=brand, image="product.jpg", price=1000, stock=5
+            )
+
+    def listing(self):
+        return list(Product.objects.with_rating().order_by("pk"))
+
+    def test_cached_cards_are_read_with_one_get_many(self):
+        render_product_cards(self.listing())
+        products = self.listing()
+        Product.objects.filter(pk=products[0].pk).update(title="گوشی جدید")
+        CountingCache.get_many_calls = 0
+
+        with self.assertNumQueries(0):
+            cards = render_product_cards(products)
+
+        self.assertEqual(CountingCache.get_many_calls, 1)
+        self.assertIn("گوشی", cards[0])
+        self.assertNotIn("گوشی جدید", cards[0])
+
+    def test_bumped_products_are_rendered_again(self):
+        render_product_cards(self.listing())
+        first = Product.objects.order_by("pk").first()
+        Product.objects.filter(pk=first.pk).update(title="گوشی جدید")
+        bump_card_versions([first.pk])
+        products = self.listing()
+
+        # Only the bumped card misses, so only its colors are prefetched.
+        with self.assertNumQueries(1):
+            cards = render_product_cards(products)
+
+        self.assertIn("گوشی جدید", cards[0])
+
+    def test_action_buttons_carry_the_product_id(self):
+        in_cart, favorite, plain = self.listing()
+
+        cards = render_product_cards(
+            [in_cart, favorite, plain],
+            cart_ids=[in_cart.pk],
+            favorite_ids=[favorite.pk],
+        )
+
+        for card in cards:
+            self.assertNotIn(PRODUCT_ID_PLACEHOLDER, card)
+        self.assertIn("ri-shopping-cart-fill", cards[0])
+        self.assertIn(f'data-index="{favorite.pk}"', cards[1])
+        self.assertIn(
+            f'remove-favorite-list" data-product-id="{favorite.pk}"', cards[1]
+        )
+        self.assertIn(f'add-favorite-home" data-product-id="{plain.pk}"', cards[2])
+        self.assertIn(f'data-index="{plain.pk}"', cards[2])
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        brand = Brand.objects.create(
+            title="سامسونگ", english_title="Samsung", cover="brand.jpg"
+        )
+        # Five products share a price, so pages break inside the tie.
+        for index, price in enumerate([1000] * 5 + [2000, 3000]):
+            Product.objects.create(
+                title=f"گوشی {index}",
+                brand=brand,
+                image="product.jpg",
+                price=price,
+                stock=5,
+            )
+
+    def test_pages_cover_ties_exactly_once(self):
+        queryset = Product.objects.order_by("-price")
+        seen, cursor = [], None
+        while True:
+            page = paginate_keyset(queryset, cursor, page_size=2)
+            seen.extend(product.pk for product in page)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+
+        self.assertEqual(
+            seen,
+            list(
+                Product.objects.order_by("-price", "-pk").values_list("pk", flat=True)
+            ),
+        )
+
+    def test_cursor_round_trips_its_values(self):
+        values = [timezone.now().replace(microsecond=0), 1000, 7]
+        cursor = encode_cursor(values)
+
+        decoded = decode_cursor(cursor, 3)
+
+        self.assertEqual(decoded, [values[0].isoformat(), 1000, 7])
+        self.assertIsNone(decode_cursor(cursor, 2))
+
+    def test_tampered_cursor_restarts_from_the_first_page(self):
+        queryset = Product.objects.order_by("price")
+        first = paginate_keyset(queryset, page_size=3)
+        second = paginate_keyset(queryset, first.next_cursor, page_size=3)
+        tampered = first.next_cursor[:-1] + (
+            "A" if first.next_cursor[-1] != "A" else "B"
+        )
+
+        self.assertIsNone(decode_cursor(tampered, 2))
+        self.assertEqual(
+            list(paginate_keyset(queryset, tampered, page_size=3)), list(first)
+        )
+        self.assertNotEqual(list(second), list(first))
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.brand = Brand.objects.create(
+            title="سامسونگ", english_title="Samsung", cover="brand.jpg"
+        )
+        self.phone = Product.objects.create(
+            title="گوشی گلکسی",
+            english_title="Galaxy Phone",
+            brand=self.brand,
+            image="product.jpg",
+            price=1000,
+            stock=5,
+        )
+        self.case = Product.objects.create(
+            title="قاب گوشی",
+            brand=self.brand,
+            image="product.jpg",
+            price=100,
+            stock=5,
+        )
+
+    def search(self, query):
+        return list(search_products(query))
+
+    def test_arabic_spellings_match_persian_titles(self):
+        self.assertEqual(self.search("گلكسي"), [self.phone])
+
+    def test_every_term_must_match(self):
+        self.assertEqual(self.search("گوشی samsung galaxy"), [self.phone])
+        self.assertEqual(self.search("گوشی اپل"), [])
+
+    def test_title_prefix_matches_rank_first(self):
+        self.assertEqual(self.search("گوشی"), [self.phone, self.case])
+
+    def test_documents_follow_brands_and_tags(self):
+        self.brand.title = "سامسونگ کره"
+        self.brand.save()
+        self.case.tags.add("محافظ")
+
+        self.assertEqual(self.search("کره قاب"), [self.case])
+        self.assertEqual(self.search("محافظ"), [self.case])
+
+    def test_inactive_products_and_blank_queries_are_skipped(self):
+        Product.objects.filter(pk=self.case.pk).update(is_active=False)
+
+        self.assertEqual(self.search("گوشی"), [self.phone])
+        self.assertEqual(self.search("  "), [])
+
+
+class NormalizationTests(TestCase):
+    def test_letters_digits_and_joiners_are_unified(self):
+        self.assertEqual(
+            normalize_text("  كتاب\u200cهاي ۱۲٣ Galaxy\u0640  "), "کتابهای 123 galaxy"
+        )
+
+    def test_batches_match_single_texts(self):
+        texts = ["يك", None, "a\x00b", "  ۴ "]
+
+        self.assertEqual(
+            normalize_texts(texts),
+            [normalize_text(text) for text in ["يك", None, "ab", "  ۴ "]],
+        )
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class CategoryFacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.samsung, self.apple = (
+            Brand.objects.create(title=title, english_title=title, cover="brand.jpg")
+            for title in ("Samsung", "Apple")
+        )
+        self.red, self.blue = (
+            Color.objects.create(name=name) for name in ("red", "blue")
+        )
+        self.parent = Category.objects.create(title="موبایل", is_parent=True)
+        child = Category.objects.create(
+            title="گوشی", is_parent=False, parent=self.parent
+        )
+        # (brand, color, price) of the products listed under the parent.
+        rows = [
+            (self.samsung, self.red, 1000),
+            (self.samsung, self.blue, 2000),
+            (self.apple, self.red, 3000),
+            (self.apple, self.red, 4000),
+        ]
+        for index, (brand, color, price) in enumerate(rows):
+            product = Product.objects.create(
+                title=f"گوشی {index}",
+                brand=brand,
+                image="product.jpg",
+                price=price,
+                stock=5,
+            )
+            product.categories.add(child)
+            product.colors.add(color)
+
+    def counts(self, options):
+        return {option.pk: option.product_count for option in options}
+
+    def test_counts_cover_the_category_subtree(self):
+        facets = get_category_facets(self.parent)
+
+        self.assertEqual(facets["total"], 4)
+        self.assertEqual(
+            self.counts(facets["brands"]), {self.samsung.pk: 2, self.apple.pk: 2}
+        )
+        self.assertEqual(
+            self.counts(facets["colors"]), {self.red.pk: 3, self.blue.pk: 1}
+        )
+
+    def test_a_facet_ignores_its_own_selection(self):
+        facets = get_category_facets(self.parent, brand_ids=[self.samsung.pk])
+
+        self.assertEqual(facets["total"], 2)
+        self.assertEqual(
+            self.counts(facets["brands"]), {self.samsung.pk: 2, self.apple.pk: 2}
+        )
+        self.assertEqual(
+            self.counts(facets["colors"]), {self.red.pk: 1, self.blue.pk: 1}
+        )
+        self.assertEqual([brand.selected for brand in facets["brands"]], [False, True])
+
+    def test_price_ranges_narrow_the_other_facets(self):
+        facets = get_category_facets(
+            self.parent, color_ids=[self.red.pk], min_price=1500, max_price=3500
+        )
+
+        self.assertEqual(facets["total"], 1)
+        self.assertEqual(
+            self.counts(facets["brands"]), {self.samsung.pk: 0, self.apple.pk: 1}
+        )
+        self.assertEqual(
+            sum(bucket["product_count"] for bucket in facets["price_buckets"]), 3
+        )
+
+    def test_product_changes_replace_the_version_after_commit(self):
+        get_category_facets(self.parent)
+        version = get_version(FACET_VERSION_KEY)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(price=1000).first().colors.add(self.blue)
+            self.assertEqual(get_version(FACET_VERSION_KEY), version)
+
+        self.assertNotEqual(get_version(FACET_VERSION_KEY), version)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class GetOrComputeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.key = f"test:{uuid.uuid4().hex}"
+        self.calls = 0
+        self.addCleanup(release_lock, self.key)
+
+    def compute(self):
+        self.calls += 1
+        return self.calls
+
+    def test_misses_compute_once_and_hits_reuse_the_entry(self):
+        self.assertEqual(get_or_compute(self.key, self.compute, timeout=60), 1)
+        release_lock(self.key)
+        self.assertEqual(get_or_compute(self.key, self.compute, timeout=60), 1)
+
+        entry = cache.get(self.key)
+        self.assertIsInstance(entry, CacheEntry)
+        self.assertGreater(entry.expires_at, time.time())
+
+    def test_slow_values_near_expiry_refresh_early(self):
+        # Computing took far longer than the time left, so XFetch refreshes.
+        set_cached(self.key, "old", timeout=60, delta=10**9)
+
+        self.assertEqual(get_or_compute(self.key, self.compute, timeout=60), 1)
+        release_lock(self.key)
+        set_cached(self.key, "old", timeout=60, delta=10**9)
+        self.assertEqual(
+            get_or_compute(self.key, self.compute, timeout=60, beta=0), "old"
+        )
+
+    def test_outdated_entries_are_served_while_another_worker_refreshes(self):
+        set_cached(self.key, "old", timeout=60, version=1)
+        acquire_lock(self.key)
+
+        self.assertEqual(get_or_compute(self.key, self.compute, version=2), "old")
+        self.assertEqual(self.calls, 0)
+
+        release_lock(self.key)
+        self.assertEqual(get_or_compute(self.key, self.compute, version=2), 1)
+
+    def test_failed_background_refresh_serves_the_stale_value(self):
+        set_cached(self.key, "old", timeout=60, version=1)
+
+        def refresh():
+            raise ConnectionError
+
+        with self.assertLogs("store.caching", "WARNING") as logs:
+            value = get_or_compute(self.key, self.compute, version=2, refresh=refresh)
+
+        self.assertEqual(value, "old")
+        self.assertEqual(self.calls, 0)
+        self.assertIn(
+            f"WARNING:store.caching:Could not start the refresh of {self.key}.",
+            [line.splitlines()[0] for line in logs.output],
+        )
+
+    def test_waiters_compute_themselves_when_no_entry_appears(self):
+        acquire_lock(self.key)
+
+        self.assertEqual(get_or_compute(self.key, self.compute), 1)
+        self.assertIsNone(cache.get(self.key))
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        brand = Brand.objects.create(
+            title="سامسونگ", english_title="Samsung", cover="brand.jpg"
+        )
+        product = Product.objects.create(
+            title="گوشی", brand=brand, image="product.jpg", price=1000, stock=5
+        )
+        # Everything, including the header categories, last changed an hour
+        # ago.
+        get_top_search_categories()
+        an_hour_ago = timezone.now() - timedelta(hours=1)
+        Product.objects.filter(pk=product.pk).update(datetime_updated=an_hour_ago)
+        cache.set(CATALOG_MODIFIED_KEY, an_hour_ago, timeout=None)
+        self.url = reverse("store:product-quick-view", args=[product.pk])
+
+    def test_matching_etags_are_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("public", response["Cache-Control"])
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_catalog_changes_move_etag_and_last_modified(self):
+        first = self.client.get(self.url)
+        self.assertEqual(
+            self.client.get(
+                self.url, HTTP_IF_MODIFIED_SINCE=first["Last-Modified"]
+            ).status_code,
+            304,
+        )
+
+        invalidate_catalog()
+
+        for header, value in (
+            ("HTTP_IF_NONE_MATCH", first["ETag"]),
+            ("HTTP_IF_MODIFIED_SINCE", first["Last-Modified"]),
+        ):
+            response = self.client.get(self.url, **{header: value})
+            self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["Last-Modified"], first["Last-Modified"])
+
+
+class RecommendationTests(TestCase):
+    def setUp(self):
+        brand = Brand.objects.create(
+            title="سامسونگ", english_title="Samsung", cover="brand.jpg"
+        )
+        self.phone, self.case, self.charger, self.watch = (
+            Product.objects.create(
+                title=title, brand=brand, image="product.jpg", price=1000, stock=5
+            )
+            for title in ("گوشی", "قاب", "شارژر", "ساعت")
+        )
+        self.customers = [
+            get_user_model().objects.create(mobile=f"0912000000{index}").customer
+            for index in range(3)
+        ]
+        self.an_hour_ago = timezone.now() - timedelta(hours=1)
+
+    def visit(self, customer, *products):
+        write_visits(
+            {(customer.pk, product.pk): self.an_hour_ago for product in products}
+        )
+
+    def also_viewed(self, product):
+        return ProductRecommendations.objects.get(product=product).also_viewed
+
+    def test_products_viewed_together_recommend_each_other(self):
+        self.visit(self.customers[0], self.phone, self.case)
+        self.visit(self.customers[1], self.phone, self.case, self.charger)
+        self.visit(self.customers[2], self.watch)
+
+        update_recommendations()
+
+        self.assertEqual(self.also_viewed(self.phone), [self.case.pk, self.charger.pk])
+        self.assertEqual(self.also_viewed(self.charger), [self.phone.pk, self.case.pk])
+        self.assertFalse(
+            ProductRecommendations.objects.filter(product=self.watch).exists()
+        )
+
+    def test_full_rebuilds_clear_rows_no_basket_holds(self):
+        self.visit(self.customers[0], self.phone, self.case)
+        update_recommendations()
+        UserHistory.objects.filter(customer=self.customers[0]).delete()
+
+        update_recommendations()
+
+        self.assertFalse(ProductRecommendations.objects.exists())
+
+    def test_visits_flushed_late_reach_the_incremental_pass(self):
+        self.visit(self.customers[0], self.phone, self.case)
+        since = timezone.now()
+        # Buffered while the previous pass ran, flushed afterwards.
+        self.visit(self.customers[0], self.watch)
+
+        update_recommendations(since=since)
+
+        self.assertEqual(self.also_viewed(self.watch), [self.phone.pk, self.case.pk])
+        self.assertIn(self.watch.pk, self.also_viewed(self.phone))
+        self.assertFalse(
+            ProductRecommendations.objects.filter(product=self.charger).exists()
+        )
+
+
+class RetentionTests(TestCase):
+    def setUp(self):
+        brand = Brand.objects.create(
+            title="سامسونگ", english_title="Samsung", cover="brand.jpg"
+        )
+        products = [
+            Product.objects.create(
+                title=f"گوشی {index}",
+                brand=brand,
+                image="product.jpg",
+                price=1000,
+                stock=5,
+            )
+            for index in range(6)
+        ]
+        customer = get_user_model().objects.create(mobile="09120000001").customer
+        long_ago = timezone.now() - timedelta(days=60)
+        write_visits({(customer.pk, product.pk): long_ago for product in products[:5]})
+        write_visits({(customer.pk, products[5].pk): timezone.now()})
+        self.recent = products[5]
+
+    def apply(self, **options):
+        policy = {"field": "datetime_visited", "days": 30, **options}
+        with self.settings(RETENTION_POLICIES={"users.UserHistory": policy}):
+            return apply_retention_policy(get_retention_policy("users.UserHistory"))
+
+    def test_expired_rows_are_purged_in_chunks(self):
+        with CaptureQueriesContext(connection) as queries:
+            run = self.apply(chunk_size=2)
+
+        self.assertEqual((run.purged, run.finished), (5, True))
+        self.assertEqual(
+            list(UserHistory.objects.values_list("product", flat=True)),
+            [self.recent.pk],
+        )
+        deletes = [query for query in queries if query["sql"].startswith("DELETE")]
+        self.assertEqual(len(deletes), 3)
+
+    def test_spent_time_budgets_resume_on_the_next_run(self):
+        run = self.apply(chunk_size=2, time_budget=0)
+
+        self.assertEqual((run.purged, run.finished), (2, False))
+        self.assertEqual(UserHistory.objects.count(), 4)
+
+        self.apply(chunk_size=2)
+        self.assertEqual(UserHistory.objects.count(), 1)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class SessionCartMergeTests(TestCase):
+    def setUp(self):
+        brand = Brand.objects.create(
+            title="سامسونگ", english_title="Samsung", cover="brand.jpg"
+        )
+        self.products = [
+            Product.objects.create(
+                title=f"گوشی {index}",
+                brand=brand,
+                image="product.jpg",
+                price=1000,
+                stock=4,
+            )
+            for index in range(4)
+        ]
+
+    def log_in(self, mobile, session_lines, cart_lines=()):
+        user = get_user_model().objects.create(mobile=mobile)
+        cart = Cart.objects.create(customer=user.customer)
+        for product, quantity in cart_lines:
+            CartItem.objects.create(cart=cart, product=product, quantity=quantity)
+
+        request = RequestFactory().get("/")
+        request.user = user
+        request.session = SessionStore()
+        request.session["cart"] = {
+            str(product.pk): {"quantity": quantity}
+            for product, quantity in session_lines
+        }
+        with CaptureQueriesContext(connection) as queries:
+            user_logged_in.send(sender=type(user), user=user, request=request)
+        return cart, request, len(queries)
+
+    def test_session_lines_are_added_to_the_database_cart(self):
+        first, second, third, _ = self.products
+        cart, request, _ = self.log_in(
+            "09120000001",
+            [(first, 2), (second, 3), (third, 9)],
+            cart_lines=[(first, 1)],
+        )
+
+        self.assertEqual(
+            dict(cart.items.values_list("product", "quantity")),
+            {first.pk: 3, second.pk: 3, third.pk: 4},
+        )
+        self.assertEqual(request.session["cart"], {})
+
+    def test_queries_do_not_grow_with_session_lines(self):
+        # Both merges change one line and create the others.
+        _, _, few = self.log_in(
+            "09120000001",
+            [(product, 1) for product in self.products[:2]],
+            cart_lines=[(self.products[0], 1)],
+        )
+        _, _, many = self.log_in(
+            "09120000002",
+            [(product, 1) for product in self.products],
+            cart_lines=[(self.products[0], 1)],
+        )
+
+        self.assertEqual(few, many)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class VoteTests(TestCase):
+    def test_deleting_a_user_withdraws_their_votes(self):
+        brand = Brand.objects.create(
+            title="سامسونگ", english_title="Samsung", cover="brand.jpg"
+        )
+        product = Product.objects.create(
+            title="گوشی", brand=brand, image="product.jpg", price=1000, stock=5
+        )
+        author, fan, critic = (
+            get_user_model().objects.create(mobile=mobile)
+            for mobile in ("09120000001", "09120000002", "09120000003")
+        )
+        comment = Comment.objects.create(
+            product=product,
+            user=author,
+            title="خوب",
+            text="خوب بود",
+            advantages=[],
+            disadvantages=[],
+            build_quality=5,
+            value_for_price=5,
+            innovation=5,
+            features=5,
+            ease_of_use=5,
+            design=5,
+        )
+        cast_vote(fan, comment, Vote.LIKE)
+        cast_vote(critic, comment, Vote.DISLIKE)
+
+        fan_id = fan.pk
+        fan.delete()
+        comment.refresh_from_db()
+        self.assertEqual((comment.num_likes, comment.num_dislikes), (0, 1))
+        self.assertFalse(Vote.objects.filter(user_id=fan_id).exists())
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class PlaceOrderTests(TestCase):
+    def setUp(self):
+        self.brand = Brand.objects.create(
+            title="سامسونگ", english_title="Samsung", cover="brand.jpg"
+        )
+
+    def create_cart(self, lines, mobile):
+        customer = get_user_model().objects.create(mobile=mobile).customer
+        cart = Cart.objects.create(customer=customer)
+        products = Product.objects.bulk_create(
+            Product(
+                title=f"گوشی {index}",
+                slug=f"{mobile}-{index}",
+                brand=self.brand,
+                image="product.jpg",
+                price=1000,
+                stock=5,
+            )
+            for index in range(lines)
+        )
+        CartItem.objects.bulk_create(
+            CartItem(cart=cart, product=product, quantity=2) for product in products
+        )
+        return customer, cart
+
+    def place_order_queries(self, lines, mobile):
+        customer, cart = self.create_cart(lines, mobile)
+        with CaptureQueriesContext(connection) as queries:
+            order = place_order(customer, cart.pk)
+        self.assertEqual(order.items.count(), lines)
+        self.assertFalse(Cart.objects.filter(pk=cart.pk).exists())
+        return len(queries)
+
+    def test_queries_do_not_grow_with_cart_lines(self):
+        self.assertEqual(
+            self.place_order_queries(5, "09120000001"),
+            self.place_order_queries(50, "09120000002"),
+        )
+
+    def test_checkout_places_the_posted_cart_once(self):
+        customer, cart = self.create_cart(2, "09120000001")
+        self.client.force_login(customer.user)
+        url = reverse("store:checkout")
+
+        response = self.client.get(url)
+        self.assertContains(response, f'name="cart_key" value="{cart.pk}"')
+
+        data = {"cart_key": str(cart.pk), "payment_method": "cash"}
+        first = self.client.post(url, data)
+        second = self.client.post(url, data)
+        order = Order.objects.get(customer=customer)
+        self.assertEqual(order.total_price, 4000)
+        for response in (first, second):
+            self.assertTemplateUsed(response, "store/order/checkout-successful.html")
+            self.assertEqual(response.context["order"], order)
+
+        response = self.client.post(url, {"cart_key": "invalid"})
+        self.assertContains(response, "سبد خرید شما خالی است.")
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class CartSummaryTests(TestCase):
+    def setUp(self):
+        brand = Brand.objects.create(
+            title="سامسونگ", english_title="Samsung", cover="brand.jpg"
+        )
+        self.customer = get_user_model().objects.create(mobile="09120000001").customer
+        self.cart = Cart.objects.create(customer=self.customer)
+        for price, discount_price, quantity in (
+            (1000, 800, 2),
+            (500, None, 1),
+            (300, 0, 3),
+        ):
+            product = Product.objects.create(
+                title=f"گوشی {price}",
+                brand=brand,
+                image="product.jpg",
+                price=price,
+                discount_price=discount_price,
+                stock=5,
+            )
+            CartItem.objects.create(cart=self.cart, product=product, quantity=quantity)
+
+    def test_summary_is_one_aggregate(self):
+        with self.assertNumQueries(1):
+            summary = self.cart.summary()
+        self.assertEqual(summary, CartSummary(6, 3000, 3400, 400))
+
+    def test_with_summary_annotates_carts(self):
+        expected = self.cart.summary()
+        cart = Cart.objects.with_summary().get(pk=self.cart.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(cart.summary(), expected)
+
+    def test_cached_lines_match_the_aggregate(self):
+        contents = get_cart_summary(self.customer)
+        self.assertEqual(contents.summary, self.cart.summary())
+        self.assertEqual(len(contents.items), 3)
+        with self.assertRaises(AttributeError):
+            contents.summary.total_price = 0
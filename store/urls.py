@@ -66,6 +66,7 @@ urlpatterns = [
         name="brand-list",
     ),
     path("top_products/", views.top_products_view, name="top-products"),
+    path("load-more/", views.load_more_products, name="load-more-products"),
     path("quick-view/<int:pk>/", views.product_quick_view, name="product-quick-view"),
     # carts
     path("cart/", views.cart_view, name="cart"),
@@ -1,2 +1,29 @@
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+
+
 def get_filename(filename, request):
     return filename.upper()
+
+
+@lru_cache(maxsize=None)
+def get_redis_client():
+    """
+    Return a shared Redis client for data structures the cache API lacks.
+    """
+
+    return redis.Redis.from_url(settings.REDIS_URL)
+
+
+def get_unit_price(price, discount_price):
+    """
+    Return the price charged per unit of a product.
+
+    A discount price of zero counts as no discount, like in
+    ``Product.clean`` and ``Product.get_discount_percentage``, so carts,
+    summaries and orders always charge what the product page shows.
+    """
+
+    return discount_price if discount_price else price
@@ -1,22 +1,10 @@
 import json
-from datetime import datetime
-from statistics import mean
+import uuid
 
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
-from django.core.cache import cache
-from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
-from django.db.models import (
-    Avg,
-    Count,
-    ExpressionWrapper,
-    F,
-    FloatField,
-    Max,
-    Min,
-    Prefetch,
-    Q,
-)
+from django.db import transaction
+from django.db.models import Max, Min, Prefetch
 from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
@@ -24,27 +12,48 @@ from django.utils.translation import gettext_lazy as _
 from django.views.decorators.http import require_GET, require_POST
 from taggit.models import Tag
 
-from users.models import UserHistory
+from users.history import record_visit
 
 from .cart import Cart as SessionCart
+from .conditional import conditional_page, get_product_stamp
+from .context_processors import global_context
+from .facets import get_category_facets
 from .forms import AnswerForm, CommentForm, ContactUsForm, QuestionForm
+from .homepage import get_homepage_cards
 from .models import (
+    Address,
     Answer,
     Brand,
     Cart,
     CartItem,
     Category,
     CategoryOfQuestion,
-    Color,
     Comment,
     Customer,
     FavoriteList,
     Product,
     Question,
     QuestionsOfSites,
-    SearchLog,
+    Vote,
     Wishlist,
 )
+from .orders import EmptyCart, place_order
+from .pagination import paginate_keyset
+from .product_cards import render_product_cards
+from .ratings import get_rating_averages
+from .recommendations import get_recommended_products
+from .related import get_related_products
+from .search import search_products
+from .search_log import buffer_search_log, get_top_search_categories
+from .stock import (
+    InsufficientStock,
+    get_stock_holder,
+    release_stock,
+    renew_reservations,
+    reserve_stock,
+)
+from .suggestions import get_suggestions
+from .votes import cast_vote, get_user_votes
 
 User = get_user_model()
 
@@ -71,39 +80,12 @@ def contact_us_view(request):
 
 def home_page_view(request):
     """
-    Render the homepage with a list of active products.
-    Cached categories and colors are loaded via Redis.
+    Render the homepage with the newest and top product cards.
+    Cards are cached as plain dicts and rebuilt when products change.
     """
-    # Cache categories if not already cached
-    products = cache.get("homepage_products")
-    if products is None:
-        products = (
-            Product.objects.filter(is_active=True)
-            .prefetch_related("colors", "comments")
-            .annotate(
-                approved_comment_count=Count(
-                    "comments", filter=Q(comments__is_approved=True)
-                ),
-                avg_total_rating=Avg(
-                    ExpressionWrapper(
-                        (
-                            F("comments__build_quality")
-                            + F("comments__value_for_price")
-                            + F("comments__innovation")
-                            + F("comments__features")
-                            + F("comments__ease_of_use")
-                            + F("comments__design")
-                        )
-                        / 6.0,
-                        output_field=FloatField(),
-                    ),
-                    filter=Q(comments__is_approved=True),
-                ),
-            )
-        )
-        cache.set("homepage_products", products, timeout=3600)
+    cards = get_homepage_cards()
 
-    context = {"products": products}
+    context = {"newest_products": cards["newest"], "top_products": cards["top"]}
     return render(request, "store/home_page.html", context)
 
 
@@ -111,36 +93,23 @@ def home_page_view(request):
 def search_results_view(request):
     query = request.GET.get("q", "").strip()
 
-    products = Product.objects.filter(is_active=True)
-    if query:
-        products = products.filter(
-            Q(title__icontains=query)
-            | Q(english_title__icontains=query)
-            | Q(tags__name__icontains=query)
-        ).distinct()
-    else:
-        products = products.none()
-
-    if query and products.exists():
-        first_product = products.first()
-        category = first_product.categories.first() if first_product else None
-        SearchLog.objects.create(
-            user=request.user if request.user.is_authenticated else None,
-            query=query,
-            category=category,
+    products = paginate_keyset(search_products(query), cursor=request.GET.get("cursor"))
+
+    if query and products and not request.GET.get("cursor"):
+        buffer_search_log(
+            query,
+            products.items[0].pk,
+            user_id=request.user.pk if request.user.is_authenticated else None,
         )
 
-    top_search_categories = (
-        Category.objects.filter(search_logs__isnull=False)
-        .annotate(search_count=Count("search_logs"))
-        .order_by("-search_count")[:5]
-    )
+    top_search_categories = get_top_search_categories()
 
     default_search_categories = Category.objects.filter(show_in_search_default=True)[:5]
 
     context = {
         "query": query,
         "products": products,
+        "load_more_url": get_load_more_url(request, "search"),
         "top_search_categories": top_search_categories,
         "default_search_categories": default_search_categories,
     }
@@ -149,41 +118,15 @@ def search_results_view(request):
 
 
 @require_GET
+@conditional_page(personal=False)
 def search_suggestions_view(request):
     query = request.GET.get("q", "").strip()
 
-    suggestions = []
-    if len(query) >= 4:
-        products_qs = (
-            Product.objects.filter(is_active=True)
-            .filter(
-                Q(title__icontains=query)
-                | Q(english_title__icontains=query)
-                | Q(tags__name__icontains=query)
-            )
-            .distinct()[:10]
-        )
-        suggestions = [
-            {
-                "title": product.title,
-                "url": product.get_absolute_url(),
-                "image": product.image.url if product.image else "",
-            }
-            for product in products_qs
-        ]
-
-    top_categories_qs = (
-        Category.objects.filter(search_logs__isnull=False)
-        .annotate(search_count=Count("search_logs"))
-        .order_by("-search_count")[:5]
-    )
+    suggestions = get_suggestions(query)
 
     top_categories = [
-        {
-            "title": category.title,
-            "url": reverse("store:category-list", kwargs={"slug": category.slug}),
-        }
-        for category in top_categories_qs
+        {"title": category["title"], "url": category["url"]}
+        for category in get_top_search_categories()
     ]
 
     default_categories_qs = Category.objects.filter(show_in_search_default=True)[:5]
@@ -233,28 +176,32 @@ def faq_question_view(request, slug):
 
 
 @require_GET
+@conditional_page(stamp_func=get_product_stamp, personal=False)
 def product_quick_view(request, pk):
     """
     Return product data for a quick view modal as JSON.
     Includes colors, images, tags, attributes, ratings, and Q&A count.
     """
     try:
-        product = Product.objects.prefetch_related(
-            "colors",
-            "images",
-            "attributes",
-            "tags",
-            Prefetch(
-                "questions",
-                queryset=Question.objects.filter(is_approved=True).prefetch_related(
-                    Prefetch(
-                        "answers",
-                        queryset=Answer.objects.filter(is_approved=True).only("id"),
-                    )
+        product = (
+            Product.objects.with_rating()
+            .prefetch_related(
+                "colors",
+                "images",
+                "attributes",
+                "tags",
+                Prefetch(
+                    "questions",
+                    queryset=Question.objects.filter(is_approved=True).prefetch_related(
+                        Prefetch(
+                            "answers",
+                            queryset=Answer.objects.filter(is_approved=True).only("id"),
+                        )
+                    ),
                 ),
-            ),
-            Prefetch("comments", queryset=Comment.objects.filter(is_approved=True)),
-        ).get(pk=pk)
+            )
+            .get(pk=pk)
+        )
 
         # Use fallback image if gallery is empty
         gallery = [img.image.url for img in product.images.all()]
@@ -267,28 +214,6 @@ def product_quick_view(request, pk):
         answers_count = sum(len(q.answers.all()) for q in questions)
         questions_and_answers_count = questions_count + answers_count
 
-        # Count approved comments and calculate average rating
-        comments = product.comments.filter(is_approved=True)
-        total_comments = len(comments)
-
-        if total_comments:
-            total_rating = sum(
-                (
-                    comment.build_quality
-                    + comment.value_for_price
-                    + comment.innovation
-                    + comment.features
-                    + comment.ease_of_use
-                    + comment.design
-                )
-                / 6.0
-                for comment in comments
-            )
-            average_rating = round(total_rating / total_comments, 1)
-        else:
-            total_comments = 0
-            average_rating = 0.0
-
         # Prepare data for JSON response
         data = {
             "id": product.id,
@@ -308,9 +233,9 @@ def product_quick_view(request, pk):
                 {"key": attr.key, "value": attr.value}
                 for attr in product.attributes.all()
             ],
-            "comments_count": total_comments,
+            "comments_count": product.approved_comment_count,
             "questions_and_answers_count": questions_and_answers_count,
-            "average_rating": average_rating,
+            "average_rating": round(product.avg_total_rating or 0.0, 1),
         }
         return JsonResponse({"success": True, "product": data})
 
@@ -318,101 +243,132 @@ def product_quick_view(request, pk):
         return JsonResponse({"success": False, "message": "محصول یافت نشد"}, status=404)
 
 
-def product_category_listview(request, slug):
-    """
-    Show products in the selected category along with:
-    - Prefetched colors
-    - Annotated average rating and approved comment count
-    - Children categories
-    """
+PRODUCT_SORTS = {
+    "most_visited": ("-id",),
+    "best_selling": ("-id",),
+    "most_popular": ("-avg_total_rating", "-id"),
+    "newest": ("-datetime_created", "-id"),
+    "cheapest": ("price", "id"),
+    "most_expensive": ("-price", "-id"),
+}
+DEFAULT_PRODUCT_SORT = "most_visited"
 
-    color_prefetch = Prefetch("colors", queryset=Color.objects.all())
 
-    base_qs = (
-        Product.objects.filter(is_active=True)
-        .prefetch_related(color_prefetch)
-        .annotate(
-            approved_comment_count=Count(
-                "comments", filter=Q(comments__is_approved=True)
-            ),
-            avg_total_rating=Avg(
-                ExpressionWrapper(
-                    (
-                        F("comments__build_quality")
-                        + F("comments__value_for_price")
-                        + F("comments__innovation")
-                        + F("comments__features")
-                        + F("comments__ease_of_use")
-                        + F("comments__design")
-                    )
-                    / 6.0,
-                    output_field=FloatField(),
-                ),
-                filter=Q(comments__is_approved=True),
-            ),
-        )
-    )
+def listing_products():
+    """
+    Return active products with the rating every product card renders.
 
-    category = get_object_or_404(
-        Category.objects.prefetch_related(
-            Prefetch("products", queryset=base_qs),
-        ),
-        slug=slug,
-    )
+    Colors are only loaded for cards missing from the fragment cache.
+    """
+    return Product.objects.filter(is_active=True).with_rating()
 
-    products = category.products.all()
 
-    brands = Brand.objects.filter(products__in=products).distinct()
-    colors = Color.objects.filter(product__in=products).distinct()
+def sort_products(products, sort, default=DEFAULT_PRODUCT_SORT):
+    """
+    Order products by one of the ``PRODUCT_SORTS`` options.
 
-    brand_ids = request.GET.getlist("brand")
-    color_ids = request.GET.getlist("color")
-    min_price = request.GET.get("min_price")
-    max_price = request.GET.get("max_price")
-    sort = request.GET.get("sort", "most_visited")
+    Every ordering ends with the primary key so it can be used as a keyset
+    pagination key.
+    """
+    return products.order_by(*PRODUCT_SORTS.get(sort, PRODUCT_SORTS[default]))
 
-    try:
-        selected_brand_ids = [int(b) for b in brand_ids]
-    except (TypeError, ValueError):
-        selected_brand_ids = []
 
+def get_id_list(params, key):
     try:
-        selected_color_ids = [int(c) for c in color_ids]
+        return [int(value) for value in params.getlist(key)]
     except (TypeError, ValueError):
-        selected_color_ids = []
-
-    if selected_brand_ids:
-        products = products.filter(brand_id__in=selected_brand_ids)
-
-    if selected_color_ids:
-        products = products.filter(colors__id__in=selected_color_ids).distinct()
-
-    price_filters = {}
-    if min_price and min_price.isdigit():
-        price_filters["price__gte"] = int(min_price)
-    if max_price and max_price.isdigit():
-        price_filters["price__lte"] = int(max_price)
-
-    if price_filters:
-        products = products.filter(**price_filters)
-
-    sort_map = {
-        "most_visited": "-id",
-        "best_selling": "-id",
-        "most_popular": "-avg_total_rating",
-        "newest": "-datetime_created",
-        "cheapest": "-price",
-        "most_expensive": "price",
+        return []
+
+
+def get_price_param(params, key):
+    value = params.get(key)
+    return int(value) if value and value.isdigit() else None
+
+
+def get_listing_filters(params):
+    """
+    Read the brand, color and price filters of a category listing.
+    """
+    return {
+        "brand_ids": get_id_list(params, "brand"),
+        "color_ids": get_id_list(params, "color"),
+        "min_price": get_price_param(params, "min_price"),
+        "max_price": get_price_param(params, "max_price"),
     }
 
-    order_by_field = sort_map.get(sort, "-id")
-    products = products.order_by(order_by_field)
 
-    selected_brand_ids = (
-        [int(b) for b in selected_brand_ids] if selected_brand_ids else []
+def category_listing_products(category, params):
+    """
+    Return the products of a category filtered and sorted by ``params``.
+
+    Args:
+        category (Category): The listed category.
+        params (QueryDict): Query string with brand, color, price and sort
+            filters.
+    """
+    products = listing_products().in_category(category)
+    filters = get_listing_filters(params)
+
+    if filters["brand_ids"]:
+        products = products.filter(brand_id__in=filters["brand_ids"])
+    if filters["color_ids"]:
+        products = products.filter(colors__id__in=filters["color_ids"]).distinct()
+    if filters["min_price"] is not None:
+        products = products.filter(price__gte=filters["min_price"])
+    if filters["max_price"] is not None:
+        products = products.filter(price__lte=filters["max_price"])
+
+    return sort_products(products, params.get("sort"))
+
+
+def brand_listing_products(brand, params):
+    return sort_products(listing_products().filter(brand=brand), params.get("sort"))
+
+
+def tag_listing_products(tag, params):
+    products = listing_products()
+    if tag is not None:
+        products = products.filter(tags__in=[tag])
+    return sort_products(products, params.get("sort"), default="newest")
+
+
+def top_listing_products(params):
+    return sort_products(
+        listing_products().filter(top_product=True), params.get("sort")
     )
-    selected_color_ids = (
-        [int(c) for c in selected_color_ids] if selected_color_ids else []
+
+
+def get_load_more_url(request, listing, **params):
+    """
+    Build the URL the "load more" button fetches the next page from.
+
+    The current filters are kept so every page applies the same ones.
+    """
+    query = request.GET.copy()
+    query.pop("cursor", None)
+    query["listing"] = listing
+    for key, value in params.items():
+        query[key] = value
+    return f"{reverse('store:load-more-products')}?{query.urlencode()}"
+
+
+@conditional_page()
+def product_category_listview(request, slug):
+    """
+    Show products in the selected category along with:
+    - Prefetched colors
+    - Average rating and approved comment count
+    - Brand, color and price facets with product counts
+    The products are paginated with keyset cursors.
+    """
+
+    category = get_object_or_404(Category, slug=slug)
+    filters = get_listing_filters(request.GET)
+    facets = get_category_facets(category, **filters)
+
+    products = paginate_keyset(
+        category_listing_products(category, request.GET),
+        cursor=request.GET.get("cursor"),
     )
 
     breadcrumb = get_category_breadcrumb(category)
@@ -423,93 +379,57 @@ def product_category_listview(request, slug):
         {
             "categories": category,
             "products": products,
-            "brands": brands,
-            "colors": colors,
+            "load_more_url": get_load_more_url(request, "category", slug=slug),
+            "brands": facets["brands"],
+            "colors": facets["colors"],
+            "price_buckets": facets["price_buckets"],
+            "total_products": facets["total"],
             "breadcrumb": breadcrumb,
-            "selected_brand_ids": selected_brand_ids,
-            "selected_color_ids": selected_color_ids,
-            "min_price": min_price,
-            "max_price": max_price,
-            "current_sort": sort,
+            "selected_brand_ids": filters["brand_ids"],
+            "selected_color_ids": filters["color_ids"],
+            "min_price": filters["min_price"],
+            "max_price": filters["max_price"],
+            "current_sort": request.GET.get("sort", DEFAULT_PRODUCT_SORT),
         },
     )
 
 
+@conditional_page()
 def product_brand_listview(request, slug):
+    brand = get_object_or_404(Brand, slug=slug)
 
-    products_qs = (
-        Product.objects.filter(is_active=True)
-        .annotate(
-            approved_comment_count=Count(
-                "comments", filter=Q(comments__is_approved=True)
-            ),
-            avg_total_rating=Avg(
-                ExpressionWrapper(
-                    (
-                        F("comments__build_quality")
-                        + F("comments__value_for_price")
-                        + F("comments__innovation")
-                        + F("comments__features")
-                        + F("comments__ease_of_use")
-                        + F("comments__design")
-                    )
-                    / 6.0,
-                    output_field=FloatField(),
-                ),
-                filter=Q(comments__is_approved=True),
-            ),
-        )
-        .prefetch_related("colors")
-    )
-
-    brand = get_object_or_404(
-        Brand.objects.prefetch_related(
-            Prefetch("products", queryset=products_qs),
-        ),
-        slug=slug,
+    products = paginate_keyset(
+        brand_listing_products(brand, request.GET), cursor=request.GET.get("cursor")
     )
 
-    # tab = request.GET.get("tab", "most_visited")
-
-    # order_by = {
-    #     "most_visited": "-id",
-    #     "best_selling": "-id",
-    #     "most_popular": "-id",
-    #     "newest": "-datetime_created",
-    #     "cheapest": "price",
-    #     "most_expensive": "-price",
-    # }.get(tab, "-id")
-
-    products = brand.products.all()
-
     return render(
         request,
         "store/brand-list.html",
         {
             "brand": brand,
             "products": products,
+            "load_more_url": get_load_more_url(request, "brand", slug=slug),
         },
     )
 
 
 def get_category_breadcrumb(category):
-    breadcrumb = []
-    while category is not None:
-        breadcrumb.append(category)
-        category = category.parent
-    return breadcrumb[::-1]
+    return list(category.get_ancestors(include_self=True))
 
 
+@conditional_page(stamp_func=get_product_stamp, anonymous_only=True)
 def product_details_view(request, slug):
     """
     Render the product detail page with full product information,
     including images, attributes, tags, categories, comments, and Q&A.
-    Also includes related products by tag and category.
+    Also includes the precomputed related and recommended products.
     """
 
     # Fetch full product with all related data
     product = get_object_or_404(
-        Product.objects.select_related("brand").prefetch_related(
+        Product.objects.select_related(
+            "brand", "rating", "related_products", "recommendations"
+        ).prefetch_related(
             "images",
             "attributes",
             "colors",
@@ -518,21 +438,16 @@ def product_details_view(request, slug):
             "categories__parent",
             Prefetch(
                 "comments",
-                queryset=Comment.objects.filter(is_approved=True)
-                .annotate(num_likes=Count("likes"), num_dislikes=Count("dislikes"))
-                .prefetch_related("likes", "dislikes"),
+                queryset=Comment.objects.filter(is_approved=True),
             ),
             Prefetch(
                 "questions",
                 queryset=Question.objects.filter(is_approved=True).prefetch_related(
                     Prefetch(
                         "answers",
-                        queryset=Answer.objects.filter(is_approved=True)
-                        .annotate(
-                            num_likes=Count("likes"), num_dislikes=Count("dislikes")
-                        )
-                        .select_related("user__customer")
-                        .prefetch_related("likes", "dislikes"),
+                        queryset=Answer.objects.filter(is_approved=True).select_related(
+                            "user__customer"
+                        ),
                     )
                 ),
             ),
@@ -541,13 +456,9 @@ def product_details_view(request, slug):
     )
 
     # Record visit history for authenticated users
-    if request.user.is_authenticated:
-        customer = getattr(request, "customer", None)
-        UserHistory.objects.update_or_create(
-            customer=customer,
-            product=product,
-            defaults={"datetime_visited": datetime.now()},
-        )
+    customer = getattr(request, "customer", None)
+    if request.user.is_authenticated and customer:
+        record_visit(customer.pk, product.pk)
 
     # Extract related objects for template rendering
     colors = list(product.colors.all())
@@ -560,77 +471,18 @@ def product_details_view(request, slug):
     answers_count = sum(len(q.answers.all()) for q in questions)
     questions_and_answers_count = questions_count + answers_count
 
-    # Calculate average scores
-    def avg(attr):
-        scores = [getattr(c, attr) for c in comments if getattr(c, attr) is not None]
-        return round(mean(scores), 1) if scores else 0.0
-
-    averages = {
-        "avg_quality": avg("build_quality"),
-        "avg_value": avg("value_for_price"),
-        "avg_innovation": avg("innovation"),
-        "avg_features": avg("features"),
-        "avg_ease_of_use": avg("ease_of_use"),
-        "avg_design": avg("design"),
-        "total_avg": (
-            round(
-                mean(
-                    [
-                        (
-                            c.build_quality
-                            + c.value_for_price
-                            + c.innovation
-                            + c.features
-                            + c.ease_of_use
-                            + c.design
-                        )
-                        / 6.0
-                        for c in comments
-                        if all(
-                            [
-                                c.build_quality,
-                                c.value_for_price,
-                                c.innovation,
-                                c.features,
-                                c.ease_of_use,
-                                c.design,
-                            ]
-                        )
-                    ]
-                ),
-                1,
-            )
-            if comments
-            else 0.0
-        ),
-    }
-
-    # Fetch related products by categories and tags
-    category_ids = product.categories.values_list("id", flat=True)
-    tag_ids = product.tags.values_list("id", flat=True)
-
-    related_by_categories = (
-        Product.objects.filter(is_active=True)
-        .exclude(id=product.id)
-        .prefetch_related("colors")
-        .filter(categories__id__in=category_ids)
-        .distinct()
-        .order_by("-datetime_created")
-    )
+    # Mark the votes of the visitor, one query for every comment and answer
+    answers = [answer for question in questions for answer in question.answers.all()]
+    votes = get_user_votes(request.user, comments, answers)
+    for comment in comments:
+        comment.user_vote = votes.get((Vote.COMMENT, comment.pk))
+    for answer in answers:
+        answer.user_vote = votes.get((Vote.ANSWER, answer.pk))
 
-    related_by_tags = list(
-        Product.objects.filter(is_active=True)
-        .exclude(id=product.id)
-        .filter(tags__id__in=tag_ids)
-        .distinct()
-        .order_by("-datetime_created")
-    )
+    averages = get_rating_averages(product)
 
-    if len(related_by_tags) < 4:
-        additional = related_by_categories.exclude(
-            id__in=[p.id for p in related_by_tags]
-        )[: 8 - len(related_by_tags)]
-        related_by_tags += list(additional)
+    related_products = get_related_products(product)
+    recommended_products = get_recommended_products(product)
 
     # Attach product context for global context processor
     request.product = product
@@ -647,92 +499,106 @@ def product_details_view(request, slug):
             "categories": categories,
             "questions": questions,
             "questions_and_answers_count": questions_and_answers_count,
-            "related_products": related_by_tags,
+            "related_products": related_products,
+            "also_viewed_products": recommended_products["also_viewed"],
+            "also_bought_products": recommended_products["also_bought"],
         },
     )
 
 
+@conditional_page()
 def tag_list_view(request, slug=None):
-    products_qs = (
-        Product.objects.filter(is_active=True)
-        .annotate(
-            approved_comment_count=Count(
-                "comments", filter=Q(comments__is_approved=True)
-            ),
-            avg_total_rating=Avg(
-                ExpressionWrapper(
-                    (
-                        F("comments__build_quality")
-                        + F("comments__value_for_price")
-                        + F("comments__innovation")
-                        + F("comments__features")
-                        + F("comments__ease_of_use")
-                        + F("comments__design")
-                    )
-                    / 6.0,
-                    output_field=FloatField(),
-                ),
-                filter=Q(comments__is_approved=True),
-            ),
-        )
-        .prefetch_related("colors")
-    )
-
-    tag = None
-
-    if slug:
-        tag = get_object_or_404(Tag, slug=slug)
-        queryset = products_qs.filter(tags__in=[tag])
-
-    products = queryset.order_by("-datetime_created")
-
-    paginator = Paginator(products, 2)
-    page = request.GET.get("page")
+    tag = get_object_or_404(Tag, slug=slug) if slug else None
 
-    try:
-        paginated_products = paginator.page(page)
-    except PageNotAnInteger:
-        paginated_products = paginator.page(1)
-    except EmptyPage:
-        paginated_products = paginator.page(paginator.num_pages)
+    products = paginate_keyset(
+        tag_listing_products(tag, request.GET), cursor=request.GET.get("cursor")
+    )
 
     return render(
         request,
         "store/tag-list.html",
         {
-            "products": paginated_products,
+            "products": products,
+            "load_more_url": get_load_more_url(request, "tag", slug=slug or ""),
             "tag": tag,
         },
     )
 
 
+@conditional_page()
 def top_products_view(request):
-    products = (
-        Product.objects.filter(is_active=True, top_product=True)
-        .annotate(
-            approved_comment_count=Count(
-                "comments", filter=Q(comments__is_approved=True)
-            ),
-            avg_total_rating=Avg(
-                ExpressionWrapper(
-                    (
-                        F("comments__build_quality")
-                        + F("comments__value_for_price")
-                        + F("comments__innovation")
-                        + F("comments__features")
-                        + F("comments__ease_of_use")
-                        + F("comments__design")
-                    )
-                    / 6.0,
-                    output_field=FloatField(),
-                ),
-                filter=Q(comments__is_approved=True),
-            ),
-        )
-        .prefetch_related("colors")
+    products = paginate_keyset(
+        top_listing_products(request.GET), cursor=request.GET.get("cursor")
     )
 
-    return render(request, "store/top_products.html", {"products": products})
+    return render(
+        request,
+        "store/top_products.html",
+        {
+            "products": products,
+            "load_more_url": get_load_more_url(request, "top"),
+        },
+    )
+
+
+PRODUCT_LISTING_CARDS = {
+    "category": "store/partials/product-card.html",
+    "brand": "store/partials/product-card.html",
+    "tag": "store/partials/product-card.html",
+    "top": "store/partials/product-card.html",
+    "search": "store/partials/search-result-card.html",
+}
+
+
+@require_GET
+@conditional_page()
+def load_more_products(request):
+    """
+    Return the next page of a product listing as rendered cards.
+
+    The listing and its filters come from the query string built by
+    ``get_load_more_url``; ``cursor`` is the ``next_cursor`` of the page
+    shown so far.
+    """
+    listing = request.GET.get("listing")
+    slug = request.GET.get("slug")
+
+    if listing == "category":
+        category = get_object_or_404(Category, slug=slug)
+        products = category_listing_products(category, request.GET)
+    elif listing == "brand":
+        brand = get_object_or_404(Brand, slug=slug)
+        products = brand_listing_products(brand, request.GET)
+    elif listing == "tag":
+        tag = get_object_or_404(Tag, slug=slug) if slug else None
+        products = tag_listing_products(tag, request.GET)
+    elif listing == "top":
+        products = top_listing_products(request.GET)
+    elif listing == "search":
+        products = search_products(request.GET.get("q", "").strip())
+    else:
+        return JsonResponse(
+            {"success": False, "message": "نوع فهرست نامعتبر است."}, status=400
+        )
+
+    page = paginate_keyset(products, cursor=request.GET.get("cursor"))
+    context = global_context(request)
+    html = "".join(
+        render_product_cards(
+            page,
+            cart_ids=context["product_ids_in_cart"](),
+            favorite_ids=context["product_ids_in_favorite"](),
+            template=PRODUCT_LISTING_CARDS[listing],
+        )
+    )
+    return JsonResponse(
+        {
+            "success": True,
+            "html": html,
+            "next_cursor": page.next_cursor,
+            "has_next": page.has_next,
+        }
+    )
 
 
 @login_required
@@ -780,24 +646,18 @@ def add_comment(request, slug):
 def like_dislike_comment(request, comment_id, action):
     comment = get_object_or_404(Comment, id=comment_id)
 
-    has_liked = comment.likes.filter(id=request.user.id).exists()
-    has_disliked = comment.dislikes.filter(id=request.user.id).exists()
-
-    if action == "like" and not has_liked and not has_disliked:
-        comment.likes.add(request.user)
-    elif action == "dislike" and not has_liked and not has_disliked:
-        comment.dislikes.add(request.user)
-    else:
+    if action not in (Vote.LIKE, Vote.DISLIKE) or not cast_vote(
+        request.user, comment, action
+    ):
         return JsonResponse(
             {"success": False, "error": _("You have already submitted your review.")}
         )
 
-    comment.save()
     return JsonResponse(
         {
             "success": True,
-            "likes": comment.likes.count(),
-            "dislikes": comment.dislikes.count(),
+            "likes": comment.num_likes,
+            "dislikes": comment.num_dislikes,
         }
     )
 
@@ -840,24 +700,18 @@ def add_answer(request, slug, question_id):
 def like_dislike_answer(request, answer_id, action):
     answer = get_object_or_404(Answer, id=answer_id)
 
-    has_liked = answer.likes.filter(id=request.user.id).exists()
-    has_disliked = answer.dislikes.filter(id=request.user.id).exists()
-
-    if action == "like" and not has_liked and not has_disliked:
-        answer.likes.add(request.user)
-    elif action == "dislike" and not has_liked and not has_disliked:
-        answer.dislikes.add(request.user)
-    else:
+    if action not in (Vote.LIKE, Vote.DISLIKE) or not cast_vote(
+        request.user, answer, action
+    ):
         return JsonResponse(
             {"success": False, "error": _("You have already submitted your review.")}
         )
 
-    answer.save()
     return JsonResponse(
         {
             "success": True,
-            "likes": answer.likes.count(),
-            "dislikes": answer.dislikes.count(),
+            "likes": answer.num_likes,
+            "dislikes": answer.num_dislikes,
         }
     )
 
@@ -865,10 +719,12 @@ def like_dislike_answer(request, answer_id, action):
 def cart_view(request):
     """
     Display the shopping cart view.
-    Loads wishlist data for authenticated users.
+    Loads wishlist data for authenticated users and renews the stock
+    reservations of the cart lines, re-reserving expired ones.
     """
     wishlist = None
     wishlist_count = 0
+    customer = None
     if request.user.is_authenticated:
         try:
             customer = getattr(request, "customer", None)
@@ -880,6 +736,20 @@ def cart_view(request):
             )
             wishlist_count = wishlist.count()
 
+    if customer:
+        quantities = dict(
+            CartItem.objects.filter(cart__customer=customer).values_list(
+                "product_id", "quantity"
+            )
+        )
+    else:
+        quantities = {
+            int(product_id): item["quantity"]
+            for product_id, item in SessionCart(request).cart.items()
+        }
+    if quantities:
+        renew_reservations(get_stock_holder(request), quantities)
+
     return render(
         request,
         "store/cart.html",
@@ -890,6 +760,18 @@ def cart_view(request):
     )
 
 
+def insufficient_stock_response(error):
+    return JsonResponse(
+        {
+            "success": False,
+            "message": _(
+                f"Insufficient stock. A maximum of {error.available} items is available."
+            ),
+        },
+        status=400,
+    )
+
+
 @require_POST
 def add_to_cart(request):
     """
@@ -901,67 +783,63 @@ def add_to_cart(request):
     product = get_object_or_404(Product, id=product_id)
 
     if request.user.is_authenticated:
-        print("🔍 ADD TO CART DEBUG")
-        print("User:", request.user)
-
         customer = getattr(request, "customer", None)
-
-        try:
-            customer = request.user.customer
-        except Customer.DoesNotExist:
+        if customer is None:
             return JsonResponse(
                 {"success": False, "message": "حساب کاربری شما معتبر نیست."}
             )
 
-        print("Customer:", customer)
-
         cart, created = Cart.objects.get_or_create(customer=customer)
-        print("Cart ID:", cart.id)
-        print("Product ID:", product.id)
-        cart_item = CartItem.objects.filter(cart=cart, product=product).first()
-        wishlist = Wishlist.objects.filter(product=product, customer=customer)
-
-        existing_items = cart.items.all()
-        print(
-            "Existing product IDs in cart:",
-            [item.product.id for item in existing_items],
-        )
+        try:
+            with transaction.atomic():
+                cart_item, created = CartItem.objects.get_or_create(
+                    cart=cart, product=product, defaults={"quantity": 1}
+                )
+                if created:
+                    reserve_stock(product.id, get_stock_holder(request), 1)
+        except InsufficientStock:
+            return JsonResponse(
+                {"success": False, "message": "موجودی محصول کافی نیست."}
+            )
 
-        if cart_item:
+        if not created:
             return JsonResponse(
                 {"success": False, "message": _("Product Already in Cart")},
                 status=200,
             )
 
-        cart_item = CartItem.objects.create(product=product, cart=cart, quantity=1)
-        if wishlist:
-            wishlist.delete()
+        Wishlist.objects.filter(product=product, customer=customer).delete()
 
+        summary = cart.summary()
         return JsonResponse(
             {
                 "success": True,
                 "message": _("Product Added Successfully."),
                 "quantity": cart_item.quantity,
-                "num_of_items": cart.num_of_items,
-                "total_price": cart.total_price,
+                "num_of_items": summary.num_of_items,
+                "total_price": summary.total_price,
             },
             status=200,
         )
 
     else:
         cart = SessionCart(request)
-        if product.stock <= 0:
+        quantity = cart.cart.get(str(product_id), {}).get("quantity", 0) + 1
+        try:
+            reserve_stock(product_id, get_stock_holder(request), quantity)
+        except InsufficientStock:
             return JsonResponse(
                 {"success": False, "message": "موجودی محصول کافی نیست."}
             )
         cart.add(product_id=product_id, quantity=1)
+        summary = cart.summary()
         return JsonResponse(
             {
                 "success": True,
                 "message": "محصول به سبد خرید مهمان اضافه شد.",
                 "quantity": 1,
-                "num_of_items": len(cart),
-                "total_price": cart.get_total_price(),
+                "num_of_items": summary.num_of_items,
+                "total_price": summary.total_price,
             }
         )
 
@@ -971,46 +849,47 @@ def update_cart_item(request):
     product_id = int(request.POST.get("product_id"))
     quantity = int(request.POST.get("quantity"))
     product = get_object_or_404(Product, id=product_id)
-
-    if quantity > product.stock:
-        return JsonResponse(
-            {
-                "success": False,
-                "message": _(
-                    f"Insufficient stock. A maximum of {product.stock} items is available."
-                ),
-            },
-            status=400,
-        )
+    holder = get_stock_holder(request)
 
     if request.user.is_authenticated:
         customer = getattr(request, "customer", None)
         cart = get_object_or_404(Cart, customer=customer)
         cart_item = get_object_or_404(CartItem, cart=cart, product=product)
+        try:
+            reserve_stock(product.id, holder, quantity)
+        except InsufficientStock as error:
+            return insufficient_stock_response(error)
         cart_item.quantity = quantity
         cart_item.save()
 
+        summary = cart.summary()
         return JsonResponse(
             {
                 "success": True,
                 "quantity": cart_item.quantity,
                 "message": _("The product quantity has been updated."),
-                "num_of_items": cart.num_of_items,
-                "total_price": cart.total_price,
+                "num_of_items": summary.num_of_items,
+                "total_price": summary.total_price,
             },
             status=200,
         )
     else:
         cart = SessionCart(request)
+        if str(product_id) in cart.cart:
+            try:
+                reserve_stock(product.id, holder, quantity)
+            except InsufficientStock as error:
+                return insufficient_stock_response(error)
         cart.update(product_id=product_id, quantity=quantity)
 
+        summary = cart.summary()
         return JsonResponse(
             {
                 "success": True,
                 "message": "تعداد محصول به‌روزرسانی شد.",
                 "quantity": quantity,
-                "num_of_items": len(cart),
-                "total_price": cart.get_total_price(),
+                "num_of_items": summary.num_of_items,
+                "total_price": summary.total_price,
             }
         )
 
@@ -1025,26 +904,31 @@ def delete_cart_item(request):
         cart_item = get_object_or_404(CartItem, cart=cart, product_id=product_id)
 
         cart_item.delete()
+        release_stock(cart_item.product_id, get_stock_holder(request))
 
+        summary = cart.summary()
         return JsonResponse(
             {
                 "success": True,
                 "message": _("The product has been removed from the cart."),
-                "num_of_items": cart.num_of_items,
-                "total_price": cart.total_price,
+                "num_of_items": summary.num_of_items,
+                "total_price": summary.total_price,
             },
             status=200,
         )
     else:
         cart = SessionCart(request)
-        cart.remove(product_id)
+        if str(product_id) in cart.cart:
+            cart.remove(product_id)
+            release_stock(product_id, get_stock_holder(request))
 
+        summary = cart.summary()
         return JsonResponse(
             {
                 "success": True,
                 "message": "محصول از سبد خرید مهمان حذف شد.",
-                "num_of_items": len(cart),
-                "total_price": cart.get_total_price(),
+                "num_of_items": summary.num_of_items,
+                "total_price": summary.total_price,
             }
         )
 
@@ -1138,4 +1022,49 @@ def payment(request):
 
 @login_required
 def checkout(request):
-    return render(request, "store/order/checkout.html")
+    """
+    Show the checkout page and place the order on POST.
+
+    The form posts the id of the cart being checked out, so a repeated
+    submit returns the order placed by the first one instead of a second
+    order or an empty cart error.
+    """
+    customer = getattr(request, "customer", None)
+    if request.method != "POST" or customer is None:
+        return render(
+            request,
+            "store/order/checkout.html",
+            {
+                "cart_key": Cart.objects.filter(customer=customer)
+                .values_list("pk", flat=True)
+                .first(),
+                "addresses": Address.objects.filter(customer=customer),
+            },
+        )
+
+    address_id = request.POST.get("address", "")
+    address = (
+        Address.objects.filter(customer=customer, pk=address_id).first()
+        if address_id.isdigit()
+        else None
+    )
+
+    try:
+        order = place_order(
+            customer,
+            uuid.UUID(request.POST.get("cart_key", "")),
+            address=address,
+            payment_method=request.POST.get("payment_method", "")[:50],
+        )
+    except (ValueError, EmptyCart):
+        message = "سبد خرید شما خالی است."
+    except InsufficientStock as error:
+        message = (
+            f"موجودی یکی از کالاها کافی نیست. حداکثر {error.available} عدد موجود است."
+        )
+    else:
+        return render(request, "store/order/checkout-successful.html", {"order": order})
+
+    return render(
+        request, "store/order/checkout-unsuccessful.html", {"message": message}
+    )
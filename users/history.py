@@ -0,0 +1,142 @@
+"""
+Write-behind tracking of product visits.
+
+Visits are recorded in a Redis hash keyed by ``customer_id:product_id``
+with the visit time as value, so repeated visits collapse into the latest
+one without touching the database. A periodic task moves the hash aside
+and upserts it into ``UserHistory`` in batches.
+"""
+
+import logging
+from datetime import datetime
+
+from django.utils import timezone
+from redis.exceptions import RedisError
+
+from store.models import Customer, Product
+from store.utils import get_redis_client
+
+from .models import UserHistory
+
+logger = logging.getLogger(__name__)
+
+USER_HISTORY_BUFFER_KEY = "user_history:buffer"
+USER_HISTORY_FLUSHING_KEY = "user_history:flushing"
+USER_HISTORY_BATCH_SIZE = 1000
+
+
+def _field(customer_id, product_id):
+    return f"{customer_id}:{product_id}"
+
+
+def write_visits(visits):
+    """
+    Upsert visits into ``UserHistory``, keeping the latest visit time.
+
+    Visits of customers or products deleted since they were buffered are
+    skipped.
+
+    Args:
+        visits (dict): ``{(customer_id, product_id): datetime}``.
+
+    Returns:
+        int: Number of upserted rows.
+    """
+
+    customer_ids = set(
+        Customer.objects.filter(
+            pk__in={customer_id for customer_id, _ in visits}
+        ).values_list("pk", flat=True)
+    )
+    product_ids = set(
+        Product.objects.filter(
+            pk__in={product_id for _, product_id in visits}
+        ).values_list("pk", flat=True)
+    )
+    visits = {
+        (customer_id, product_id): visited_at
+        for (customer_id, product_id), visited_at in visits.items()
+        if customer_id in customer_ids and product_id in product_ids
+    }
+    UserHistory.objects.bulk_create(
+        [
+            UserHistory(
+                customer_id=customer_id,
+                product_id=product_id,
+                datetime_visited=visited_at,
+            )
+            for (customer_id, product_id), visited_at in visits.items()
+        ],
+        batch_size=USER_HISTORY_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=["customer", "product"],
+        update_fields=["datetime_visited", "datetime_recorded"],
+    )
+    return len(visits)
+
+
+def record_visit(customer_id, product_id):
+    """
+    Buffer a product visit of a customer.
+    """
+
+    visited_at = timezone.now()
+    try:
+        get_redis_client().hset(
+            USER_HISTORY_BUFFER_KEY,
+            _field(customer_id, product_id),
+            visited_at.isoformat(),
+        )
+    except RedisError:
+        logger.warning("User history buffer unavailable, writing synchronously.")
+        write_visits({(customer_id, product_id): visited_at})
+
+
+def forget_visit(customer_id, product_id):
+    """
+    Drop a buffered visit, so a history entry deleted by its customer is
+    not written back by the next flush.
+    """
+
+    field = _field(customer_id, product_id)
+    try:
+        pipeline = get_redis_client().pipeline(transaction=False)
+        pipeline.hdel(USER_HISTORY_BUFFER_KEY, field)
+        pipeline.hdel(USER_HISTORY_FLUSHING_KEY, field)
+        pipeline.execute()
+    except RedisError:
+        logger.warning("User history buffer unavailable.")
+
+
+def flush_visits(batch_size=USER_HISTORY_BATCH_SIZE):
+    """
+    Move buffered visits into ``UserHistory``.
+
+    The buffer is renamed before it is read, so visits recorded meanwhile
+    go to a fresh buffer. A flush that failed halfway leaves the renamed
+    hash behind and the next flush finishes it first.
+
+    Returns:
+        int: Number of upserted rows.
+    """
+
+    client = get_redis_client()
+    if not client.exists(USER_HISTORY_FLUSHING_KEY):
+        if not client.exists(USER_HISTORY_BUFFER_KEY):
+            return 0
+        client.rename(USER_HISTORY_BUFFER_KEY, USER_HISTORY_FLUSHING_KEY)
+
+    written = 0
+    visits = {}
+    for field, visited_at in client.hscan_iter(
+        USER_HISTORY_FLUSHING_KEY, count=batch_size
+    ):
+        customer_id, product_id = map(int, field.split(b":"))
+        visits[customer_id, product_id] = datetime.fromisoformat(visited_at.decode())
+        if len(visits) >= batch_size:
+            written += write_visits(visits)
+            visits = {}
+    if visits:
+        written += write_visits(visits)
+    client.delete(USER_HISTORY_FLUSHING_KEY)
+    return written
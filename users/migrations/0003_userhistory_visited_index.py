@@ -0,0 +1,19 @@
+# Generated by Django 5.2.1 on 2026-10-19 00:21
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_userhistory'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='userhistory',
+            name='datetime_visited',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Visited At'),
+        ),
+    ]
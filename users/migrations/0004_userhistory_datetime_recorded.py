@@ -0,0 +1,27 @@
+# Generated by Django 5.2.1 on 2026-10-19 02:10
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copy_visit_times(apps, schema_editor):
+    UserHistory = apps.get_model('users', 'UserHistory')
+    UserHistory.objects.update(datetime_recorded=F('datetime_visited'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_userhistory_visited_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userhistory',
+            name='datetime_recorded',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now, verbose_name='Recorded At'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_visit_times, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from store.models import Customer, Product
@@ -55,7 +56,12 @@ class UserHistory(models.Model):
     )
 
     datetime_visited = models.DateTimeField(
-        auto_now_add=True, verbose_name=_("Visited At")
+        default=timezone.now, db_index=True, verbose_name=_("Visited At")
+    )
+    # Buffered visits are written long after they happen, so consumers of
+    # new rows follow this instead of the visit time.
+    datetime_recorded = models.DateTimeField(
+        auto_now=True, db_index=True, verbose_name=_("Recorded At")
     )
 
     class Meta:
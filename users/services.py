@@ -24,20 +24,26 @@ def get_client_ip(request):
 
 
 def can_request_otp(mobile: str, ip: str):
-    if cache.get(f"otp_blocked:{mobile}"):
+    blocked_key = f"otp_blocked:{mobile}"
+    limit_key = f"otp_limit:{mobile}"
+    mobile_key = f"otp_daily_count:{mobile}"
+    ip_key = f"otp_ip_daily:{ip}"
+    values = cache.get_many([blocked_key, limit_key, mobile_key, ip_key])
+
+    if values.get(blocked_key):
         return False, _(
             "Your account has been temporarily blocked. Please try again later."
         )
 
-    if cache.get(f"otp_limit:{mobile}"):
+    if values.get(limit_key):
         return False, _("Please wait a moment and then try again.")
 
-    daily_count = cache.get(f"otp_daily_count:{mobile}") or 0
+    daily_count = values.get(mobile_key) or 0
     if daily_count >= OTP_DAILY_LIMIT:
-        cache.set(f"otp_blocked:{mobile}", "1", timeout=OTP_BLOCK_DURATION)
+        cache.set(blocked_key, "1", timeout=OTP_BLOCK_DURATION)
         return False, _("Too many requests. Your account has been temporarily blocked.")
 
-    ip_count = cache.get(f"otp_ip_daily:{ip}") or 0
+    ip_count = values.get(ip_key) or 0
     if ip_count >= OTP_IP_DAILY_LIMIT:
         return False, _(
             "The number of requests from this IP has exceeded the allowed limit."
@@ -46,22 +52,29 @@ def can_request_otp(mobile: str, ip: str):
     return True, None
 
 
-def mark_otp_requested(mobile: str, ip: str):
-    cache.set(f"otp_limit:{mobile}", "1", timeout=OTP_LIMIT_SECONDS)
+def increment_daily_counter(key):
+    """
+    Atomically count a request in a counter that expires a day after the
+    first one.
 
-    mobile_key = f"otp_daily_count:{mobile}"
-    mobile_count = cache.get(mobile_key) or 0
-    if mobile_count == 0:
-        cache.set(mobile_key, 1, timeout=86400)  # expire in 1 day
-    else:
-        cache.incr(mobile_key)
+    ``add`` only creates the counter if it is missing and ``incr`` is a
+    single Redis ``INCR``, so concurrent requests never overwrite each
+    other's counts or reset the expiry.
+    """
 
-    ip_key = f"otp_ip_daily:{ip}"
-    ip_count = cache.get(ip_key) or 0
-    if ip_count == 0:
-        cache.set(ip_key, 1, timeout=86400)
-    else:
-        cache.incr(ip_key)
+    cache.add(key, 0, timeout=86400)  # expire in 1 day
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # The counter expired between the two calls.
+        cache.add(key, 1, timeout=86400)
+        return 1
+
+
+def mark_otp_requested(mobile: str, ip: str):
+    cache.set(f"otp_limit:{mobile}", "1", timeout=OTP_LIMIT_SECONDS)
+    increment_daily_counter(f"otp_daily_count:{mobile}")
+    increment_daily_counter(f"otp_ip_daily:{ip}")
 
 
 def get_random_otp():
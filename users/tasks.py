@@ -1,11 +1,11 @@
 import logging
 import random
-from datetime import timedelta
 
 from celery import shared_task
 from django.utils import timezone
 
-from .models import User, UserHistory
+from .history import flush_visits
+from .models import User
 
 logger = logging.getLogger(__name__)
 
@@ -23,13 +23,12 @@ def assign_otp_task(user_id):
 
 
 @shared_task
-def delete_old_user_history():
+def flush_user_history():
     """
-    Delete UserHistory records older than 30 days.
+    Write buffered product visits to UserHistory.
     """
-    thirty_days_ago = timezone.now() - timedelta(days=30)
-    deleted_count, _ = UserHistory.objects.filter(
-        datetime_visited__lt=thirty_days_ago
-    ).delete()
-    logger.info(f"Deleted {deleted_count} old UserHistory records on {timezone.now()}")
-    return f"Deleted {deleted_count} old UserHistory records."
+    written = flush_visits()
+    if written:
+        logger.info(f"Wrote {written} buffered product visits.")
+    return written
+
@@ -21,6 +21,7 @@ from .forms import (
     OTPForm,
     RegisterForm,
 )
+from .history import forget_visit
 from .models import User, UserHistory
 from .services import (
     assign_otp,
@@ -518,6 +519,7 @@ def delete_history_view(request):
             {"success": False, "error": "شناسه محصول نامعتبر است."}, status=400
         )
 
+    forget_visit(customer.pk, product_id)
     try:
         history_item = UserHistory.objects.get(customer=customer, product_id=product_id)
         history_item.delete()